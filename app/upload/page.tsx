@@ -1,7 +1,7 @@
 "use client";
 
 import React, { useState } from "react";
-import { useSession } from "next-auth/react";
+import { signOut, useSession } from "next-auth/react";
 import { redirect } from "next/navigation";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { DragDropUpload } from "@/components/upload/drag-drop-upload";
@@ -43,6 +43,11 @@ export default function UploadPage() {
 
     const handleProcess = async () => {
         if (!file || !session?.user?.email) return;
+        if (!session.accessToken || session.error === "AccessTokenExpired") {
+            // The backend token cannot be refreshed without the password
+            signOut({ callbackUrl: "/login" });
+            return;
+        }
 
         setIsProcessing(true);
         setProgress(10);
@@ -50,7 +55,6 @@ export default function UploadPage() {
         try {
             const formData = new FormData();
             formData.append("file", file);
-            formData.append("user_email", session.user.email);
             // In a real app, we'd send protection flags too
 
             // Simulate progress steps
@@ -66,11 +70,17 @@ export default function UploadPage() {
 
             const response = await fetch("http://localhost:8000/protect/image", {
                 method: "POST",
+                headers: { Authorization: `Bearer ${session.accessToken}` },
                 body: formData,
             });
 
             clearInterval(interval);
 
+            if (response.status === 401) {
+                signOut({ callbackUrl: "/login" });
+                return;
+            }
+
             if (!response.ok) {
                 const error = await response.json();
                 throw new Error(error.detail || "Failed to protect image");
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Any, Dict
+from app.api.auth import get_current_user
+from app.api import protect
+from app.services.admission import admission, protection_scheduler, large_protection_scheduler
+from app.services.job_queue import JOB_QUEUED, JOB_RUNNING
+import asyncio
+import os
+
+router = APIRouter()
+
+# Users allowed on /admin, by email
+ADMIN_EMAILS = frozenset(
+    email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+)
+
+def get_admin_user(user = Depends(get_current_user)):
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@router.get("/admission")
+async def admission_state(admin = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Plan limits, each recently active user's remaining request and megapixel
+    tokens, who is running and waiting in each protection pool, and the async
+    jobs queued and running per user.
+    """
+    return {
+        "plans": {name: limits._asdict() for name, limits in admission.plans.items()},
+        "users": admission.snapshot(),
+        "pools": {
+            "standard": protection_scheduler.snapshot(),
+            "large": large_protection_scheduler.snapshot()
+        },
+        "jobs": {
+            "queued": await asyncio.to_thread(protect.job_queue.count_by_owner, JOB_QUEUED),
+            "running": await asyncio.to_thread(protect.job_queue.count_by_owner, JOB_RUNNING)
+        }
+    }
@@ -1,18 +1,28 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 from prisma import Prisma
-from passlib.context import CryptContext
-from jose import jwt
+from app.db import get_db
+from app.services.passwords import password_hasher, PasswordQueueFull
+from app.services.user_cache import user_cache
+from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from typing import Optional
+import os
 
 router = APIRouter()
-prisma = Prisma()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-SECRET_KEY = "your-secret-key-generate-with-openssl-rand-base64-32"
+# Bearer tokens are the only credential the API checks, so there is no
+# built-in default: anyone knowing it could sign in as any user
+SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+if not SECRET_KEY:
+    raise RuntimeError("JWT_SECRET_KEY must be set, e.g. to the output of `openssl rand -base64 32`")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# The web app signs users out when their token expires
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# auto_error is off so a missing header gets the same 401 as a bad token
+bearer_scheme = HTTPBearer(auto_error=False)
 
 class UserRegister(BaseModel):
     email: str
@@ -26,6 +36,8 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    # Seconds until the token expires
+    expires_in: int
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -37,50 +49,104 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+def decode_access_token(token: str) -> str:
+    """
+    Validates a token made by create_access_token.
+    Args:
+        token (str): The encoded JWT.
+    Returns:
+        str: Its ``sub`` claim, the user's email.
+    Raises:
+        HTTPException: 401 if the signature, expiry or subject is invalid.
+    """
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _unauthorized("Invalid or expired token")
+    subject = claims.get("sub")
+    if not isinstance(subject, str) or not subject:
+        raise _unauthorized("Token has no subject")
+    return subject
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: Prisma = Depends(get_db)
+):
+    """
+    Dependency resolving the bearer token of a request to its user. Users
+    come from user_cache, so most requests need no database query; routes
+    that change a user must call user_cache.invalidate(user.email).
+    """
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    subject = decode_access_token(credentials.credentials)
+    user = await user_cache.get(subject, lambda email: db.user.find_unique(where={"email": email}))
+    if not user:
+        raise _unauthorized("User not found")
+    return user
+
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: Prisma = Depends(get_db)
+):
+    """Like get_current_user, but None for requests without a token."""
+    if credentials is None:
+        return None
+    return await get_current_user(credentials, db)
+
 @router.post("/register", response_model=Token)
-async def register(user: UserRegister):
-    await prisma.connect()
+async def register(user: UserRegister, db: Prisma = Depends(get_db)):
+    # Check if user exists
+    existing_user = await db.user.find_unique(where={"email": user.email})
+    if existing_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    # Hash password, off the event loop
     try:
-        # Check if user exists
-        existing_user = await prisma.user.find_unique(where={"email": user.email})
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-        # Hash password
-        hashed_password = pwd_context.hash(user.password)
-
-        # Create user
-        new_user = await prisma.user.create(
-            data={
-                "email": user.email,
-                "password": hashed_password,
-                "name": user.name
-            }
-        )
-
-        # Generate token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": new_user.email}, expires_delta=access_token_expires
-        )
-        return {"access_token": access_token, "token_type": "bearer"}
-    finally:
-        await prisma.disconnect()
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    # Create user
+    new_user = await db.user.create(
+        data={
+            "email": user.email,
+            "password": hashed_password,
+            "name": user.name
+        }
+    )
+
+    # Generate token
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": new_user.email}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60}
 
 @router.post("/login", response_model=Token)
-async def login(user: UserLogin):
-    await prisma.connect()
+async def login(user: UserLogin, db: Prisma = Depends(get_db)):
+    # Find user
+    db_user = await db.user.find_unique(where={"email": user.email})
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
     try:
-        # Find user
-        db_user = await prisma.user.find_unique(where={"email": user.email})
-        if not db_user or not pwd_context.verify(user.password, db_user.password):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-
-        # Generate token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": db_user.email}, expires_delta=access_token_expires
-        )
-        return {"access_token": access_token, "token_type": "bearer"}
-    finally:
-        await prisma.disconnect()
+        valid, new_hash = await password_hasher.verify(user.password, db_user.password)
+    except PasswordQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    # Hashed with an outdated cost factor: store the rehash made while verifying
+    if new_hash:
+        await db.user.update(where={"id": db_user.id}, data={"password": new_hash})
+        user_cache.invalidate(db_user.email)
+
+    # Generate token
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": db_user.email}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60}
@@ -0,0 +1,198 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from typing import Optional, Tuple
+from app.services.blob_store import BlobStore, protected_store
+from app.services.variants import variant_cache, variant_format, variant_name, generate_variant, MAX_VARIANT_DIM, VARIANT_FORMATS
+import aiofiles
+import asyncio
+import mimetypes
+import os
+import re
+
+router = APIRouter()
+
+# Blob URLs embed the file's SHA-256, so their bytes can never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Files stored under random names before the blob store; they get a
+# revalidating cache policy instead
+LEGACY_CACHE_CONTROL = "public, max-age=3600"
+# Unprotected originals must never land in a CDN or shared cache
+PRIVATE_CACHE_CONTROL = "private, no-store"
+
+_BLOB_PATH = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.[A-Za-z0-9]{1,10})?$")
+_LEGACY_NAME = re.compile(r"^[A-Za-z0-9_-]+(\.[A-Za-z0-9]{1,10})?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range ``Range`` header.
+    Args:
+        header (Optional[str]): The header value.
+        size (int): Size of the file.
+    Returns:
+        Optional[Tuple[int, int]]: (offset, count), or None to send the whole
+        file (no header, or a form that is not a single byte range).
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        count = min(int(end), size)
+        if count == 0:
+            raise ValueError("Empty suffix range")
+        return size - count, count
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end - start + 1
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an ``If-None-Match`` header against an ETag."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+class FileRangeResponse(Response):
+    """
+    Streams ``count`` bytes of a file starting at ``offset``, read in
+    ``chunk_size`` chunks off the event loop, so memory stays flat whatever
+    the file's size.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, offset: int, count: int, status_code: int, headers: dict, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+        self.headers["content-length"] = str(count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+
+def serve_file(request: Request, path: str, etag: str, cache_control: str) -> Response:
+    """
+    Builds the response for a stored file, honouring ``If-None-Match``,
+    ``Range`` and ``If-Range``.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "content-type": mimetypes.guess_type(path)[0] or "application/octet-stream"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"etag": etag, "cache-control": cache_control})
+
+    send_body = request.method != "HEAD"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # The client's partial copy is of something else; send it all
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={"content-range": f"bytes */{stat.st_size}", **headers})
+    if byte_range is None:
+        return FileRangeResponse(path, 0, stat.st_size, 200, headers, send_body)
+
+    offset, count = byte_range
+    headers["content-range"] = f"bytes {offset}-{offset + count - 1}/{stat.st_size}"
+    return FileRangeResponse(path, offset, count, 206, headers, send_body)
+
+def serve_store_path(request: Request, store: BlobStore, blob_path: str) -> Response:
+    match = _BLOB_PATH.match(blob_path)
+    if match:
+        # Content-addressed: the digest in the URL is the strong ETag
+        path = os.path.join(store.root, *blob_path.split("/"))
+        return serve_file(request, path, f'"{match.group(3)}"', IMMUTABLE_CACHE_CONTROL)
+
+    if _LEGACY_NAME.match(blob_path):
+        path = os.path.join(store.root, blob_path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        return serve_file(request, path, f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"', LEGACY_CACHE_CONTROL)
+
+    raise HTTPException(status_code=404, detail="File not found")
+
+async def serve_variant(request: Request, blob_path: str, width: Optional[int], height: Optional[int], fmt: Optional[str]) -> Response:
+    """
+    Serves a resized and/or transcoded copy of a protected blob, generating
+    and caching it on first request. Variants are only ever derived from
+    protected outputs, never from original uploads.
+    """
+    match = _BLOB_PATH.match(blob_path)
+    if not match:
+        raise HTTPException(status_code=404, detail="File not found")
+    source = os.path.join(protected_store.root, *blob_path.split("/"))
+    if fmt is not None and fmt.lower() not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of: {', '.join(sorted(VARIANT_FORMATS))}")
+    pil_format = variant_format(fmt, source)
+    name = variant_name(match.group(3), width, height, pil_format)
+
+    # Variants are as immutable as their source; answer revalidations
+    # without generating anything. The name includes the format, so a WebP
+    # and a PNG of the same size never share a validator.
+    etag = f'"{name}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"etag": etag, "cache-control": IMMUTABLE_CACHE_CONTROL})
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    async def produce(temp_path: str) -> None:
+        # Decoding and resampling release the GIL; keep them off the event loop
+        await asyncio.to_thread(generate_variant, source, temp_path, width, height, pil_format)
+
+    try:
+        path = await variant_cache.get(name, produce)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Cannot create variant: {e}")
+    return serve_file(request, path, etag, IMMUTABLE_CACHE_CONTROL)
+
+@router.api_route("/static/protected/{blob_path:path}", methods=["GET", "HEAD"])
+async def get_protected(
+    blob_path: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_DIM),
+    h: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_DIM),
+    fmt: Optional[str] = None
+):
+    if w is not None or h is not None or fmt is not None:
+        return await serve_variant(request, blob_path, w, h, fmt)
+    return serve_store_path(request, protected_store, blob_path)
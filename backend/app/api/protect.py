@@ -1,111 +1,584 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from prisma import Prisma
-from app.services.crypto_engine import CryptoEngine
-from app.services.binary_engine import BinaryEngine
-from app.services.cloaking_engine import CloakingEngine
-import shutil
+from app.db import get_db, prisma
+from app.api.auth import get_current_user
+from app.api.users import original_url
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.services.key_store import key_store, SigningKeyMissing
+from app.services.protection_pipeline import protect_file, ImageTooLarge, PIPELINE_VERSION
+from app.services.executor import protection_executor, large_protection_executor, ExecutorSaturated, JobTimeout
+from app.services.image_probe import probe_image, plan_protection, ImageProbe, UnsupportedImage
+from app.services.admission import admission, protection_scheduler, large_protection_scheduler, Tenant, Throttled
+from app.services.parallel import PROTECTION_THREADS, LARGE_PROTECTION_THREADS
+from app.services.encoder import OutputSettings, DEFAULT_ENCODER_PROFILE, source_extension
+from app.services.job_queue import JobQueue, JobWorker, RequeueJob, JobClaimLost, InvalidCallbackURL, job_status, validate_callback_url
+from app.services.batch_ingest import save_batch_inputs, BatchTooLarge
+from app.services.verify_cache import verify_cache
+from app.services.ingest import ingest_upload, UploadTooLarge
+from app.services.hamming_index import phash_sync
+from app.services.perceptual_hash import from_hex
+from app.services.blob_store import upload_store, protected_store, result_index, store_call
+from app.services.tracing import trace_id
+from app.services.user_cache import user_cache
+from app.services.metrics import (
+    observe_stages, protect_stage_duration, protect_megapixels, protect_bytes, protect_bytes_total,
+    protect_encode_duration, protect_output_bytes
+)
+import asyncio
+import json
 import os
 import uuid
 
 router = APIRouter()
-prisma = Prisma()
 
-UPLOAD_DIR = "uploads"
-PROTECTED_DIR = "protected"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(PROTECTED_DIR, exist_ok=True)
+# Async job mode: uploads are queued here and drained by job_worker
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join("data", "jobs.sqlite3"))
+job_queue = JobQueue(JOB_QUEUE_PATH)
+
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "2000"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+# All images of one batch together, after archives are expanded
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+async def _register_signing_key(db: Prisma, user) -> None:
+    """
+    Makes sure the user has a signing key in the key store and that their
+    stored public key matches it, so signatures can be verified later.
+    """
+    # Loading or creating a key touches disk; keep it off the event loop
+    try:
+        public_key = await asyncio.to_thread(key_store.public_key_pem, user.id, user.publicKey)
+    except SigningKeyMissing as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if user.publicKey != public_key:
+        await db.user.update(
+            where={"id": user.id},
+            data={"publicKey": public_key}
+        )
+        user_cache.invalidate(user.email)
+
+def _content_data(user_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "userId": user_id,
+        "originalHash": result["original_hash"],
+        "protectedHash": result["protected_hash"],
+        "signatureData": result["signature"],
+        "perceptualHash": result["perceptual_hash"],
+        "aiAnalysis": {
+            "cloaking_level": result["level"],
+            "image": result.get("image"),
+            "encoding": result.get("encoding"),
+            # Reproduces the output; a string since it does not fit a JS number
+            "seed": str(result["seed"]) if result.get("seed") is not None else None,
+            "manipulation_score": result["manipulation_score"],
+            "protection_score": result["protection_score"],
+            "quality": result["quality"]
+        }
+    }
+
+def _index_content(content_id: str, perceptual_hash: Optional[str]) -> None:
+    # Makes the new content findable by /verify/image in this process right
+    # away; other processes pick it up at their next index refresh
+    if perceptual_hash:
+        phash_sync.add_local(content_id, from_hex(perceptual_hash))
+
+def _protection_response(content_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "content_id": content_id,
+        "original_hash": result["original_hash"],
+        "protected_hash": result["protected_hash"],
+        "signature": result["signature"],
+        "perceptual_hash": result["perceptual_hash"],
+        "original_url": original_url(content_id),
+        "protected_url": f"/static/protected/{result['protected_file']}",
+        "stats": {
+            "cryptographic_signing": True,
+            "binary_manipulation": True,
+            "ai_cloaking": True,
+            "manipulation_score": result["manipulation_score"],
+            "protection_score": result["protection_score"],
+            "quality": result["quality"],
+            "encoding": result.get("encoding")
+        }
+    }
+
+def _image_info(probe: ImageProbe) -> Dict[str, Any]:
+    return {"format": probe.format, "width": probe.width, "height": probe.height, "orientation": probe.orientation}
+
+def _observe_protection(timings: Dict[str, float], pixels: int, encoding: Dict[str, Any], original_path: str, protected_path: str) -> None:
+    observe_stages(timings)
+    protect_megapixels.observe(pixels / 1e6)
+    protect_encode_duration.observe(encoding["seconds"], profile=encoding["profile"], format=encoding["format"])
+    protect_output_bytes.observe(encoding["bytes"], profile=encoding["profile"], format=encoding["format"])
+    for kind, path in (("original", original_path), ("protected", protected_path)):
+        size = os.path.getsize(path)
+        protect_bytes.observe(size, kind=kind)
+        protect_bytes_total.inc(size, kind=kind)
+
+def result_version(output: OutputSettings, fast_metrics: bool = False) -> str:
+    """
+    Key of stored results made by this pipeline version with ``output``.
+    Results scored on the downsampled proxy are kept apart from exact ones,
+    since their quality figures differ.
+    """
+    return f"{PIPELINE_VERSION}/{output.key}" + ("/fast-metrics" if fast_metrics else "")
+
+def _too_many_requests(e: Throttled) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+def _admit(user) -> Tenant:
+    """Counts a request against the user's plan, raising 429 when over it."""
+    tenant = Tenant.of(user)
+    try:
+        admission.admit_request(tenant)
+    except Throttled as e:
+        raise _too_many_requests(e)
+    return tenant
+
+async def _probe(path: str) -> ImageProbe:
+    # Reads a few KB of header; cheap, but still disk I/O
+    with protect_stage_duration.time(stage="probe"):
+        return await asyncio.to_thread(probe_image, path)
+
+async def _protect_original(
+    original_path: str,
+    original_hash: str,
+    fast_metrics: bool = False,
+    probe: Optional[ImageProbe] = None,
+    output: OutputSettings = OutputSettings(),
+    tenant: Optional[Tenant] = None
+) -> Dict[str, Any]:
+    """
+    Protects a stored original, or reuses the stored result when this
+    original was already protected by the current pipeline version with the
+    same ``output`` settings (encoder profile, transcoding) and the same
+    kind of metrics (``fast_metrics``).
+    The cloaking level, strip size and pool follow from the image's
+    dimensions; ``probe`` is its header if the caller already read it.
+    The pool job waits for ``tenant``'s fair turn against other users' jobs.
+    Returns:
+        Dict[str, Any]: protect_file()'s result plus ``protected_file``, the
+        protected blob's store path, holding one reference on that blob.
+    Raises:
+        UnsupportedImage, ImageTooLarge: If the probe rejects the original.
+        Throttled: If the tenant already has a full queue.
+    """
+    if probe is None:
+        probe = await _probe(original_path)
+    plan = plan_protection(probe)
+    version = result_version(output, fast_metrics)
+    # Store calls are SQLite transactions shared with other processes; they
+    # run in threads through store_call
+    cached = await store_call(result_index.get, original_hash, version, plan.level)
+    if cached is not None and await store_call(
+        protected_store.acquire, cached["protected_hash"],
+        undo=lambda acquired: acquired and protected_store.release(cached["protected_hash"])
+    ):
+        # Results stored before they recorded these
+        cached.setdefault("level", plan.level)
+        cached.setdefault("image", _image_info(probe))
+        return cached
+
+    executor = large_protection_executor if plan.large else protection_executor
+    scheduler = large_protection_scheduler if plan.large else protection_scheduler
+    threads = LARGE_PROTECTION_THREADS if plan.large else PROTECTION_THREADS
+    # Binary manipulation, cloaking, hashing and scoring are all CPU-bound;
+    # they run in the process pool so this worker keeps serving other
+    # requests meanwhile. The output goes straight into the protected store.
+    extension = output.extension(source_extension(original_path, probe.format))
+    destination = protected_store.temp_path(extension)
+    try:
+        # Includes waiting for a worker and moving arguments and results
+        # between processes, on top of the stages the worker times itself
+        with protect_stage_duration.time(stage="pool"):
+            job = lambda: executor.run(
+                protect_file, original_path, destination, None, plan.level, original_hash, fast_metrics,
+                plan.tile_rows, threads, output.profile
+            )
+            if tenant is None:
+                result = await job()
+            else:
+                result = await scheduler.run(tenant, admission.limits(tenant.plan), probe.pixels / 1e6, job)
+        stored = await store_call(
+            protected_store.adopt, destination, result["protected_hash"], extension,
+            undo=lambda _: protected_store.release(result["protected_hash"])
+        )
+    finally:
+        if os.path.exists(destination):
+            os.remove(destination)
+    _observe_protection(result.pop("timings"), result.pop("pixels"), result["encoding"], original_path, stored)
+    result["protected_file"] = protected_store.relpath_of(stored)
+    result["image"] = _image_info(probe)
+    await store_call(result_index.put, original_hash, version, plan.level, result)
+    return result
+
+def _release(original_hash: str, protected_hash: Optional[str] = None) -> None:
+    upload_store.release(original_hash)
+    if protected_hash is not None:
+        protected_store.release(protected_hash)
+
+async def _no_progress(stage: str, value: float) -> None:
+    pass
+
+async def _run_protection(
+    db: Prisma,
+    user,
+    original_path: str,
+    original_hash: str,
+    on_progress: Optional[Callable[[str, float], Awaitable[Any]]] = None,
+    fast_metrics: bool = False,
+    probe: Optional[ImageProbe] = None,
+    output: OutputSettings = OutputSettings()
+) -> Dict[str, Any]:
+    """
+    Runs key management, the protection pipeline and the DB insert for an
+    upload already in the upload store. Shared by the synchronous handler and
+    the job worker; ``fast_metrics`` scores on a downsampled proxy,
+    ``probe`` is the upload's header if the caller already read it and
+    ``output`` picks the encoder profile and output format.
+
+    The new Content row keeps the upload's store reference and one on the
+    protected output. If anything fails both are released, except when the
+    pool is saturated or the user's queue is full: the caller then decides
+    whether to retry. ``on_progress`` raising JobClaimLost leaves the upload's
+    reference to the job's new owner.
+    Returns:
+        Dict[str, Any]: The protection result returned to clients.
+    """
+    progress = on_progress or _no_progress
+    result = None
+    try:
+        # 3. Load the user's signing key, creating it on first use
+        await progress("signing_key", 0.1)
+        with protect_stage_duration.time(stage="signing_key"):
+            await _register_signing_key(db, user)
+
+        # 4. Protection Pipeline
+        await progress("protecting", 0.2)
+        result = await _protect_original(original_path, original_hash, fast_metrics, probe, output, Tenant.of(user))
+        # Signing a digest with the cached key is cheap enough for the event loop
+        with protect_stage_duration.time(stage="sign"):
+            result["signature"] = key_store.sign_digest(user.id, result["original_hash"])
+
+        # 5. Save to DB
+        await progress("saving", 0.9)
+        with protect_stage_duration.time(stage="db_insert"):
+            content = await db.content.create(data=_content_data(user.id, result))
+    except (ExecutorSaturated, Throttled):
+        raise
+    except JobClaimLost:
+        if result is not None:
+            await store_call(protected_store.release, result["protected_hash"])
+        raise
+    except BaseException:
+        await store_call(_release, original_hash, result["protected_hash"] if result is not None else None)
+        raise
+    verify_cache.invalidate(result["original_hash"], result["protected_hash"])
+    _index_content(content.id, result["perceptual_hash"])
+
+    return _protection_response(content.id, result)
+
+async def _run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    payload = job["payload"]
+    # Log lines of the job carry the trace id of the request that queued it
+    token = trace_id.set(payload.get("trace_id") or job["id"])
+    try:
+        return await _process_job(job, payload)
+    finally:
+        trace_id.reset(token)
+
+async def _process_job(job: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    user = await prisma.user.find_unique(where={"id": payload["user_id"]})
+    if not user:
+        await store_call(upload_store.release, payload["original_hash"])
+        raise HTTPException(status_code=404, detail="User not found")
+
+    async def on_progress(stage: str, value: float) -> None:
+        # Checked before each stage, and so before the Content row is written:
+        # a job recovered by another process is not finished twice
+        if not await asyncio.to_thread(job_queue.update_progress, job["id"], stage, value, job["claim"]):
+            raise JobClaimLost()
+
+    try:
+        return await _run_protection(
+            prisma,
+            user,
+            payload["original_path"],
+            payload["original_hash"],
+            on_progress=on_progress,
+            fast_metrics=payload.get("fast_metrics", False),
+            # Validated when the job was queued
+            output=OutputSettings(payload.get("profile", DEFAULT_ENCODER_PROFILE), payload.get("output_format"))
+        )
+    except (ExecutorSaturated, Throttled):
+        # Synchronous requests filled the pool, or the user's own; try again
+        # once it drains
+        raise RequeueJob()
+
+# Running jobs are heartbeated every JOB_STALE_AFTER / 3 seconds, however
+# long they wait for or in the pool, so only jobs of dead processes go stale
+job_worker = JobWorker(
+    job_queue,
+    _run_job,
+    concurrency=protection_executor.max_workers + large_protection_executor.max_workers,
+    stale_after=float(os.getenv("JOB_STALE_AFTER", "300"))
+)
+
+def start_job_worker():
+    job_worker.start()
+
+async def stop_job_worker():
+    await job_worker.stop()
 
 @router.post("/image")
 async def protect_image(
     file: UploadFile = File(...),
-    user_email: str = Form(...) # In real app, get from JWT
+    mode: str = Form("sync"),
+    callback_url: Optional[str] = Form(None),
+    fast_metrics: bool = Form(False),
+    profile: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    user = Depends(get_current_user),
+    db: Prisma = Depends(get_db)
 ):
-    await prisma.connect()
+    if mode not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'async'")
+    if callback_url:
+        try:
+            # Resolves the host; keep DNS off the event loop
+            await asyncio.to_thread(validate_callback_url, callback_url)
+        except InvalidCallbackURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        # 1. Save original file
+        output = OutputSettings.parse(profile, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tenant = _admit(user)
+
+    original_hash = None
+    try:
+        # 1. The user comes from the bearer token (get_current_user)
+
+        # 2. Save original file, hashing it on the way to disk, then move it
+        # into the content-addressed upload store; re-uploads share one copy
         file_ext = os.path.splitext(file.filename)[1]
-        file_id = str(uuid.uuid4())
-        original_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_ext}")
-        
-        with open(original_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 2. Get User
-        user = await prisma.user.find_unique(where={"email": user_email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # 3. Generate Key Pair if not exists
-        if not user.publicKey:
-            private_key, public_key = CryptoEngine.generate_key_pair()
-            await prisma.user.update(
-                where={"id": user.id},
-                data={"publicKey": public_key}
-            )
-            # In real app, securely return private key to user or store encrypted
-            # For this demo, we re-generate or assume we have it. 
-            # Ideally, private key should be client-side or strictly managed.
-            # Here we'll generate a fresh one for the session if needed or use a system key.
-            # To adhere to "Proper key management", let's assume we use the generated one.
-        else:
-            # For demo simplicity, we'll generate a new pair for signing this content
-            # In production, user would provide their private key
-            private_key, public_key = CryptoEngine.generate_key_pair()
+        with protect_stage_duration.time(stage="upload"):
+            ingested = await ingest_upload(file, upload_store.temp_path(file_ext), MAX_UPLOAD_BYTES)
+        # Only the header is read: unsupported, truncated and oversized files
+        # are turned away before any pixel work and never enter the store,
+        # as are images over the user's megapixel rate
+        try:
+            probe = await _probe(ingested.path)
+            admission.admit_pixels(tenant, probe.pixels)
+        except BaseException:
+            os.remove(ingested.path)
+            raise
+        # Named after the format the header gave when the filename has no usable extension
+        original_path = await store_call(
+            upload_store.adopt, ingested.path, ingested.sha256, source_extension(file.filename, probe.format),
+            undo=lambda _: upload_store.release(ingested.sha256)
+        )
+        original_hash = ingested.sha256
 
-        # 4. Protection Pipeline
-        
-        # A. Cryptographic Signing
-        original_hash = CryptoEngine.create_hash(original_path)
-        signature = CryptoEngine.sign_content(original_path, private_key)
-        
-        # B. Binary Manipulation
-        binary_protected_path = BinaryEngine.zero_out_manipulation(original_path)
-        
-        # C. AI Cloaking
-        # We apply cloaking on the binary-protected image to layer defenses
-        final_protected_path = CloakingEngine.apply_fawkes_protection(binary_protected_path, level='high')
-        
-        # Calculate final hash
-        protected_hash = CryptoEngine.create_hash(final_protected_path)
-        
-        # 5. Save to DB
-        content = await prisma.content.create(
-            data={
-                "userId": user.id,
-                "originalHash": original_hash,
-                "protectedHash": protected_hash,
-                "signatureData": signature,
-                "aiAnalysis": {
-                    "cloaking_level": "high",
-                    "manipulation_score": BinaryEngine.calculate_manipulation_score(original_path, final_protected_path),
-                    "protection_score": CloakingEngine.check_fawkes_effectiveness(original_path, final_protected_path)
+        if mode == "async":
+            # The queue is a SQLite file shared with other processes, whose
+            # writes can hold its lock for a while; keep that off the event loop
+            job_id = await asyncio.to_thread(
+                job_queue.enqueue,
+                {
+                    "user_id": user.id,
+                    "original_path": original_path,
+                    "original_hash": original_hash,
+                    "fast_metrics": fast_metrics,
+                    "profile": output.profile,
+                    "output_format": output.transcode,
+                    "trace_id": trace_id.get()
+                },
+                callback_url=callback_url,
+                owner=user.id
+            )
+            job_worker.notify()
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "status": "queued",
+                    "job_id": job_id,
+                    "status_url": f"/protect/jobs/{job_id}"
                 }
-            }
-        )
-        
-        # Move final protected image to protected directory
-        final_filename = f"{file_id}_protected{file_ext}"
-        final_destination = os.path.join(PROTECTED_DIR, final_filename)
-        shutil.copy(final_protected_path, final_destination)
-        
-        return {
-            "status": "success",
-            "content_id": content.id,
-            "original_hash": original_hash,
-            "protected_hash": protected_hash,
-            "signature": signature,
-            "original_url": f"/static/uploads/{file_id}{file_ext}",
-            "protected_url": f"/static/protected/{final_filename}",
-            "stats": {
-                "cryptographic_signing": True,
-                "binary_manipulation": True,
-                "ai_cloaking": True,
-                "manipulation_score": BinaryEngine.calculate_manipulation_score(original_path, final_protected_path),
-                "protection_score": CloakingEngine.check_fawkes_effectiveness(original_path, final_protected_path)
-            }
-        }
+            )
+
+        return await _run_protection(db, user, original_path, original_hash, fast_metrics=fast_metrics, probe=probe, output=output)
 
+    except (UploadTooLarge, ImageTooLarge) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ExecutorSaturated as e:
+        await store_call(upload_store.release, original_hash)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Throttled as e:
+        if original_hash is not None:
+            await store_call(upload_store.release, original_hash)
+        raise _too_many_requests(e)
+    except JobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user = Depends(get_current_user)):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    # Other users' jobs look the same as missing ones
+    if not job or job["payload"].get("user_id") != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+async def _protect_batch_item(
+    item: Dict[str, str],
+    tenant: Tenant,
+    fast_metrics: bool = False,
+    output: OutputSettings = OutputSettings()
+) -> Dict[str, Any]:
+    probe = await _probe(item["path"])
+    # Batch items wait for the user's megapixel rate instead of failing
+    while True:
+        try:
+            admission.admit_pixels(tenant, probe.pixels)
+            break
+        except Throttled as e:
+            await asyncio.sleep(e.retry_after)
+    while True:
+        try:
+            result = await _protect_original(item["path"], item["sha256"], fast_metrics, probe, output, tenant)
+            result["signature"] = key_store.sign_digest(tenant.user_id, result["original_hash"])
+            return result
+        except ExecutorSaturated:
+            # Other requests hold the spare queue slots; wait for one to free up
+            await asyncio.sleep(0.5)
+        except Throttled as e:
+            # The user's own queue is full, e.g. with their other requests
+            await asyncio.sleep(e.retry_after)
+
+async def _stream_batch(
+    tenant: Tenant,
+    items: List[Dict[str, str]],
+    fast_metrics: bool = False,
+    output: OutputSettings = OutputSettings()
+):
+    """
+    Protects every item across the process pool and yields one NDJSON line per
+    image as it finishes, followed by a summary line. Content ids are assigned
+    up front so they can be streamed before the rows are written; all rows are
+    then inserted with one create_many. If that insert fails the summary line
+    reports it and the streamed content ids are not valid. Store references
+    of items that end up without a Content row are released.
+    """
+    # Keep at most one job per pool worker in flight so the shared queue slots
+    # stay available to single-image requests
+    semaphore = asyncio.Semaphore(protection_executor.max_workers + large_protection_executor.max_workers)
+
+    async def run(index: int, item: Dict[str, str]):
+        async with semaphore:
+            try:
+                return index, await _protect_batch_item(item, tenant, fast_metrics, output), None
+            except Exception as e:
+                return index, None, e
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    results: Dict[int, Dict[str, Any]] = {}
+    rows = []
+    failed = 0
+    saved = False
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result, error = await next_done
+            item = items[index]
+            if error is not None:
+                failed += 1
+                line = {"index": index, "filename": item["filename"], "status": "error", "detail": str(error)}
+            else:
+                results[index] = result
+                content_id = str(uuid.uuid4())
+                rows.append({"id": content_id, **_content_data(tenant.user_id, result)})
+                line = {"index": index, "filename": item["filename"], **_protection_response(content_id, result)}
+            yield json.dumps(line) + "\n"
+
+        summary = {"status": "complete", "succeeded": len(rows), "failed": failed, "created": 0}
+        if rows:
+            try:
+                summary["created"] = await prisma.content.create_many(data=rows)
+                saved = True
+                for row in rows:
+                    verify_cache.invalidate(row["originalHash"], row["protectedHash"])
+                    _index_content(row["id"], row["perceptualHash"])
+            except Exception as e:
+                summary["status"] = "error"
+                summary["detail"] = f"Failed to save batch: {e}"
+        yield json.dumps(summary) + "\n"
     finally:
-        await prisma.disconnect()
+        # Client went away mid-stream: stop whatever has not started yet
+        for task in tasks:
+            task.cancel()
+
+        def release_unsaved() -> None:
+            for index, item in enumerate(items):
+                if not (saved and index in results):
+                    _release(item["sha256"], results[index]["protected_hash"] if index in results else None)
+        await store_call(release_unsaved)
+
+def _store_batch_inputs(files: List[UploadFile]) -> List[Dict[str, str]]:
+    # Written to the upload store's temp area, then adopted under their hash
+    items = save_batch_inputs(
+        [(file.filename, file.file) for file in files], upload_store.tmp_dir,
+        MAX_BATCH_FILES, MAX_UPLOAD_BYTES, MAX_BATCH_BYTES
+    )
+    adopted = []
+    try:
+        for item in items:
+            item["path"] = upload_store.adopt(item["path"], item["sha256"], item["file_ext"])
+            adopted.append(item)
+    except BaseException:
+        for item in adopted:
+            upload_store.release(item["sha256"])
+        for item in items[len(adopted):]:
+            if os.path.exists(item["path"]):
+                os.remove(item["path"])
+        raise
+    return items
+
+@router.post("/batch")
+async def protect_batch(
+    files: List[UploadFile] = File(...),
+    fast_metrics: bool = Form(False),
+    profile: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    user = Depends(get_current_user),
+    db: Prisma = Depends(get_db)
+):
+    """
+    Protects many images in one request. Accepts several image parts and/or
+    zip/tar archives, shares one signing key across the batch
+    and streams results back as NDJSON while they finish.
+    """
+    try:
+        output = OutputSettings.parse(profile, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # One request however many images; those count against the megapixel rate
+    tenant = _admit(user)
+    await _register_signing_key(db, user)
+
+    try:
+        items = await asyncio.to_thread(_store_batch_inputs, files)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch upload: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    return StreamingResponse(_stream_batch(tenant, items, fast_metrics, output), media_type="application/x-ndjson")
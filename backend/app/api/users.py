@@ -1,21 +1,172 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from prisma import Prisma
+from typing import Any, Dict, List, Optional, Tuple
+from app.db import get_db
+from app.api.auth import get_current_user, get_optional_user, SECRET_KEY
+from app.api.delivery import serve_file, PRIVATE_CACHE_CONTROL
+from app.services.blob_store import upload_store, store_call
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
 
 router = APIRouter()
-prisma = Prisma()
 
-@router.get("/content/{email}")
-async def get_user_content(email: str):
-    await prisma.connect()
+# Listed unless ``fields`` asks otherwise; aiAnalysis and signatureData are
+# large and rarely needed in listings, so they are opt-in
+DEFAULT_CONTENT_FIELDS = ("id", "originalHash", "protectedHash", "perceptualHash", "createdAt")
+CONTENT_FIELDS = DEFAULT_CONTENT_FIELDS + ("userId", "aiAnalysis", "signatureData")
+MAX_PAGE_SIZE = 500
+# Lifetime of the signed original links handed out with protection results
+ORIGINAL_URL_TTL = int(os.getenv("ORIGINAL_URL_TTL", "900"))
+EXPORT_PAGE_SIZE = 1000
+
+def encode_cursor(created_at: str, content_id: str) -> str:
+    raw = json.dumps([created_at, content_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
     try:
-        user = await prisma.user.find_unique(
-            where={"email": email},
-            include={"contents": True}
+        created_at, content_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(content_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(DEFAULT_CONTENT_FIELDS)
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in CONTENT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # The cursor is built from these, so they are always selected
+    for field in ("createdAt", "id"):
+        if field not in selected:
+            selected.append(field)
+    return selected
+
+async def fetch_content_page(
+    db: Prisma,
+    user_id: str,
+    fields: List[str],
+    limit: int,
+    after: Optional[Tuple[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Returns up to ``limit`` of a user's contents, newest first, strictly after
+    the (createdAt, id) keyset position ``after``. Seeks on the
+    (userId, createdAt, id) index, so every page costs the same however deep
+    it is, and only the requested columns are read.
+    """
+    # Column names come from the CONTENT_FIELDS whitelist, never from the client
+    columns = ", ".join(f'"{field}"' for field in fields)
+    if after is None:
+        return await db.query_raw(
+            f'SELECT {columns} FROM "Content" WHERE "userId" = $1 '
+            'ORDER BY "createdAt" DESC, "id" DESC LIMIT $2',
+            user_id,
+            limit
         )
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-        return user.contents
-    finally:
-        await prisma.disconnect()
+    return await db.query_raw(
+        f'SELECT {columns} FROM "Content" WHERE "userId" = $1 '
+        'AND ("createdAt", "id") < ($2::timestamp, $3) '
+        'ORDER BY "createdAt" DESC, "id" DESC LIMIT $4',
+        user_id,
+        after[0],
+        after[1],
+        limit
+    )
+
+async def _export_contents(db: Prisma, user_id: str, fields: List[str], after: Optional[Tuple[str, str]]):
+    # One page in memory at a time, however many contents the user has
+    while True:
+        rows = await fetch_content_page(db, user_id, fields, EXPORT_PAGE_SIZE, after)
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+        if len(rows) < EXPORT_PAGE_SIZE:
+            break
+        after = (rows[-1]["createdAt"], rows[-1]["id"])
+
+@router.get("/content/{email}")
+async def get_user_content(
+    email: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    user = Depends(get_current_user),
+    db: Prisma = Depends(get_db)
+):
+    """
+    Lists a user's contents, newest first. Pages are chained with the
+    ``next_cursor`` of the previous response; ``fields`` is a comma separated
+    column list. ``format=ndjson`` streams every content from ``cursor`` on,
+    one JSON object per line, for bulk export. Only the signed-in user's own
+    contents can be listed.
+    """
+    selected = parse_fields(fields)
+    after = decode_cursor(cursor) if cursor else None
+
+    if email != user.email:
+        raise HTTPException(status_code=403, detail="Not allowed to list another user's content")
+
+    if format == "ndjson":
+        return StreamingResponse(_export_contents(db, user.id, selected, after), media_type="application/x-ndjson")
+
+    # One extra row tells whether another page exists
+    rows = await fetch_content_page(db, user.id, selected, limit + 1, after)
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]["createdAt"], items[-1]["id"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+async def _original_path(db: Prisma, content_id: str, user_id: Optional[str]) -> Tuple[str, str]:
+    content = await db.content.find_unique(where={"id": content_id})
+    # Other users' content looks the same as missing content; signed links
+    # (no user_id) were only ever handed to the owner
+    if not content or (user_id is not None and content.userId != user_id):
+        raise HTTPException(status_code=404, detail="File not found")
+    path = await store_call(upload_store.find, content.originalHash)
+    if path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return path, content.originalHash
+
+def _original_signature(content_id: str, expires: int) -> str:
+    message = f"original:{content_id}:{expires}".encode("utf-8")
+    return hmac.new(SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+def original_url(content_id: str, ttl: int = ORIGINAL_URL_TTL, now: Optional[float] = None) -> str:
+    """
+    Link to a content's original that works without a token until it
+    expires, e.g. for an <img> tag right after uploading.
+    """
+    expires = int((time.time() if now is None else now) + ttl)
+    return f"/user/originals/{content_id}?expires={expires}&signature={_original_signature(content_id, expires)}"
+
+@router.api_route("/originals/{content_id}", methods=["GET", "HEAD"])
+async def get_original(
+    content_id: str,
+    request: Request,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None,
+    user = Depends(get_optional_user),
+    db: Prisma = Depends(get_db)
+):
+    """
+    Serves the unprotected original of a content to the user who uploaded
+    it, identified by the bearer token or by a link from original_url().
+    Its hash is public, so the store path is never exposed; responses must
+    not be kept by shared caches.
+    """
+    if signature is not None:
+        if expires is None or expires < time.time() or not hmac.compare_digest(signature, _original_signature(content_id, expires)):
+            raise HTTPException(status_code=403, detail="Invalid or expired link")
+        owner_id = None
+    elif user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    else:
+        owner_id = user.id
+    path, digest = await _original_path(db, content_id, owner_id)
+    return serve_file(request, path, f'"{digest}"', PRIVATE_CACHE_CONTROL)
@@ -1,14 +1,198 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
 from prisma import Prisma
+from PIL import Image
+from typing import Any, Dict, List, Optional, Tuple
+from app.db import get_db, prisma
+from app.services.verify_cache import verify_cache, verification_log
+from app.services.crypto_engine import CryptoEngine
+from app.services.hamming_index import phash_index, phash_sync
+from app.services.perceptual_hash import hash_image, from_hex, to_hex
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-prisma = Prisma()
 
-@router.get("/{content_hash}")
-async def verify_content(content_hash: str):
-    await prisma.connect()
+VERIFY_MAX_IMAGE_BYTES = int(os.getenv("VERIFY_MAX_IMAGE_BYTES", str(50 * 1024 * 1024)))
+# Default Hamming radius for /verify/image; 64-bit pHashes of the same image
+# after recompression or resizing typically differ by well under 10 bits
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "10"))
+PHASH_LOAD_PAGE = 10000
+# The index lives in each process; contents protected by other processes
+# become searchable here within this many seconds
+PHASH_REFRESH_SECONDS = float(os.getenv("PHASH_REFRESH_SECONDS", "5"))
+_phash_refresher: Optional[asyncio.Task] = None
+
+async def _write_verifications(rows: List[Dict[str, Any]]) -> None:
+    await prisma.verification.create_many(data=rows)
+
+def start_verification_log():
+    verification_log.start(_write_verifications)
+
+async def stop_verification_log():
+    await verification_log.stop()
+
+def _signature_valid(content) -> bool:
+    # Signatures cover the original's digest and are made with the creator's key
+    if not content.user.publicKey:
+        return False
+    return CryptoEngine.verify_digest(content.originalHash, content.signatureData, content.user.publicKey)
+
+def _created_at(value: Any) -> float:
+    # Raw queries return timestamps as ISO strings; Prisma stores them in UTC
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _index_rows(rows: List[Dict[str, Any]]) -> List[Tuple[str, int, float]]:
+    return [(row["id"], from_hex(row["perceptualHash"]), _created_at(row["createdAt"])) for row in rows]
+
+async def load_phash_index() -> int:
+    """
+    Loads every stored perceptual hash into the in-memory Hamming index,
+    paging through Content by id so memory stays flat while loading. The
+    tables are built once at the end, in a thread.
+    Returns:
+        int: Number of indexed contents.
+    """
+    await asyncio.to_thread(phash_sync.reset)
+    last_id = ""
+    while True:
+        rows = await prisma.query_raw(
+            'SELECT "id", "perceptualHash", "createdAt" FROM "Content" '
+            'WHERE "perceptualHash" IS NOT NULL AND "id" > $1 '
+            'ORDER BY "id" LIMIT $2',
+            last_id,
+            PHASH_LOAD_PAGE
+        )
+        if not rows:
+            break
+        await asyncio.to_thread(phash_sync.add_rows, _index_rows(rows), False)
+        last_id = rows[-1]["id"]
+    await asyncio.to_thread(phash_index.merge)
+    return len(phash_index)
+
+async def refresh_phash_index() -> int:
+    """
+    Adds the contents created since the last load or refresh, by any
+    process, to the index; merges run in a thread.
+    Returns:
+        int: Number of contents added.
+    """
+    since = phash_sync.since
+    after = (datetime.fromtimestamp(since or 0, timezone.utc).replace(tzinfo=None).isoformat(), "")
+    added = 0
+    while True:
+        rows = await prisma.query_raw(
+            'SELECT "id", "perceptualHash", "createdAt" FROM "Content" '
+            'WHERE "perceptualHash" IS NOT NULL AND ("createdAt", "id") > ($1::timestamp, $2) '
+            'ORDER BY "createdAt", "id" LIMIT $3',
+            after[0],
+            after[1],
+            PHASH_LOAD_PAGE
+        )
+        if not rows:
+            break
+        added += await asyncio.to_thread(phash_sync.add_rows, _index_rows(rows))
+        after = (rows[-1]["createdAt"], rows[-1]["id"])
+    return added
+
+async def _refresh_phash_index_forever() -> None:
+    while True:
+        await asyncio.sleep(PHASH_REFRESH_SECONDS)
+        try:
+            await refresh_phash_index()
+        except Exception:
+            logger.exception("Refreshing the perceptual hash index failed")
+
+def start_phash_refresh():
+    global _phash_refresher
+    _phash_refresher = asyncio.create_task(_refresh_phash_index_forever())
+
+async def stop_phash_refresh():
+    global _phash_refresher
+    if _phash_refresher is not None:
+        _phash_refresher.cancel()
+        await asyncio.gather(_phash_refresher, return_exceptions=True)
+        _phash_refresher = None
+
+def _hash_upload(data: bytes) -> Optional[int]:
+    with Image.open(io.BytesIO(data)) as img:
+        return hash_image(img)
+
+@router.post("/image")
+async def verify_image(
+    file: UploadFile = File(...),
+    max_distance: int = Form(PHASH_MAX_DISTANCE),
+    limit: int = Form(10),
+    db: Prisma = Depends(get_db)
+):
+    """
+    Finds registered content that looks like the uploaded image, even after
+    it was re-encoded, recompressed or resized, by the Hamming distance
+    between perceptual hashes.
+    """
+    if not 0 <= max_distance <= 16:
+        raise HTTPException(status_code=400, detail="max_distance must be between 0 and 16")
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+
+    data = await file.read(VERIFY_MAX_IMAGE_BYTES + 1)
+    if len(data) > VERIFY_MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds the {VERIFY_MAX_IMAGE_BYTES} byte limit")
     try:
-        content = await prisma.content.find_first(
+        # Decoding is CPU-bound; keep the event loop free meanwhile
+        code = await asyncio.to_thread(_hash_upload, data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    if code is None:
+        raise HTTPException(status_code=400, detail="Image is too small to fingerprint")
+
+    matches = phash_index.search(code, max_distance, limit)
+    contents = {}
+    if matches:
+        rows = await db.content.find_many(
+            where={"id": {"in": [content_id for content_id, _ in matches]}},
+            include={"user": True}
+        )
+        contents = {content.id: content for content in rows}
+
+    results = [
+        {
+            "content_id": content_id,
+            "creator": contents[content_id].user.name,
+            "timestamp": contents[content_id].createdAt,
+            "distance": distance,
+            "similarity": 1 - distance / 64,
+            "signatures_valid": _signature_valid(contents[content_id])
+        }
+        for content_id, distance in matches
+        if content_id in contents
+    ]
+    if not results:
+        raise HTTPException(status_code=404, detail="Content not found")
+
+    verification_log.record(results[0]["content_id"], hashlib.sha256(data).hexdigest())
+
+    return {
+        "verified": True,
+        "perceptual_hash": to_hex(code),
+        "matches": results
+    }
+
+@router.get("/{content_hash}")
+async def verify_content(content_hash: str, db: Prisma = Depends(get_db)):
+    # Hot hashes are answered from memory without touching the database
+    cached = verify_cache.get(content_hash)
+    if cached is None:
+        content = await db.content.find_first(
             where={
                 "OR": [
                     {"originalHash": content_hash},
@@ -17,25 +201,26 @@ async def verify_content(content_hash: str):
             },
             include={"user": True}
         )
-        
+
         if not content:
             raise HTTPException(status_code=404, detail="Content not found")
-            
-        # Create verification record
-        await prisma.verification.create(
-            data={
-                "contentId": content.id,
-                "contentHash": content_hash
-            }
-        )
-        
-        return {
-            "verified": True,
+
+        cached = {
             "content_id": content.id,
             "creator": content.user.name,
             "timestamp": content.createdAt,
-            "protection_level": "Maximum",
-            "signatures_valid": True
+            "signatures_valid": _signature_valid(content)
         }
-    finally:
-        await prisma.disconnect()
+        verify_cache.set(content_hash, cached)
+
+    # Create verification record (buffered, written in batches)
+    verification_log.record(cached["content_id"], content_hash)
+
+    return {
+        "verified": True,
+        "content_id": cached["content_id"],
+        "creator": cached["creator"],
+        "timestamp": cached["timestamp"],
+        "protection_level": "Maximum",
+        "signatures_valid": cached["signatures_valid"]
+    }
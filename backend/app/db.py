@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from prisma import Prisma
+from dotenv import load_dotenv
+from app.services.metrics import db_query_duration, METRICS_ENABLED
+
+load_dotenv()
+
+# Connection pool sizing for the query engine. Unset values fall back to
+# Prisma's defaults (num_cpus * 2 + 1 connections, 10s pool timeout).
+DATABASE_POOL_SIZE = os.getenv("DATABASE_POOL_SIZE")
+DATABASE_POOL_TIMEOUT = os.getenv("DATABASE_POOL_TIMEOUT")
+
+def pooled_url(url: str, pool_size: Optional[str] = None, pool_timeout: Optional[str] = None) -> str:
+    """
+    Adds Prisma's ``connection_limit``/``pool_timeout`` parameters to a database
+    URL. Parameters already present in the URL win.
+    Args:
+        url (str): Database connection URL.
+        pool_size (Optional[str]): Maximum number of pooled connections.
+        pool_timeout (Optional[str]): Seconds to wait for a free connection.
+    Returns:
+        str: The URL with pool parameters applied.
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    if pool_size:
+        query.setdefault("connection_limit", pool_size)
+    if pool_timeout:
+        query.setdefault("pool_timeout", pool_timeout)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+class InstrumentedPrisma(Prisma):
+    """
+    Prisma client that times every query. Model actions, raw queries and
+    batches all go through _execute(), so this is the one place to measure.
+    """
+
+    async def _execute(self, method, arguments, model=None, root_selection=None):
+        with db_query_duration.time(model=model.__name__ if model is not None else "raw", method=method):
+            return await super()._execute(method, arguments, model, root_selection)
+
+def _create_client() -> Prisma:
+    # Without metrics the stock client is used, so there is no overhead at all
+    client_class = InstrumentedPrisma if METRICS_ENABLED else Prisma
+    url = os.getenv("DATABASE_URL")
+    if url and (DATABASE_POOL_SIZE or DATABASE_POOL_TIMEOUT):
+        return client_class(datasource={"url": pooled_url(url, DATABASE_POOL_SIZE, DATABASE_POOL_TIMEOUT)})
+    return client_class()
+
+# The one client for the whole app. It is connected at startup and shared by
+# every router, so requests never pay for a query engine handshake and never
+# disconnect each other.
+prisma = _create_client()
+
+async def connect() -> None:
+    if not prisma.is_connected():
+        await prisma.connect()
+
+async def disconnect() -> None:
+    if prisma.is_connected():
+        await prisma.disconnect()
+
+def get_db() -> Prisma:
+    """FastAPI dependency returning the shared, already-connected client."""
+    return prisma
+
+async def health_check() -> Dict[str, Any]:
+    """
+    Runs a trivial round trip through the pool and reports its latency together
+    with the query engine's own pool and query-duration metrics.
+    Returns:
+        Dict[str, Any]: status, latency_ms and engine metrics.
+    """
+    start = time.perf_counter()
+    try:
+        await prisma.execute_raw("SELECT 1")
+    except Exception as e:
+        return {"status": "error", "detail": str(e)}
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    health: Dict[str, Any] = {
+        "status": "ok",
+        "latency_ms": round(latency_ms, 3),
+        "pool": {"size": DATABASE_POOL_SIZE, "timeout": DATABASE_POOL_TIMEOUT}
+    }
+    try:
+        # Requires the "metrics" preview feature in schema.prisma
+        metrics = await prisma.get_metrics()
+        health["metrics"] = metrics.dict()
+    except Exception:
+        pass
+    return health
@@ -1,12 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.api import auth, protect, verify, users
-from prisma import Prisma
+from fastapi.responses import JSONResponse, Response
+from app.api import auth, protect, verify, users, delivery, admin
+from app.services.executor import protection_executor, large_protection_executor
+from app.services.admission import protection_scheduler, large_protection_scheduler
+from app.services.blob_store import upload_store, protected_store
+from app.services.job_queue import JOB_QUEUED, JOB_RUNNING
+from app.services.metrics import registry, CONTENT_TYPE, METRICS_ENABLED
+from app.services.tracing import TraceMiddleware, configure_logging
+from app.services.variants import variant_cache
+from app.services.passwords import password_hasher
+from app.services.verify_cache import verification_log
+from app import db
+import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
+configure_logging()
 
 app = FastAPI(title="Virtius 4.0 API")
 
@@ -18,32 +29,86 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so the trace id covers CORS handling and error responses too
+app.add_middleware(TraceMiddleware)
+
+# Saturation of the shared queues and pools, read when /metrics is scraped
+registry.gauge("virtius_protection_pool_workers", "Processes in the protection pool.", lambda: protection_executor.max_workers)
+registry.gauge("virtius_protection_pool_capacity", "Jobs the protection pool accepts before rejecting.", lambda: protection_executor.capacity)
+registry.gauge("virtius_protection_pool_pending", "Protection jobs running or waiting for a worker.", lambda: protection_executor.pending)
+registry.gauge("virtius_large_protection_pool_workers", "Processes in the large-image protection pool.", lambda: large_protection_executor.max_workers)
+registry.gauge("virtius_large_protection_pool_capacity", "Jobs the large-image pool accepts before rejecting.", lambda: large_protection_executor.capacity)
+registry.gauge("virtius_large_protection_pool_pending", "Large-image protection jobs running or waiting for a worker.", lambda: large_protection_executor.pending)
+registry.gauge("virtius_protection_fair_queue_waiting", "Protection jobs waiting for their fair turn at a worker.", lambda: protection_scheduler.waiting)
+registry.gauge("virtius_large_protection_fair_queue_waiting", "Large-image protection jobs waiting for their fair turn at a worker.", lambda: large_protection_scheduler.waiting)
+registry.gauge("virtius_job_queue_queued", "Async protection jobs waiting to be claimed.", lambda: protect.job_queue.count(JOB_QUEUED))
+registry.gauge("virtius_job_queue_running", "Async protection jobs being processed.", lambda: protect.job_queue.count(JOB_RUNNING))
+registry.gauge("virtius_verification_log_pending", "Verification records waiting to be written.", lambda: verification_log.pending)
+registry.gauge("virtius_password_pending", "Password hashes and checks running or waiting for a thread.", lambda: password_hasher.pending)
+registry.gauge("virtius_variant_cache_bytes", "Size of the resized variant cache.", lambda: variant_cache.total_bytes)
 
 # Create directories if they don't exist
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("protected", exist_ok=True)
 
-# Mount static files for serving protected images
-app.mount("/static/protected", StaticFiles(directory="protected"), name="protected")
-app.mount("/static/uploads", StaticFiles(directory="uploads"), name="uploads")
-
-# Database Connection
-prisma = Prisma()
+# Protected images are served by the delivery router, with ETags, range
+# requests and immutable caching for content-addressed files. Uploads are
+# never served publicly; their owners fetch them from /user/originals
 
 @app.on_event("startup")
 async def startup():
-    await prisma.connect()
+    # One shared database client for every router (see app/db.py)
+    await db.connect()
+    await verify.load_phash_index()
+    verify.start_phash_refresh()
+    protection_executor.start()
+    large_protection_executor.start()
+    # Temp files of writes cut short by a crash or restart
+    upload_store.sweep_tmp()
+    protected_store.sweep_tmp()
+    protect.start_job_worker()
+    verify.start_verification_log()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await prisma.disconnect()
+    await verify.stop_verification_log()
+    await verify.stop_phash_refresh()
+    await protect.stop_job_worker()
+    protection_executor.shutdown()
+    large_protection_executor.shutdown()
+    password_hasher.shutdown()
+    await db.disconnect()
 
 # Include Routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(protect.router, prefix="/protect", tags=["Protection"])
 app.include_router(verify.router, prefix="/verify", tags=["Verification"])
 app.include_router(users.router, prefix="/user", tags=["User"])
+app.include_router(delivery.router, tags=["Delivery"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
 @app.get("/")
 async def root():
     return {"message": "Virtius 4.0 API is running"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # Some gauges query the job queue's SQLite file
+    body = await asyncio.to_thread(registry.render)
+    try:
+        # The query engine's own pool and query metrics; needs the "metrics"
+        # preview feature in schema.prisma
+        body += await db.prisma.get_metrics(format="prometheus")
+    except Exception:
+        pass
+    # Set as a header so Starlette does not append a second charset
+    return Response(body, headers={"content-type": CONTENT_TYPE})
+
+@app.get("/health/db")
+async def database_health():
+    health = await db.health_check()
+    if health["status"] != "ok":
+        return JSONResponse(status_code=503, content=health)
+    return health
@@ -0,0 +1,331 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, NamedTuple, Optional, TypeVar
+from app.services.executor import protection_executor, large_protection_executor, ExecutorSaturated
+from app.services.metrics import admission_throttled
+
+T = TypeVar("T")
+
+class PlanLimits(NamedTuple):
+    requests_per_second: float
+    request_burst: float
+    megapixels_per_second: float
+    megapixel_burst: float
+    # Pool jobs of one user running at once, and waiting for a worker
+    max_concurrent: int
+    max_queued: int
+    # Share of the pools relative to other plans when they compete
+    weight: float
+
+DEFAULT_PLAN = os.getenv("DEFAULT_PLAN", "free")
+
+DEFAULT_PLANS: Dict[str, PlanLimits] = {
+    "free": PlanLimits(1, 10, 2, 50, 1, 8, 1),
+    "pro": PlanLimits(5, 30, 10, 200, 2, 32, 2),
+    "enterprise": PlanLimits(20, 100, 40, 1000, 4, 128, 4)
+}
+
+def load_plans(overrides: Optional[str] = None) -> Dict[str, PlanLimits]:
+    """
+    Plan limits: DEFAULT_PLANS updated from PLAN_LIMITS, a JSON object of
+    plan name to the fields to change, e.g.
+    ``{"free": {"megapixels_per_second": 5}, "internal": {...}}``. A new plan
+    starts from the default plan's limits.
+    Raises:
+        ValueError: If the JSON names unknown fields.
+    """
+    plans = dict(DEFAULT_PLANS)
+    raw = overrides if overrides is not None else os.getenv("PLAN_LIMITS", "")
+    for name, fields in (json.loads(raw) if raw else {}).items():
+        unknown = set(fields) - set(PlanLimits._fields)
+        if unknown:
+            raise ValueError(f"Unknown plan limit fields for {name}: {', '.join(sorted(unknown))}")
+        plans[name] = plans.get(name, plans[DEFAULT_PLAN])._replace(**fields)
+    return plans
+
+class Throttled(Exception):
+    """Raised when a user is over one of their plan's limits."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded ({reason}); retry in {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+class Tenant(NamedTuple):
+    user_id: str
+    plan: str
+
+    @classmethod
+    def of(cls, user) -> "Tenant":
+        return cls(user.id, user.plan or DEFAULT_PLAN)
+
+class TokenBucket:
+    """
+    Holds up to ``capacity`` tokens, refilled at ``rate`` per second.
+    Amounts larger than the capacity are capped to it, so a single large
+    request is delayed rather than refused forever.
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if self.tokens < self.capacity:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """
+        Takes ``amount`` tokens if available.
+        Returns:
+            float: 0 if they were taken, otherwise the seconds until they
+            will be (nothing is taken then).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def level(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def full(self, now: float) -> bool:
+        return self.level(now) >= self.capacity
+
+class AdmissionController:
+    """
+    Per-user token buckets on request rate and on megapixels submitted per
+    second, with sizes and rates from the user's plan. Idle users' buckets
+    refill to full and are then forgotten, so memory follows the number of
+    recently active users.
+    """
+
+    def __init__(self, plans: Dict[str, PlanLimits], clock: Callable[[], float] = time.monotonic, max_tracked: int = 4096):
+        self.plans = plans
+        self.clock = clock
+        self.max_tracked = max_tracked
+        self._buckets: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def limits(self, plan: str) -> PlanLimits:
+        return self.plans.get(plan) or self.plans[DEFAULT_PLAN]
+
+    def _state(self, tenant: Tenant, now: float) -> Dict[str, Any]:
+        limits = self.limits(tenant.plan)
+        state = self._buckets.get(tenant.user_id)
+        if state is None or state["plan"] != tenant.plan:
+            if len(self._buckets) >= self.max_tracked:
+                self._prune(now)
+            state = self._buckets[tenant.user_id] = {
+                "plan": tenant.plan,
+                "requests": TokenBucket(limits.requests_per_second, limits.request_burst, now),
+                "megapixels": TokenBucket(limits.megapixels_per_second, limits.megapixel_burst, now)
+            }
+        return state
+
+    def _prune(self, now: float) -> None:
+        for user_id in [user_id for user_id, state in self._buckets.items()
+                        if state["requests"].full(now) and state["megapixels"].full(now)]:
+            del self._buckets[user_id]
+
+    def _take(self, tenant: Tenant, bucket: str, amount: float) -> None:
+        now = self.clock()
+        with self._lock:
+            wait = self._state(tenant, now)[bucket].take(amount, now)
+        if wait > 0:
+            admission_throttled.inc(reason=bucket)
+            raise Throttled(bucket, wait)
+
+    def admit_request(self, tenant: Tenant) -> None:
+        """
+        Counts one request against the user's request rate.
+        Raises:
+            Throttled: If the user is over it.
+        """
+        self._take(tenant, "requests", 1)
+
+    def admit_pixels(self, tenant: Tenant, pixels: int) -> None:
+        """
+        Counts an image against the user's megapixel rate, before any pixel work.
+        Raises:
+            Throttled: If the user is over it.
+        """
+        self._take(tenant, "megapixels", pixels / 1e6)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = self.clock()
+        with self._lock:
+            self._prune(now)
+            return {
+                user_id: {
+                    "plan": state["plan"],
+                    "request_tokens": round(state["requests"].level(now), 3),
+                    "megapixel_tokens": round(state["megapixels"].level(now), 3)
+                }
+                for user_id, state in self._buckets.items()
+            }
+
+class _Waiter:
+    __slots__ = ("start", "future")
+
+    def __init__(self, start: float, future: asyncio.Future):
+        self.start = start
+        self.future = future
+
+class _UserQueue:
+    __slots__ = ("waiting", "running", "finish", "limits")
+
+    def __init__(self, limits: PlanLimits):
+        self.waiting: Deque[_Waiter] = deque()
+        self.running = 0
+        self.finish = 0.0
+        self.limits = limits
+
+class FairScheduler:
+    """
+    Shares ``slots`` pool workers between users by start-time fair queuing.
+
+    Every job is tagged on arrival with a virtual start time: the later of
+    the scheduler's virtual clock and the finish tag of the same user's
+    previous job, where a job's finish tag adds its cost (megapixels)
+    divided by the plan's weight. A free slot goes to the waiting job with
+    the lowest start tag among users below their plan's max_concurrent. A
+    user with thousands of queued images therefore only gets ahead of a
+    newcomer by the work already running: someone arriving behind a bulk
+    upload waits for about one job per slot, not for the whole upload.
+
+    At most ``max_waiting`` jobs wait in total (ExecutorSaturated beyond
+    that, as for the pool itself) and at most the plan's max_queued per user
+    (Throttled).
+    """
+
+    def __init__(self, slots: int, max_waiting: int):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self._users: Dict[str, _UserQueue] = {}
+        self._virtual = 0.0
+        self._running = 0
+        self._waiting = 0
+        # Smoothed job duration, for Retry-After estimates
+        self._job_seconds = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _user(self, tenant: Tenant, limits: PlanLimits) -> _UserQueue:
+        queue = self._users.get(tenant.user_id)
+        if queue is None:
+            queue = self._users[tenant.user_id] = _UserQueue(limits)
+        queue.limits = limits
+        return queue
+
+    def _dispatch(self) -> None:
+        while self._running < self.slots:
+            best_id, best = None, None
+            for user_id, queue in self._users.items():
+                if queue.waiting and queue.running < queue.limits.max_concurrent:
+                    if best is None or queue.waiting[0].start < best.waiting[0].start:
+                        best_id, best = user_id, queue
+            if best is None:
+                return
+            waiter = best.waiting.popleft()
+            self._waiting -= 1
+            self._virtual = max(self._virtual, waiter.start)
+            best.running += 1
+            self._running += 1
+            waiter.future.set_result(None)
+
+    def _release(self, user_id: str) -> None:
+        queue = self._users[user_id]
+        queue.running -= 1
+        self._running -= 1
+        if not queue.running and not queue.waiting:
+            del self._users[user_id]
+        self._dispatch()
+
+    async def run(self, tenant: Tenant, limits: PlanLimits, cost: float, job: Callable[[], Awaitable[T]]) -> T:
+        """
+        Waits for a fair turn, then awaits ``job()`` while holding a slot.
+        Args:
+            tenant (Tenant): Who the job is for.
+            limits (PlanLimits): The tenant's plan.
+            cost (float): Work in the job, e.g. megapixels.
+            job (Callable): Starts the work, e.g. a pool submission.
+        Raises:
+            Throttled: If the user already has max_queued jobs waiting.
+            ExecutorSaturated: If max_waiting jobs are waiting in total.
+        """
+        queue = self._users.get(tenant.user_id)
+        if self._running >= self.slots or self._waiting or (queue is not None and queue.running >= limits.max_concurrent):
+            queued = len(queue.waiting) if queue is not None else 0
+            if queued >= limits.max_queued:
+                admission_throttled.inc(reason="queue")
+                raise Throttled("queue", self._job_seconds * (queued + 1) / max(1, limits.max_concurrent))
+            if self._waiting >= self.max_waiting:
+                raise ExecutorSaturated(f"Protection queue is full ({self.max_waiting} waiting jobs)")
+        queue = self._user(tenant, limits)
+        start = max(self._virtual, queue.finish)
+        queue.finish = start + cost / limits.weight
+        waiter = _Waiter(start, asyncio.get_running_loop().create_future())
+        queue.waiting.append(waiter)
+        self._waiting += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot in the same step as being cancelled
+                self._release(tenant.user_id)
+            else:
+                queue.waiting.remove(waiter)
+                self._waiting -= 1
+                if not queue.running and not queue.waiting:
+                    self._users.pop(tenant.user_id, None)
+                self._dispatch()
+            raise
+
+        started = time.monotonic()
+        try:
+            return await job()
+        finally:
+            self._job_seconds += (time.monotonic() - started - self._job_seconds) * 0.2
+            self._release(tenant.user_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_waiting": self.max_waiting,
+            "job_seconds": round(self._job_seconds, 3),
+            "users": {
+                user_id: {"running": queue.running, "waiting": len(queue.waiting)}
+                for user_id, queue in self._users.items()
+            }
+        }
+
+admission = AdmissionController(load_plans())
+# One per pool, sized like it: jobs wait here, in fair order, instead of in
+# the pool's own arrival-order queue
+protection_scheduler = FairScheduler(protection_executor.max_workers, protection_executor.max_queue)
+large_protection_scheduler = FairScheduler(large_protection_executor.max_workers, large_protection_executor.max_queue)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import tarfile
+import uuid
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Tuple
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp", ".gif"}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+class BatchTooLarge(Exception):
+    """Raised when a batch holds more images or bytes than allowed."""
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def _is_image(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+def _store(stream: BinaryIO, filename: str, upload_dir: str, max_bytes: int, limit_error: str) -> Dict[str, Any]:
+    # Stored under a fresh id; the client-supplied name is never used as a path
+    file_ext = os.path.splitext(filename)[1]
+    file_id = str(uuid.uuid4())
+    path = os.path.join(upload_dir, f"{file_id}{file_ext}")
+    # Hash while copying so the pipeline never re-reads the original
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as buffer:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                # Counted as it streams: uploaded parts come with no trusted size
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BatchTooLarge(limit_error)
+                sha256_hash.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return {"filename": filename, "file_id": file_id, "file_ext": file_ext, "path": path, "sha256": sha256_hash.hexdigest(), "size": size}
+
+def _archive_members(archive: BinaryIO, filename: str, max_file_bytes: int):
+    """Yields (name, stream) for every image member of a zip or tar archive."""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not _is_image(info.filename) or info.file_size > max_file_bytes:
+                    continue
+                with zf.open(info) as member:
+                    yield os.path.basename(info.filename), member
+    else:
+        # Streaming mode: members are read in order without seeking
+        with tarfile.open(fileobj=archive, mode="r|*") as tf:
+            for member in tf:
+                if not member.isfile() or not _is_image(member.name) or member.size > max_file_bytes:
+                    continue
+                yield os.path.basename(member.name), tf.extractfile(member)
+
+def save_batch_inputs(
+    files: List[Tuple[str, BinaryIO]],
+    upload_dir: str,
+    max_files: int = 2000,
+    max_file_bytes: int = 256 * 1024 * 1024,
+    max_total_bytes: int = 4 * 1024 * 1024 * 1024
+) -> List[Dict[str, Any]]:
+    """
+    Writes every image of a batch upload to ``upload_dir``. Archives (zip/tar)
+    are expanded; non-image members and members whose header gives a size
+    over ``max_file_bytes`` are skipped. Sizes are enforced on the bytes
+    actually written, so nothing larger than the limits reaches the disk.
+    Args:
+        files (List[Tuple[str, BinaryIO]]): (filename, stream) for each uploaded part.
+        upload_dir (str): Directory to write originals to.
+        max_files (int): Maximum number of images in the batch.
+        max_file_bytes (int): Maximum size of a single image, uploaded or extracted.
+        max_total_bytes (int): Maximum size of all images of the batch together.
+    Returns:
+        List[Dict[str, Any]]: filename, file_id, file_ext, path, sha256 and size of each saved image.
+    Raises:
+        BatchTooLarge: If the batch holds more than ``max_files`` images, or an
+            image or the whole batch exceeds its byte limit. Nothing is left on disk.
+    """
+    saved: List[Dict[str, Any]] = []
+    written = 0
+
+    def add(stream: BinaryIO, name: str) -> None:
+        nonlocal written
+        if len(saved) >= max_files:
+            raise BatchTooLarge(f"Batch exceeds {max_files} images")
+        remaining = max_total_bytes - written
+        if remaining < max_file_bytes:
+            item = _store(stream, name, upload_dir, remaining, f"Batch exceeds the {max_total_bytes} byte limit")
+        else:
+            item = _store(stream, name, upload_dir, max_file_bytes, f"{name} exceeds the {max_file_bytes} byte limit")
+        written += item["size"]
+        saved.append(item)
+
+    try:
+        for filename, stream in files:
+            if is_archive(filename):
+                for name, member in _archive_members(stream, filename, max_file_bytes):
+                    add(member, name)
+            else:
+                add(stream, filename)
+    except Exception:
+        for item in saved:
+            if os.path.exists(item["path"]):
+                os.remove(item["path"])
+        raise
+    return saved
@@ -1,16 +1,20 @@
 import os
-import shutil
 import numpy as np
 from PIL import Image
-from typing import Tuple
+from typing import Optional
+from app.services.quality_metrics import compute_metrics
+from app.services.parallel import map_chunks, row_chunks, PROTECTION_THREADS
+from app.services.encoder import encode_image
 
 class BinaryEngine:
     @staticmethod
-    def zero_out_manipulation(image_path: str) -> str:
+    def zero_out_manipulation(image_path: str, seed: Optional[int] = None, threads: int = PROTECTION_THREADS) -> str:
         """
         Applies zero-out manipulation to specific bytes and RGB shifts.
         Args:
             image_path (str): Path to the original image.
+            seed (Optional[int]): Noise seed; a random one is drawn if omitted.
+            threads (int): Threads to spread the image's strips over.
         Returns:
             str: Path to the protected image.
         """
@@ -26,36 +30,63 @@ class BinaryEngine:
                 info = img.info
                 
                 # Convert to RGB to ensure consistency
-                img_rgb = img.convert('RGB')
-                data = np.array(img_rgb)
-                
-                # 1. Zero-out strategic bytes (every 8th byte in flattened array)
-                # We operate on a copy to avoid read-only issues
-                flat_data = data.flatten()
-                # Set every 8th byte to 0 (simulating bit-rot/watermark without destroying image)
-                # Using a small offset to avoid header corruption if we were doing raw binary
-                # But here we are working on pixel data, so it's safe visual noise
-                flat_data[::8] = 0
-                
-                # Reshape back to original dimensions
-                data_zeroed = flat_data.reshape(data.shape)
-                
-                # 2. RGB Shift (Invisible noise)
-                # Add slight random noise to Blue channel (least sensitive to human eye)
-                noise = np.random.randint(0, 2, data_zeroed.shape, dtype='uint8')
-                # Only apply to Blue channel (index 2)
-                data_zeroed[:, :, 2] = np.bitwise_xor(data_zeroed[:, :, 2], noise[:, :, 2])
+                data = np.array(img.convert('RGB'))
+                BinaryEngine.zero_out_array(data, seed, threads)
 
-                # Create protected image
-                protected_img = Image.fromarray(data_zeroed)
-                
                 # Save with original format and metadata
-                protected_img.save(protected_path, quality=95, **info)
+                encode_image(Image.fromarray(data), protected_path, info, source_format=img.format)
                 
             return protected_path
         except Exception as e:
             raise Exception(f"Binary manipulation failed: {str(e)}")
 
+    @staticmethod
+    def zero_out_array(data: np.ndarray, seed: Optional[int] = None, threads: int = 1) -> np.ndarray:
+        """
+        Applies zero-out manipulation and RGB shift in place on a decoded image.
+        Args:
+            data (np.ndarray): C-contiguous uint8 RGB array of shape (height, width, 3).
+            seed (Optional[int]): Noise seed; a random one is drawn if omitted.
+            threads (int): Process horizontal strips on this many threads. The
+                output is the same for any thread count.
+        Returns:
+            np.ndarray: The same array, modified in place.
+        """
+        if seed is None:
+            seed = new_seed()
+        if threads <= 1:
+            return BinaryEngine.zero_out_strip(data, 0, seed)
+        map_chunks(lambda y0, y1: BinaryEngine.zero_out_strip(data[y0:y1], y0, seed), row_chunks(data.shape[0]), threads)
+        return data
+
+    @staticmethod
+    def zero_out_strip(strip: np.ndarray, row_offset: int, seed: int) -> np.ndarray:
+        """
+        Applies zero-out manipulation and RGB shift in place on a horizontal
+        strip of an image. Processing an image strip by strip gives exactly the
+        same bytes as processing it whole, whatever the strip heights.
+        Args:
+            strip (np.ndarray): C-contiguous uint8 rows (rows, width, 3) of the image.
+            row_offset (int): Index of the strip's first row in the full image.
+            seed (int): Noise seed for the whole image.
+        Returns:
+            np.ndarray: The same strip, modified in place.
+        """
+        rows, width, channels = strip.shape
+
+        # 1. Zero-out strategic bytes (every 8th byte in the image's flattened array)
+        # reshape(-1) is a view on a contiguous array, so this writes through
+        # Set every 8th byte to 0 (simulating bit-rot/watermark without destroying image)
+        first_byte = row_offset * width * channels
+        flat_data = strip.reshape(-1)
+        flat_data[(-first_byte) % 8::8] = 0
+
+        # 2. RGB Shift (Invisible noise)
+        # Add slight random noise to Blue channel (least sensitive to human eye)
+        noise = noise_bits(seed, row_offset * width, rows * width).reshape(rows, width)
+        np.bitwise_xor(strip[:, :, 2], noise, out=strip[:, :, 2])
+        return strip
+
     @staticmethod
     def validate_image_integrity(original_path: str, protected_path: str) -> bool:
         """
@@ -84,22 +115,45 @@ class BinaryEngine:
             float: Manipulation score (0-100%).
         """
         try:
-            img1 = Image.open(original_path).convert('RGB')
-            img2 = Image.open(protected_path).convert('RGB')
-            
-            arr1 = np.array(img1)
-            arr2 = np.array(img2)
+            with Image.open(original_path) as img1, Image.open(protected_path) as img2:
+                arr1 = np.asarray(img1.convert('RGB'))
+                arr2 = np.asarray(img2.convert('RGB'))
             
             if arr1.shape != arr2.shape:
                 return 0.0
                 
-            # Calculate mean squared error
-            mse = np.mean((arr1 - arr2) ** 2)
-            
-            # Normalize to a score (heuristic)
+            # Normalize the mean squared error to a score (heuristic)
             # A small MSE implies subtle changes (good for invisible protection)
             # We want to return a score indicating "effectiveness" of change
-            score = min(100.0, mse * 10) 
-            return float(score)
+            return compute_metrics(arr1, arr2).manipulation_score
         except Exception:
             return 0.0
+
+
+def new_seed() -> int:
+    """Draws a fresh 64-bit noise seed from the OS entropy pool."""
+    return int(np.random.SeedSequence().generate_state(1, dtype=np.uint64)[0])
+
+def noise_bits(seed: int, start: int, count: int) -> np.ndarray:
+    """
+    Returns bits ``start .. start + count`` of the noise stream for ``seed``,
+    one 0/1 uint8 per pixel.
+
+    The stream is the raw 64-bit output of a PCG64 generator unpacked into bits.
+    PCG64 can jump ahead in O(log n), so any window of the stream can be produced
+    on its own: a strip only generates its own bits, never the whole frame's.
+    Args:
+        seed (int): Noise seed.
+        start (int): Index of the first pixel (row * width + column).
+        count (int): Number of pixels.
+    Returns:
+        np.ndarray: uint8 array of ``count`` bits.
+    """
+    first_word = start // 64
+    last_word = (start + count + 63) // 64
+    bit_generator = np.random.PCG64(seed)
+    bit_generator.advance(first_word)
+    words = bit_generator.random_raw(last_word - first_word)
+    bits = np.unpackbits(words.view(np.uint8), bitorder='little')
+    skip = start - first_word * 64
+    return bits[skip:skip + count]
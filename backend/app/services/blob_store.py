@@ -0,0 +1,294 @@
+import asyncio
+import errno
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+_SAFE_EXT = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+T = TypeVar("T")
+
+def normalize_ext(ext: str) -> str:
+    """Lower-cases a file extension; anything unusual is dropped."""
+    return ext.lower() if _SAFE_EXT.match(ext or "") else ""
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _prepare(db_path: str, schema: str) -> None:
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with closing(_connect(db_path)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(schema)
+
+def _move_into_place(source: str, destination: str) -> None:
+    try:
+        os.replace(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # tmp_dir is on another filesystem (e.g. the store is a mounted
+        # volume): copy next to the destination, then rename atomically
+        partial = destination + ".part"
+        shutil.copyfile(source, partial)
+        os.replace(partial, destination)
+        os.remove(source)
+
+async def store_call(function: Callable[..., T], *args: Any, undo: Optional[Callable[[T], Any]] = None) -> T:
+    """
+    Runs a blocking store operation (a refcount transaction that may wait for
+    other processes' locks, a file move) in a thread, keeping it off the
+    event loop. The operation always runs to the end, even when the caller is
+    cancelled meanwhile, so refcounts never depend on where a request was
+    interrupted; ``undo`` is then called with its result, also in a thread,
+    to give back what it took.
+    Args:
+        function (Callable): The store method, e.g. ``upload_store.adopt``.
+        args: Its arguments.
+        undo (Optional[Callable]): Reverts the operation for a caller that
+            is gone, e.g. releasing the reference an adopt() took.
+    Returns:
+        T: The operation's result.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(None, lambda: function(*args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if undo is not None:
+            def revert(done: asyncio.Future) -> None:
+                if not done.cancelled() and done.exception() is None:
+                    loop.run_in_executor(None, undo, done.result())
+            future.add_done_callback(revert)
+        raise
+
+class BlobStore:
+    """
+    Content-addressed file storage. Each file lives once at
+    ``root/ab/cd/<sha256><ext>``, however many times it was stored, with a
+    reference count in SQLite; the file is deleted when its last reference
+    is released.
+
+    Writers produce files in ``tmp_dir`` (see temp_path()), by default
+    ``<root>.tmp`` next to the store so it is never under a served root, and
+    hand them over with adopt(), which renames them into place atomically,
+    so readers never see partial files. Reference changes and renames happen inside
+    ``BEGIN IMMEDIATE`` transactions, so several app processes can share a
+    store.
+    """
+
+    def __init__(self, root: str, db_path: str, tmp_dir: Optional[str] = None):
+        self.root = root
+        self.db_path = db_path
+        # Ideally on the store's filesystem, so adopt() is a plain rename
+        self.tmp_dir = tmp_dir or os.path.normpath(root) + ".tmp"
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(root, exist_ok=True)
+        _prepare(
+            db_path,
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def relpath(self, digest: str, ext: str = "") -> str:
+        """Path of a blob relative to the store root, e.g. ``ab/cd/abcd...png``."""
+        if not _DIGEST.match(digest):
+            raise ValueError(f"Invalid digest: {digest!r}")
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{normalize_ext(ext)}"
+
+    def path(self, digest: str, ext: str = "") -> str:
+        return os.path.join(self.root, *self.relpath(digest, ext).split("/"))
+
+    def relpath_of(self, path: str) -> str:
+        """Store-relative, URL-style form of a path returned by adopt()."""
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def temp_path(self, ext: str = "") -> str:
+        """Reserves a fresh temporary file on the store's filesystem."""
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, suffix=normalize_ext(ext))
+        os.close(fd)
+        return path
+
+    def adopt(self, temp_path: str, digest: str, ext: str = "") -> str:
+        """
+        Moves a finished temporary file into the store and takes a reference
+        on it. If the blob is already stored the temporary file is discarded.
+        Args:
+            temp_path (str): File written by the caller, inside the store.
+            digest (str): SHA256 hex digest of its content.
+            ext (str): File extension to serve it with. A blob that is already
+                stored keeps the extension it was first stored with.
+        Returns:
+            str: Path of the stored blob.
+        """
+        with closing(_connect(self.db_path)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                if row is not None and os.path.exists(self.path(digest, row["ext"])):
+                    path = self.path(digest, row["ext"])
+                    os.remove(temp_path)
+                    conn.execute("UPDATE blobs SET refs = refs + 1 WHERE digest = ?", (digest,))
+                else:
+                    path = self.path(digest, ext)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    size = os.path.getsize(temp_path)
+                    _move_into_place(temp_path, path)
+                    conn.execute(
+                        "INSERT INTO blobs (digest, ext, size, refs, created_at) VALUES (?, ?, ?, 1, ?) "
+                        "ON CONFLICT(digest) DO UPDATE SET refs = refs + 1, ext = excluded.ext, size = excluded.size",
+                        (digest, normalize_ext(ext), size, time.time())
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return path
+
+    def acquire(self, digest: str) -> bool:
+        """
+        Takes another reference on a stored blob.
+        Returns:
+            bool: False if the blob is not stored (nothing is changed then).
+        """
+        with closing(_connect(self.db_path)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None or not os.path.exists(self.path(digest, row["ext"])):
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("UPDATE blobs SET refs = refs + 1 WHERE digest = ?", (digest,))
+            conn.execute("COMMIT")
+        return True
+
+    def release(self, digest: str) -> None:
+        """Drops a reference, deleting the blob once nothing refers to it."""
+        with closing(_connect(self.db_path)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT ext, refs FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return
+            if row["refs"] > 1:
+                conn.execute("UPDATE blobs SET refs = refs - 1 WHERE digest = ?", (digest,))
+            else:
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                path = self.path(digest, row["ext"])
+                if os.path.exists(path):
+                    os.remove(path)
+            conn.execute("COMMIT")
+
+    def find(self, digest: str) -> Optional[str]:
+        """Path of a stored blob, or None if it is not stored."""
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        path = self.path(digest, row["ext"])
+        return path if os.path.exists(path) else None
+
+    def refs(self, digest: str) -> int:
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute("SELECT refs FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return row["refs"] if row else 0
+
+    def sweep_tmp(self, max_age: float = 3600) -> int:
+        """
+        Deletes temporary files abandoned by crashed writers.
+        Returns:
+            int: Number of files removed.
+        """
+        removed = 0
+        cutoff = time.time() - max_age
+        # Temp files used to live in root/tmp
+        for directory in (self.tmp_dir, os.path.join(self.root, "tmp")):
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class ResultIndex:
+    """
+    Remembers the protection result for each (original hash, pipeline
+    version, level), so a re-upload of the same original is answered without
+    running the pipeline again. Bumping the pipeline version invalidates
+    every entry made by older code.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        _prepare(
+            db_path,
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                original_hash TEXT NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                level TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (original_hash, pipeline_version, level)
+            )
+            """
+        )
+
+    def get(self, original_hash: str, pipeline_version: str, level: str) -> Optional[Dict[str, Any]]:
+        with closing(_connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT result FROM results WHERE original_hash = ? AND pipeline_version = ? AND level = ?",
+                (original_hash, pipeline_version, level)
+            ).fetchone()
+        return json.loads(row["result"]) if row else None
+
+    def put(self, original_hash: str, pipeline_version: str, level: str, result: Dict[str, Any]) -> None:
+        with closing(_connect(self.db_path)) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (original_hash, pipeline_version, level, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (original_hash, pipeline_version, level, json.dumps(result), time.time())
+            )
+
+    def discard(self, original_hash: str, pipeline_version: str, level: str) -> None:
+        with closing(_connect(self.db_path)) as conn:
+            conn.execute(
+                "DELETE FROM results WHERE original_hash = ? AND pipeline_version = ? AND level = ?",
+                (original_hash, pipeline_version, level)
+            )
+
+# Originals, served only to their owner (see users.get_original), and
+# protected outputs, served publicly from /static/protected; their
+# refcounts live next to the job queue
+upload_store = BlobStore(
+    os.getenv("UPLOAD_DIR", "uploads"),
+    os.getenv("UPLOAD_STORE_DB", os.path.join("data", "uploads.sqlite3")),
+    os.getenv("UPLOAD_TMP_DIR")
+)
+protected_store = BlobStore(
+    os.getenv("PROTECTED_DIR", "protected"),
+    os.getenv("PROTECTED_STORE_DB", os.path.join("data", "protected.sqlite3")),
+    os.getenv("PROTECTED_TMP_DIR")
+)
+result_index = ResultIndex(os.getenv("PROTECTED_STORE_DB", os.path.join("data", "protected.sqlite3")))
@@ -1,10 +1,37 @@
 import hashlib
 import json
 import base64
-from typing import Tuple, Dict
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.primitives import serialization
 
+PUBLIC_KEY_CACHE_SIZE = int(os.getenv("PUBLIC_KEY_CACHE_SIZE", "4096"))
+_public_keys: "OrderedDict[str, ed25519.Ed25519PublicKey]" = OrderedDict()
+_public_keys_lock = threading.Lock()
+
+class SignatureResult(NamedTuple):
+    source: str           # The path or digest that was checked
+    digest: Optional[str] # SHA256 hex digest the signature was checked against
+    valid: bool
+    error: Optional[str]  # Why the item could not be checked, if it could not
+
+def _ordered_map(fn, items: Iterable, workers: Optional[int]) -> Iterator:
+    """Maps fn over items in a thread pool, yielding results in input order."""
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Bound the window of in-flight items so the input is consumed lazily
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 class CryptoEngine:
     @staticmethod
     def generate_key_pair() -> Tuple[str, str]:
@@ -57,7 +84,19 @@ class CryptoEngine:
         """
         # First get the hash of the content to sign (efficient for large files)
         content_hash = CryptoEngine.create_hash(file_path)
-        
+        return CryptoEngine.sign_digest(content_hash, private_key_pem)
+
+    @staticmethod
+    def sign_digest(content_hash: str, private_key_pem: str) -> str:
+        """
+        Signs an already computed SHA256 hex digest, producing the same signature
+        as sign_content() on the file it was computed from.
+        Args:
+            content_hash (str): Hex digest of the content.
+            private_key_pem (str): PEM encoded private key.
+        Returns:
+            str: Base64 encoded signature.
+        """
         # Load private key
         private_key = serialization.load_pem_private_key(
             private_key_pem.encode('utf-8'),
@@ -82,9 +121,7 @@ class CryptoEngine:
         try:
             content_hash = CryptoEngine.create_hash(file_path)
             
-            public_key = serialization.load_pem_public_key(
-                public_key_pem.encode('utf-8')
-            )
+            public_key = CryptoEngine.load_public_key(public_key_pem)
             
             signature = base64.b64decode(signature_b64)
             
@@ -93,6 +130,113 @@ class CryptoEngine:
         except Exception:
             return False
 
+    @staticmethod
+    def verify_digest(content_hash: str, signature_b64: str, public_key_pem: str) -> bool:
+        """
+        Verifies a signature made by sign_digest() over a SHA256 hex digest.
+        Args:
+            content_hash (str): Hex digest of the content.
+            signature_b64 (str): Base64 encoded signature.
+            public_key_pem (str): PEM encoded public key.
+        Returns:
+            bool: True if signature is valid, False otherwise.
+        """
+        try:
+            public_key = CryptoEngine.load_public_key(public_key_pem)
+            public_key.verify(base64.b64decode(signature_b64), content_hash.encode('utf-8'))
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def public_key_fingerprint(public_key_pem: str) -> str:
+        """SHA256 hex fingerprint of a PEM public key."""
+        return hashlib.sha256(public_key_pem.strip().encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def load_public_key(public_key_pem: str) -> ed25519.Ed25519PublicKey:
+        """
+        Parses a PEM public key, reusing keys already parsed. Keys are cached
+        by fingerprint in a bounded LRU since a few creators sign most content.
+        Args:
+            public_key_pem (str): PEM encoded public key.
+        Returns:
+            ed25519.Ed25519PublicKey: The parsed key.
+        """
+        fingerprint = CryptoEngine.public_key_fingerprint(public_key_pem)
+        with _public_keys_lock:
+            key = _public_keys.get(fingerprint)
+            if key is not None:
+                _public_keys.move_to_end(fingerprint)
+                return key
+        key = serialization.load_pem_public_key(public_key_pem.encode('utf-8'))
+        with _public_keys_lock:
+            _public_keys[fingerprint] = key
+            while len(_public_keys) > PUBLIC_KEY_CACHE_SIZE:
+                _public_keys.popitem(last=False)
+        return key
+
+    @staticmethod
+    def _check(source: str, signature_b64: str, public_key_pem: str, is_digest: bool) -> SignatureResult:
+        try:
+            digest = source if is_digest else CryptoEngine.create_hash(source)
+        except OSError as e:
+            return SignatureResult(source, None, False, str(e))
+        try:
+            public_key = CryptoEngine.load_public_key(public_key_pem)
+            signature = base64.b64decode(signature_b64)
+        except Exception as e:
+            return SignatureResult(source, digest, False, f"Malformed key or signature: {e}")
+        try:
+            public_key.verify(signature, digest.encode('utf-8'))
+            return SignatureResult(source, digest, True, None)
+        except Exception:
+            return SignatureResult(source, digest, False, None)
+
+    @staticmethod
+    def verify_many(
+        items: Iterable[Tuple[str, str, str]],
+        digests: bool = False,
+        workers: Optional[int] = None
+    ) -> Iterator[SignatureResult]:
+        """
+        Verifies many signatures, yielding one result per item in input order
+        as soon as it is ready, so millions of items can be streamed through.
+        Args:
+            items (Iterable[Tuple[str, str, str]]): (path or digest, base64
+                signature, PEM public key) for every item.
+            digests (bool): Items carry stored SHA256 hex digests; no file is
+                read at all. Otherwise items carry file paths, which are hashed
+                in parallel threads (hashlib releases the GIL).
+            workers (Optional[int]): Hashing threads; defaults to the CPU count.
+        Returns:
+            Iterator[SignatureResult]: Results in input order.
+        """
+        if digests:
+            for source, signature_b64, public_key_pem in items:
+                yield CryptoEngine._check(source, signature_b64, public_key_pem, True)
+            return
+
+        yield from _ordered_map(lambda item: CryptoEngine._check(*item, False), items, workers)
+
+    @staticmethod
+    def hash_many(paths: Iterable[str], workers: Optional[int] = None) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Hashes many files in parallel threads.
+        Args:
+            paths (Iterable[str]): Files to hash.
+            workers (Optional[int]): Hashing threads; defaults to the CPU count.
+        Returns:
+            Iterator[Tuple[str, Optional[str]]]: (path, hex digest) in input
+            order; the digest is None for files that could not be read.
+        """
+        def hash_one(path: str) -> Tuple[str, Optional[str]]:
+            try:
+                return path, CryptoEngine.create_hash(path)
+            except OSError:
+                return path, None
+        yield from _ordered_map(hash_one, paths, workers)
+
     @staticmethod
     def generate_certificate(signature_data: str, content_hash: str, public_key: str) -> str:
         """
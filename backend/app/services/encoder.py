@@ -0,0 +1,172 @@
+import os
+from PIL import Image
+from typing import Any, Dict, NamedTuple, Optional
+
+# Named trade-offs between encode time and output size. Every profile keeps
+# the protection noise intact where the format allows: lossless formats stay
+# lossless and JPEG stays at a quality where the cloak survives.
+ENCODER_PROFILES = ("fast", "balanced", "smallest")
+DEFAULT_ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "balanced")
+
+# Formats protected outputs may be transcoded to. A request asks for
+# "original" to keep the source's format whatever the default is.
+TRANSCODE_FORMATS = {"webp": "WEBP"}
+KEEP_FORMAT = "original"
+DEFAULT_TRANSCODE = os.getenv("PROTECT_OUTPUT_FORMAT", "").lower().replace(KEEP_FORMAT, "") or None
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "TIFF": ".tif", "BMP": ".bmp"}
+# Sources whose pixels are exact; a WebP made from them is lossless too
+LOSSLESS_SOURCES = frozenset({"PNG", "TIFF", "BMP"})
+
+_SETTINGS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "JPEG": {
+        "fast": {"quality": 95, "subsampling": "4:2:0"},
+        "balanced": {"quality": 95, "subsampling": "4:2:0", "optimize": True},
+        "smallest": {"quality": 90, "subsampling": "4:2:0", "optimize": True, "progressive": True}
+    },
+    "PNG": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"compress_level": 9, "optimize": True}
+    },
+    # Lossy WebP; method is the encoder's effort from 0 to 6
+    "WEBP": {
+        "fast": {"quality": 95, "method": 0},
+        "balanced": {"quality": 95, "method": 4},
+        "smallest": {"quality": 85, "method": 6}
+    },
+    # Lossless WebP; quality is the compression effort here. Effort does not
+    # grow monotonically with these on noisy protected images: quality 100
+    # at method 6 is over ten times slower than 30 for under 1% smaller files
+    "WEBP_LOSSLESS": {
+        "fast": {"lossless": True, "quality": 0, "method": 0},
+        "balanced": {"lossless": True, "quality": 10, "method": 1},
+        "smallest": {"lossless": True, "quality": 30, "method": 6}
+    },
+    "TIFF": {
+        "fast": {},
+        "balanced": {"compression": "tiff_lzw"},
+        "smallest": {"compression": "tiff_adobe_deflate"}
+    }
+}
+
+# Source metadata carried over, per output format. Everything else in
+# Image.info (JFIF density, PNG transparency of a palette that no longer
+# exists, progressive flags, ...) describes the old encoding and is dropped.
+_METADATA_KEYS = {
+    "JPEG": ("exif", "icc_profile", "dpi"),
+    "PNG": ("exif", "icc_profile", "dpi"),
+    "WEBP": ("exif", "icc_profile"),
+    "TIFF": ("exif", "icc_profile", "dpi"),
+    "BMP": ("dpi",)
+}
+
+class OutputSettings(NamedTuple):
+    profile: str = DEFAULT_ENCODER_PROFILE
+    transcode: Optional[str] = DEFAULT_TRANSCODE
+
+    @classmethod
+    def parse(cls, profile: Optional[str] = None, transcode: Optional[str] = None) -> "OutputSettings":
+        """
+        Validates request values, falling back to the configured defaults.
+        Raises:
+            ValueError: If either value is unknown.
+        """
+        profile = (profile or DEFAULT_ENCODER_PROFILE).lower()
+        if profile not in ENCODER_PROFILES:
+            raise ValueError(f"profile must be one of: {', '.join(ENCODER_PROFILES)}")
+        transcode = (transcode or DEFAULT_TRANSCODE or KEEP_FORMAT).lower()
+        if transcode == KEEP_FORMAT:
+            transcode = None
+        elif transcode not in TRANSCODE_FORMATS:
+            raise ValueError(f"output_format must be one of: {', '.join([KEEP_FORMAT, *sorted(TRANSCODE_FORMATS)])}")
+        return cls(profile, transcode)
+
+    def extension(self, source_ext: str) -> str:
+        """File extension of the protected output for a source with ``source_ext``."""
+        if self.transcode is None:
+            return source_ext
+        return EXTENSIONS[TRANSCODE_FORMATS[self.transcode]]
+
+    @property
+    def key(self) -> str:
+        """Distinguishes stored results made with different settings."""
+        return self.profile + (f"+{self.transcode}" if self.transcode else "")
+
+def format_for_path(path: str) -> str:
+    """Pillow format name Pillow would pick for ``path``'s extension."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        return Image.registered_extensions()[ext]
+    except KeyError:
+        raise ValueError(f"Unknown image extension {ext!r}")
+
+def source_extension(path: str, fmt: str) -> str:
+    """
+    Extension to store and encode a source with: ``path``'s own if Pillow
+    knows it, otherwise the usual one of ``fmt``, the format its header gave
+    (uploads may come without an extension or with an unrelated one).
+    Raises:
+        ValueError: If neither gives a known extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in Image.registered_extensions():
+        return ext
+    if fmt in EXTENSIONS:
+        return EXTENSIONS[fmt]
+    for registered, name in Image.registered_extensions().items():
+        if name == fmt:
+            return registered
+    raise ValueError(f"Unknown image extension {ext!r} for format {fmt!r}")
+
+def encoder_options(fmt: str, profile: str = DEFAULT_ENCODER_PROFILE, lossless: bool = False) -> Dict[str, Any]:
+    """
+    Format-specific encoder settings of a profile.
+    Args:
+        fmt (str): Pillow format name of the output.
+        profile (str): One of ENCODER_PROFILES.
+        lossless (bool): The source was lossless; only changes WebP output.
+    Returns:
+        Dict[str, Any]: Keyword arguments for Image.save(); empty for formats
+        without settings.
+    """
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile {profile!r}")
+    if fmt == "WEBP" and lossless:
+        fmt = "WEBP_LOSSLESS"
+    return dict(_SETTINGS.get(fmt, {}).get(profile, {}))
+
+def metadata_options(info: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+    """The EXIF, ICC profile and DPI of ``info`` that ``fmt`` can store."""
+    options = {}
+    for key in _METADATA_KEYS.get(fmt, ()):
+        value = info.get(key)
+        if value:
+            options[key] = value
+    return options
+
+def encode_image(
+    image: Image.Image,
+    destination_path: str,
+    info: Dict[str, Any],
+    profile: str = DEFAULT_ENCODER_PROFILE,
+    source_format: Optional[str] = None
+) -> str:
+    """
+    Encodes an image with a profile's settings, keeping the source's EXIF,
+    ICC profile and DPI.
+    Args:
+        image (Image.Image): The image to write.
+        destination_path (str): Output path; the format follows its extension.
+        info (Dict[str, Any]): Source metadata (Image.info).
+        profile (str): One of ENCODER_PROFILES.
+        source_format (Optional[str]): Pillow format of the source, so WebP
+            made from a lossless source stays lossless.
+    Returns:
+        str: The destination path.
+    """
+    fmt = format_for_path(destination_path)
+    options = encoder_options(fmt, profile, lossless=source_format in LOSSLESS_SOURCES)
+    options.update(metadata_options(info, fmt))
+    image.save(destination_path, format=fmt, **options)
+    return destination_path
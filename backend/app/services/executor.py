@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor already holds its maximum number of jobs."""
+
+class JobTimeout(Exception):
+    """Raised when a job does not finish within its time budget."""
+
+class ProtectionExecutor:
+    """
+    Runs CPU-bound service calls in a process pool so the event loop stays free.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more wait
+    for a worker; anything beyond that is rejected with ExecutorSaturated instead
+    of piling up. A job that exceeds ``job_timeout`` seconds raises JobTimeout for
+    the caller. The worker keeps running it to completion (a process pool cannot
+    interrupt a task), and the slot is only released once it actually finishes so
+    the backpressure accounting stays honest.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 16, job_timeout: Optional[float] = 120.0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str = "PROTECTION", workers: int = 0, queue_depth: int = 16, timeout: float = 120) -> "ProtectionExecutor":
+        """
+        Builds an executor from <prefix>_WORKERS, <prefix>_QUEUE_DEPTH and
+        <prefix>_JOB_TIMEOUT (seconds, 0 disables the timeout), e.g.
+        PROTECTION_WORKERS. The other arguments are the defaults; 0 workers
+        means one per CPU.
+        """
+        workers = int(os.getenv(f"{prefix}_WORKERS", str(workers))) or None
+        queue_depth = int(os.getenv(f"{prefix}_QUEUE_DEPTH", str(queue_depth)))
+        timeout = float(os.getenv(f"{prefix}_JOB_TIMEOUT", str(timeout))) or None
+        return cls(max_workers=workers, max_queue=queue_depth, job_timeout=timeout)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or waiting for a worker."""
+        return self._pending
+
+    def start(self) -> None:
+        if self._pool is None:
+            # spawn avoids forking a process that holds the event loop and DB threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs ``fn(*args)`` in the pool and awaits its result.
+        Args:
+            fn (Callable): A picklable, module-level function.
+            *args: Picklable positional arguments.
+        Returns:
+            Any: The function's return value.
+        Raises:
+            ExecutorSaturated: If the running + queued job limit is reached.
+            JobTimeout: If the job exceeds the configured timeout.
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise ExecutorSaturated(f"Protection queue is full ({self.capacity} jobs)")
+            self._pending += 1
+
+        try:
+            self.start()
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            # Drops the job if it has not started yet; a running job finishes in the background
+            future.cancel()
+            raise JobTimeout(f"Protection job exceeded {self.job_timeout}s")
+
+protection_executor = ProtectionExecutor.from_env()
+# Images from image_probe.LARGE_IMAGE_PIXELS up. Few workers, each using
+# several threads per image (parallel.LARGE_PROTECTION_THREADS), so huge
+# uploads queue among themselves instead of blocking small ones.
+large_protection_executor = ProtectionExecutor.from_env("LARGE_PROTECTION", workers=1, queue_depth=4, timeout=600)
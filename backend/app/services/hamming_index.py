@@ -0,0 +1,231 @@
+import itertools
+import os
+import threading
+import time
+import numpy as np
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Codes are split into CHUNKS substrings of CHUNK_BITS bits each
+CHUNKS = 4
+CHUNK_BITS = 16
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of set bits of every element of a uint64 array."""
+    return _POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+def _chunks(codes: np.ndarray) -> List[np.ndarray]:
+    return [((codes >> np.uint64(i * CHUNK_BITS)) & np.uint64(_CHUNK_MASK)).astype(np.int64) for i in range(CHUNKS)]
+
+def _neighbours(value: int, radius: int) -> np.ndarray:
+    """Every CHUNK_BITS-bit value within ``radius`` bits of ``value``."""
+    values = [value]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), r):
+            flip = 0
+            for bit in bits:
+                flip |= 1 << bit
+            values.append(value ^ flip)
+    return np.array(values, dtype=np.int64)
+
+class _Tables(NamedTuple):
+    codes: np.ndarray
+    orders: List[np.ndarray]
+    offsets: List[np.ndarray]
+
+def _build(codes: np.ndarray) -> _Tables:
+    orders = []
+    offsets = []
+    for chunk in _chunks(codes):
+        order = np.argsort(chunk, kind="stable").astype(np.int64)
+        counts = np.bincount(chunk, minlength=1 << CHUNK_BITS)
+        orders.append(order)
+        offsets.append(np.concatenate([[0], np.cumsum(counts)]))
+    return _Tables(codes, orders, offsets)
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit codes. Each code is split into four 16-bit
+    chunks with one table per chunk; two codes within distance r agree to
+    within r // 4 bits on at least one chunk, so a query only probes the
+    buckets near its own chunks and checks those candidates exactly instead
+    of scanning every code.
+
+    Tables are stored compactly (CSR: codes sorted per chunk plus bucket
+    offsets), about 24 bytes per code. Codes added after the last build go to
+    a small pending buffer that is scanned linearly and merged once it grows.
+
+    Safe to use from several threads: merges build the new tables aside and
+    swap them in, so searches never wait for a build and can run on the
+    event loop while a thread merges.
+    """
+
+    def __init__(self, merge_threshold: int = 4096):
+        self.merge_threshold = merge_threshold
+        self._ids: List[str] = []
+        self._tables = _build(np.empty(0, dtype=np.uint64))
+        self._pending_codes: List[int] = []
+        # Guards the fields above; _build_lock lets one merge run at a time
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tables.codes) + len(self._pending_codes)
+
+    def add(self, content_id: str, code: int, merge: bool = True) -> None:
+        """
+        Adds a code. With ``merge`` off it stays pending, searchable but
+        scanned linearly, until the next merge(); for callers that must not
+        spend a rebuild's time, e.g. on the event loop.
+        """
+        with self._lock:
+            self._ids.append(content_id)
+            self._pending_codes.append(code)
+        if merge:
+            self.merge(force=False)
+
+    def add_many(self, entries: Iterable[Tuple[str, int]], merge: bool = True) -> None:
+        with self._lock:
+            for content_id, code in entries:
+                self._ids.append(content_id)
+                self._pending_codes.append(code)
+        if merge:
+            self.merge()
+
+    def clear(self) -> None:
+        with self._build_lock, self._lock:
+            self._ids = []
+            self._tables = _build(np.empty(0, dtype=np.uint64))
+            self._pending_codes = []
+
+    def merge(self, force: bool = True) -> None:
+        """
+        Rebuilds the tables with the pending codes; unless ``force`` is set,
+        only once there are enough of them to be worth it.
+        """
+        with self._build_lock:
+            with self._lock:
+                tables = self._tables
+                count = len(self._pending_codes)
+                if not count or (not force and count < max(self.merge_threshold, len(tables.codes) // 8)):
+                    return
+                pending = np.array(self._pending_codes[:count], dtype=np.uint64)
+            # The slow part, done without holding up searches and adds
+            built = _build(np.concatenate([tables.codes, pending]))
+            with self._lock:
+                self._tables = built
+                del self._pending_codes[:count]
+
+    @staticmethod
+    def _candidates(tables: _Tables, code: int, radius: int) -> np.ndarray:
+        chunk_radius = radius // CHUNKS
+        found = []
+        for i in range(CHUNKS):
+            probes = _neighbours((code >> (i * CHUNK_BITS)) & _CHUNK_MASK, chunk_radius)
+            starts = tables.offsets[i][probes]
+            lengths = tables.offsets[i][probes + 1] - starts
+            total = int(lengths.sum())
+            if total:
+                # Concatenate the bucket slices without a Python loop
+                positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+                found.append(tables.orders[i][positions])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def search(self, code: int, max_distance: int = 10, limit: Optional[int] = 10) -> List[Tuple[str, int]]:
+        """
+        Finds stored codes within ``max_distance`` bits of ``code``.
+        Args:
+            code (int): 64-bit query code.
+            max_distance (int): Maximum Hamming distance.
+            limit (Optional[int]): Maximum number of matches; None returns all.
+        Returns:
+            List[Tuple[str, int]]: (content_id, distance), nearest first.
+        """
+        with self._lock:
+            # Ids are only appended to, so positions stay valid after the lock
+            ids, tables = self._ids, self._tables
+            pending = np.array(self._pending_codes, dtype=np.uint64)
+        query = np.uint64(code)
+        indexes = self._candidates(tables, code, max_distance)
+        distances = popcount(tables.codes[indexes] ^ query)
+
+        if len(pending):
+            indexes = np.concatenate([indexes, np.arange(len(tables.codes), len(tables.codes) + len(pending))])
+            distances = np.concatenate([distances, popcount(pending ^ query)])
+
+        keep = distances <= max_distance
+        indexes, distances = indexes[keep], distances[keep]
+        # Stable sort keeps ties in insertion order
+        ranked = np.argsort(distances, kind="stable")[:limit]
+        return [(ids[indexes[i]], int(distances[i])) for i in ranked]
+
+class IndexSync:
+    """
+    Keeps one process's HammingIndex in step with the contents every process
+    sharing the database adds. Refreshes fetch contents by creation time;
+    since rows can commit a while after their timestamp and hosts' clocks
+    differ, each one looks back ``overlap`` seconds before the newest
+    timestamp seen and skips the ids already indexed in that window.
+    """
+
+    def __init__(self, index: HammingIndex, overlap: float = 60.0):
+        self.index = index
+        self.overlap = overlap
+        self.watermark: Optional[float] = None
+        # Ids indexed with a creation time inside the overlap window
+        self._recent: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def since(self) -> Optional[float]:
+        """Creation time the next refresh starts from; None to fetch everything."""
+        with self._lock:
+            return None if self.watermark is None else self.watermark - self.overlap
+
+    def reset(self) -> None:
+        with self._lock:
+            self.index.clear()
+            self.watermark = None
+            self._recent = {}
+
+    def add_rows(self, rows: Iterable[Tuple[str, int, float]], merge: bool = True) -> int:
+        """
+        Indexes (content_id, code, created_at epoch seconds) rows from the
+        database, skipping ids indexed already.
+        Returns:
+            int: Number of rows added.
+        """
+        entries = []
+        with self._lock:
+            for content_id, code, created_at in rows:
+                if content_id in self._recent:
+                    continue
+                self._recent[content_id] = created_at
+                entries.append((content_id, code))
+                if self.watermark is None or created_at > self.watermark:
+                    self.watermark = created_at
+            if self.watermark is not None:
+                # Older rows fall before every later refresh's window
+                cutoff = self.watermark - self.overlap
+                self._recent = {content_id: created for content_id, created in self._recent.items() if created >= cutoff}
+        self.index.add_many(entries, merge=False)
+        if merge:
+            self.index.merge(force=False)
+        return len(entries)
+
+    def add_local(self, content_id: str, code: int) -> None:
+        """Indexes content this process just created; left pending for the next merge."""
+        with self._lock:
+            if content_id in self._recent:
+                return
+            self._recent[content_id] = time.time()
+        self.index.add(content_id, code, merge=False)
+
+# Shared index of every content's perceptual hash, loaded at startup and
+# refreshed from the database (see verify.refresh_phash_index)
+phash_index = HammingIndex(merge_threshold=int(os.getenv("PHASH_INDEX_MERGE_THRESHOLD", "4096")))
+phash_sync = IndexSync(phash_index, overlap=float(os.getenv("PHASH_REFRESH_OVERLAP", "60")))
@@ -0,0 +1,131 @@
+import os
+import warnings
+from PIL import Image, UnidentifiedImageError
+from typing import NamedTuple, Optional, FrozenSet
+from app.services.cloaking_engine import CloakingEngine
+from app.services.protection_pipeline import ImageTooLarge
+
+# Container formats the pipeline decodes and re-encodes faithfully
+SUPPORTED_FORMATS = frozenset(
+    name.strip().upper() for name in os.getenv("PROTECT_FORMATS", "JPEG,PNG,WEBP,TIFF,BMP").split(",") if name.strip()
+)
+# Pixel modes that convert to RGB without loss of meaning
+SUPPORTED_MODES = frozenset({"1", "L", "LA", "P", "PA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr", "I", "I;16", "F"})
+
+MAX_IMAGE_PIXELS = int(float(os.getenv("MAX_IMAGE_MEGAPIXELS", "100")) * 1_000_000)
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "30000"))
+
+# Images at or above this size go to the large-image pool and are processed
+# in strips, so a few huge uploads cannot hold up the many small ones
+LARGE_IMAGE_PIXELS = int(float(os.getenv("LARGE_IMAGE_MEGAPIXELS", "16")) * 1_000_000)
+# A multiple of parallel.CHUNK_ROWS
+LARGE_IMAGE_TILE_ROWS = int(os.getenv("LARGE_IMAGE_TILE_ROWS", "1024"))
+
+# How far from the end of a file its end marker may sit; cameras and
+# editors append trailers after the image data
+_TAIL_BYTES = 64 * 1024
+_END_MARKERS = {"JPEG": b"\xff\xd9", "PNG": b"IEND"}
+
+_EXIF_ORIENTATION = 0x0112
+
+class UnsupportedImage(Exception):
+    """Raised when an upload is not an image the pipeline can protect."""
+
+class ImageProbe(NamedTuple):
+    format: str
+    width: int
+    height: int
+    mode: str
+    frames: int
+    orientation: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+class ProtectionPlan(NamedTuple):
+    level: str
+    tile_rows: Optional[int]
+    large: bool
+
+def _truncated(path: str, image_format: str) -> bool:
+    marker = _END_MARKERS.get(image_format)
+    if marker is None:
+        return False
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - _TAIL_BYTES))
+        return marker not in f.read()
+
+def probe_image(
+    path: str,
+    max_pixels: int = MAX_IMAGE_PIXELS,
+    max_dimension: int = MAX_IMAGE_DIMENSION,
+    formats: FrozenSet[str] = SUPPORTED_FORMATS
+) -> ImageProbe:
+    """
+    Reads an image's container header without decoding any pixels and checks
+    that the pipeline can protect it.
+    Args:
+        path (str): Path to the uploaded file.
+        max_pixels (int): Largest accepted width * height.
+        max_dimension (int): Largest accepted width or height.
+        formats (FrozenSet[str]): Accepted Pillow format names.
+    Returns:
+        ImageProbe: (format, width, height, mode, frames, EXIF orientation)
+    Raises:
+        UnsupportedImage: If the file is not an image, is in an unsupported
+            format or mode, has several frames, or is visibly truncated.
+        ImageTooLarge: If its dimensions exceed the limits, including
+            decompression bombs.
+    """
+    try:
+        with warnings.catch_warnings():
+            # The limits below replace Pillow's bomb warning
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(path) as img:
+                probe = ImageProbe(
+                    format=img.format or "",
+                    width=img.width,
+                    height=img.height,
+                    mode=img.mode,
+                    frames=getattr(img, "n_frames", 1),
+                    orientation=int(img.getexif().get(_EXIF_ORIENTATION, 1) or 1)
+                )
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except UnidentifiedImageError:
+        # Pillow's message would name the server-side path
+        raise UnsupportedImage("Not a recognised image file")
+    except (OSError, SyntaxError, ValueError) as e:
+        raise UnsupportedImage(f"Not a readable image: {e}")
+
+    if probe.format not in formats:
+        raise UnsupportedImage(f"Unsupported image format {probe.format or 'unknown'}; expected one of: {', '.join(sorted(formats))}")
+    if probe.mode not in SUPPORTED_MODES:
+        raise UnsupportedImage(f"Unsupported pixel mode {probe.mode}")
+    if probe.frames > 1:
+        raise UnsupportedImage("Animated and multi-page images are not supported")
+    if probe.width < 1 or probe.height < 1:
+        raise UnsupportedImage("Image has no pixels")
+    if probe.width > max_dimension or probe.height > max_dimension:
+        raise ImageTooLarge(f"{probe.width}x{probe.height} image exceeds the {max_dimension} pixel side limit")
+    if probe.pixels > max_pixels:
+        raise ImageTooLarge(f"{probe.width}x{probe.height} image exceeds the {max_pixels} pixel limit")
+    if _truncated(path, probe.format):
+        raise UnsupportedImage(f"Truncated {probe.format} file")
+    return probe
+
+def plan_protection(probe: ImageProbe, large_pixels: int = LARGE_IMAGE_PIXELS) -> ProtectionPlan:
+    """
+    Picks the cloaking level, strip size and worker pool for a probed image.
+    Args:
+        probe (ImageProbe): The image's header.
+        large_pixels (int): Size from which an image counts as large.
+    Returns:
+        ProtectionPlan: (level, rows per strip or None for untiled, whether
+        to use the large-image pool)
+    """
+    level = CloakingEngine.optimize_cloaking_parameters((probe.width, probe.height))
+    large = probe.pixels >= large_pixels
+    return ProtectionPlan(level, LARGE_IMAGE_TILE_ROWS if large else None, large)
@@ -0,0 +1,49 @@
+import hashlib
+import os
+import aiofiles
+from typing import NamedTuple
+from fastapi import UploadFile
+
+# 1 MiB reads keep memory flat while still amortising the per-chunk overhead
+CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+class IngestedFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+async def ingest_upload(upload: UploadFile, destination: str, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> IngestedFile:
+    """
+    Streams an upload to disk while hashing it, so later stages never have to
+    re-read the original bytes to get its SHA-256.
+    Args:
+        upload (UploadFile): The incoming file.
+        destination (str): Path to write the upload to.
+        max_bytes (int): Maximum accepted size; larger uploads are aborted.
+        chunk_size (int): Read size per iteration.
+    Returns:
+        IngestedFile: (path, hex SHA-256 digest, size in bytes)
+    Raises:
+        UploadTooLarge: If the upload exceeds ``max_bytes``. Nothing is left on disk.
+    """
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(destination, "wb") as buffer:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+                sha256_hash.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    return IngestedFile(destination, sha256_hash.hexdigest(), size)
@@ -0,0 +1,387 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import closing
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class JobQueue:
+    """
+    A small persistent job queue backed by SQLite.
+
+    Every operation opens its own short-lived connection and claims are done
+    inside ``BEGIN IMMEDIATE`` transactions, so several app processes can drain
+    the same queue file safely. Jobs survive restarts; anything left running by
+    a crashed process is put back in the queue by recover().
+
+    Every claim gets a fresh token. Updates made with it only apply while the
+    job is still held under that token, so a process whose job was recovered
+    and handed to someone else can no longer move it forward.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    callback_url TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                # Queue files created before jobs recorded who submitted them
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            if "claim" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN claim TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_owner ON jobs (status, owner, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, payload: Dict[str, Any], callback_url: Optional[str] = None, owner: Optional[str] = None) -> str:
+        """
+        Adds a job to the queue.
+        Args:
+            payload (Dict[str, Any]): JSON-serialisable job arguments.
+            callback_url (Optional[str]): URL to POST the finished job to.
+            owner (Optional[str]): Who submitted it; claim() shares the
+                workers between owners.
+        Returns:
+            str: The new job id.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, payload, callback_url, owner, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, JOB_QUEUED, json.dumps(payload), callback_url, owner, now, now)
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically takes a queued job and marks it running: the oldest job of
+        the owner with the fewest jobs running, so one owner's backlog does
+        not hold up everyone who queued after it.
+        Returns:
+            Optional[Dict[str, Any]]: The claimed job, or None if the queue is
+            empty. Its ``claim`` token goes with every later update.
+        """
+        claim = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ("
+                " SELECT q.id FROM jobs q WHERE q.status = ?"
+                " AND q.created_at = (SELECT MIN(created_at) FROM jobs h WHERE h.status = q.status AND h.owner IS q.owner)"
+                " ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.status = ? AND r.owner IS q.owner), q.created_at LIMIT 1"
+                ")",
+                (JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, attempts = attempts + 1, claim = ?, updated_at = ? WHERE id = ?",
+                (JOB_RUNNING, "starting", claim, time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        job = self._to_dict(row)
+        job["status"] = JOB_RUNNING
+        job["claim"] = claim
+        return job
+
+    def _update(self, job_id: str, claim: Optional[str], assignments: str, values: tuple) -> bool:
+        # Without a claim token the update applies whoever holds the job
+        query = f"UPDATE jobs SET {assignments + ', ' if assignments else ''}updated_at = ? WHERE id = ?"
+        params = (*values, time.time(), job_id)
+        if claim is not None:
+            query += " AND claim = ? AND status = ?"
+            params += (claim, JOB_RUNNING)
+        with closing(self._connect()) as conn:
+            return conn.execute(query, params).rowcount > 0
+
+    def update_progress(self, job_id: str, stage: str, progress: float, claim: Optional[str] = None) -> bool:
+        """
+        Records the job's current stage; also keeps it from looking stale.
+        Returns:
+            bool: False if ``claim`` no longer holds the job.
+        """
+        return self._update(job_id, claim, "stage = ?, progress = ?", (stage, progress))
+
+    def heartbeat(self, job_id: str, claim: Optional[str] = None) -> bool:
+        """
+        Marks a job as still being worked on, without changing its progress.
+        Returns:
+            bool: False if ``claim`` no longer holds the job.
+        """
+        return self._update(job_id, claim, "", ())
+
+    def complete(self, job_id: str, result: Dict[str, Any], claim: Optional[str] = None) -> bool:
+        return self._update(
+            job_id, claim, "status = ?, stage = ?, progress = 1, result = ?, error = NULL",
+            (JOB_SUCCEEDED, "done", json.dumps(result, default=str))
+        )
+
+    def fail(self, job_id: str, error: str, claim: Optional[str] = None) -> bool:
+        return self._update(job_id, claim, "status = ?, stage = ?, error = ?", (JOB_FAILED, "failed", error))
+
+    def requeue(self, job_id: str, claim: Optional[str] = None) -> bool:
+        """Puts a claimed job back at its original position in the queue."""
+        return self._update(
+            job_id, claim, "status = ?, stage = ?, progress = 0, claim = NULL",
+            (JOB_QUEUED, JOB_QUEUED)
+        )
+
+    def recover(self, stale_after: float = 0) -> int:
+        """
+        Requeues running jobs that have not been updated for ``stale_after``
+        seconds, e.g. after a crash. Their claim tokens stop working.
+        Returns:
+            int: Number of jobs requeued.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, claim = NULL WHERE status = ? AND updated_at <= ?",
+                (JOB_QUEUED, JOB_QUEUED, JOB_RUNNING, time.time() - stale_after)
+            )
+            return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def count(self, status: str = JOB_QUEUED) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def count_by_owner(self, status: str = JOB_QUEUED) -> Dict[Optional[str], int]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT owner, COUNT(*) FROM jobs WHERE status = ? GROUP BY owner", (status,)).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+class RequeueJob(Exception):
+    """Raised by a job handler to put the job back in the queue and retry later."""
+
+class JobClaimLost(Exception):
+    """Raised when a job was recovered and claimed again while still being worked on."""
+
+class JobWorker:
+    """
+    Drains a JobQueue with a fixed number of concurrent asyncio consumers.
+
+    The handler coroutine does the actual work (typically awaiting the process
+    pool), so ``concurrency`` should match the number of pool workers. While
+    it runs, the job's row is touched every ``heartbeat_interval`` seconds
+    (a third of ``stale_after`` by default), so jobs waiting a long time for
+    a worker or in one are not taken for abandoned by recover(). A handler
+    raising JobClaimLost leaves the job to whoever holds it now.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: int = 1,
+        poll_interval: float = 1.0,
+        stale_after: float = 300.0,
+        heartbeat_interval: Optional[float] = None
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval or stale_after / 3
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def notify(self) -> None:
+        """Wakes idle consumers right away instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        # Only reclaim jobs idle long enough that no other live process can own them
+        self.queue.recover(self.stale_after)
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # Queue calls run in threads: other processes' transactions can keep
+    # them waiting for the database lock
+
+    async def _consume(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def _heartbeat(self, job: Dict[str, Any]) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if not await asyncio.to_thread(self.queue.heartbeat, job["id"], job["claim"]):
+                # Recovered by another process; the handler finds out at its
+                # next progress update
+                return
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(job)
+        except JobClaimLost:
+            logger.warning("Job %s was taken over by another worker", job["id"])
+            return
+        except RequeueJob:
+            await asyncio.to_thread(self.queue.requeue, job["id"], job["claim"])
+            await asyncio.sleep(self.poll_interval)
+            return
+        except asyncio.CancelledError:
+            # Shutting down; a blocking call, but cancellation must not skip it
+            self.queue.requeue(job["id"], job["claim"])
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job["id"])
+            done = await asyncio.to_thread(self.queue.fail, job["id"], getattr(e, "detail", None) or str(e), job["claim"])
+        else:
+            done = await asyncio.to_thread(self.queue.complete, job["id"], result, job["claim"])
+        finally:
+            heartbeat.cancel()
+
+        if not done:
+            logger.warning("Job %s was taken over by another worker", job["id"])
+            return
+        if job.get("callback_url"):
+            await asyncio.to_thread(lambda: send_callback(job["callback_url"], self.queue.get(job["id"])))
+
+class InvalidCallbackURL(ValueError):
+    """Raised for callback URLs the server must not call."""
+
+def _public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # Not private, loopback, link-local (cloud metadata), reserved or shared
+    return ip.is_global and not ip.is_multicast
+
+def validate_callback_url(url: str, resolve: Callable[..., Any] = socket.getaddrinfo) -> str:
+    """
+    Checks that a client-provided callback URL is http(s) and that every
+    address its host resolves to is public, so callbacks cannot reach
+    internal services. Blocks on DNS.
+    Returns:
+        str: The URL.
+    Raises:
+        InvalidCallbackURL: If it is not.
+    """
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        raise InvalidCallbackURL("callback_url is not a valid URL")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidCallbackURL("callback_url must be an http or https URL")
+    try:
+        infos = resolve(parts.hostname, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise InvalidCallbackURL(f"callback_url host {parts.hostname} does not resolve")
+    addresses = {info[4][0] for info in infos}
+    if not addresses or not all(_public_address(address) for address in addresses):
+        raise InvalidCallbackURL("callback_url must point to a public address")
+    return url
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    # A redirect could lead to an internal address; 3xx fails the callback
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+_callback_opener = urllib.request.build_opener(_NoRedirects)
+
+def send_callback(url: str, job: Dict[str, Any], timeout: float = 10.0) -> bool:
+    """
+    POSTs the finished job as JSON to a client-provided URL. Best effort:
+    failures are logged and never affect the job itself. The URL is
+    checked again before sending, since its DNS may have changed since the
+    job was queued, and redirects are not followed.
+    Returns:
+        bool: True if the callback was accepted with a 2xx response.
+    """
+    body = json.dumps(job_status(job), default=str).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        validate_callback_url(url)
+        with _callback_opener.open(request, timeout=timeout) as response:
+            return 200 <= response.status < 300
+    except Exception as e:
+        logger.warning("Callback to %s for job %s failed: %s", url, job["id"], e)
+        return False
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job, without its internal payload."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
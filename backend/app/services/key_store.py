@@ -0,0 +1,143 @@
+import base64
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives import serialization
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class SigningKeyMissing(Exception):
+    """The user already has a registered public key but its private key is not in this store."""
+
+class KeyStore:
+    """
+    Keeps one Ed25519 signing key per user, encrypted at rest as a PKCS8 PEM
+    file under ``directory``, and a bounded LRU of already-parsed keys so
+    signing an upload needs neither keygen nor PEM parsing.
+
+    Key files are written to a temporary file and hard-linked into place, so
+    concurrent workers racing to create a user's key agree on one of them.
+    That only holds when every host sees the same ``directory``: public keys
+    are registered in the shared database, so KEYSTORE_DIR must be shared
+    storage (e.g. a network volume) when the API runs on more than one host.
+    """
+
+    def __init__(self, directory: str, secret: str, cache_size: int = 1024):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._encryption = secret.encode('utf-8')
+        self._keys: "OrderedDict[str, ed25519.Ed25519PrivateKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, user_id: str) -> str:
+        if not _SAFE_ID.match(user_id):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.directory, f"{user_id}.pem")
+
+    def _cached(self, user_id: str) -> Optional[ed25519.Ed25519PrivateKey]:
+        with self._lock:
+            key = self._keys.get(user_id)
+            if key is not None:
+                self._keys.move_to_end(user_id)
+            return key
+
+    def _remember(self, user_id: str, key: ed25519.Ed25519PrivateKey) -> None:
+        with self._lock:
+            self._keys[user_id] = key
+            self._keys.move_to_end(user_id)
+            while len(self._keys) > self.cache_size:
+                self._keys.popitem(last=False)
+
+    def _load(self, path: str) -> ed25519.Ed25519PrivateKey:
+        with open(path, "rb") as f:
+            return serialization.load_pem_private_key(f.read(), password=self._encryption)
+
+    def _create(self, path: str) -> ed25519.Ed25519PrivateKey:
+        key = ed25519.Ed25519PrivateKey.generate()
+        pem = key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.BestAvailableEncryption(self._encryption)
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pem)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                # Fails if another worker created the key first; use theirs
+                os.link(tmp_path, path)
+            except FileExistsError:
+                return self._load(path)
+        finally:
+            os.remove(tmp_path)
+        return key
+
+    def private_key(self, user_id: str, registered_public_key: Optional[str] = None) -> ed25519.Ed25519PrivateKey:
+        """
+        Returns the user's signing key, creating and storing one on first use.
+        Args:
+            user_id (str): The user's id.
+            registered_public_key (Optional[str]): The public key already on
+                record for the user, if any.
+        Returns:
+            ed25519.Ed25519PrivateKey: The parsed key.
+        Raises:
+            SigningKeyMissing: If the user has a registered public key but no
+                key file here; a new key would silently replace theirs.
+        """
+        key = self._cached(user_id)
+        if key is None:
+            path = self.path(user_id)
+            if os.path.exists(path):
+                key = self._load(path)
+            elif registered_public_key:
+                raise SigningKeyMissing(
+                    f"Signing key for user {user_id} is registered but missing from {self.directory}; "
+                    "KEYSTORE_DIR must be storage shared by every API host"
+                )
+            else:
+                key = self._create(path)
+            self._remember(user_id, key)
+        return key
+
+    def public_key_pem(self, user_id: str, registered_public_key: Optional[str] = None) -> str:
+        """Returns the PEM encoded public key matching the user's signing key."""
+        return self.private_key(user_id, registered_public_key).public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
+
+    def sign_digest(self, user_id: str, content_hash: str) -> str:
+        """
+        Signs a SHA256 hex digest with the user's key. The signature matches
+        CryptoEngine.sign_digest() for the same key.
+        Args:
+            user_id (str): The user's id.
+            content_hash (str): Hex digest of the content.
+        Returns:
+            str: Base64 encoded signature.
+        """
+        signature = self.private_key(user_id).sign(content_hash.encode('utf-8'))
+        return base64.b64encode(signature).decode('utf-8')
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._keys.clear()
+
+# Encrypts every signing key at rest; a built-in default would protect nothing
+KEYSTORE_SECRET = os.getenv("KEYSTORE_SECRET")
+if not KEYSTORE_SECRET:
+    raise RuntimeError("KEYSTORE_SECRET must be set, e.g. to the output of `openssl rand -base64 32`")
+
+key_store = KeyStore(
+    directory=os.getenv("KEYSTORE_DIR", os.path.join("data", "keys")),
+    secret=KEYSTORE_SECRET,
+    cache_size=int(os.getenv("KEYSTORE_CACHE_SIZE", "1024"))
+)
@@ -0,0 +1,292 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Set METRICS_ENABLED=0 to turn every instrument into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEGAPIXEL_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 12, 16, 24, 32, 50, 75, 100)
+BYTE_BUCKETS = tuple(2 ** exp for exp in range(14, 32, 2))
+
+_NULL_CONTEXT = nullcontext()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonic total, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    """
+    Current value. Either set explicitly or, with ``function``, read at
+    scrape time, so nothing has to be updated on the hot path.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.function = function
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return self.function() if self.function is not None else self._value
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.value()
+        except Exception:
+            # A failing source (e.g. a locked queue database) skips one scrape
+            return
+        yield f"{self.name} {_format_value(value)}"
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed, cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (last one is +Inf), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def _timer(self, labels: Dict[str, str]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def time(self, **labels: str):
+        """Context manager observing the duration of its block in seconds."""
+        if not METRICS_ENABLED:
+            return _NULL_CONTEXT
+        return self._timer(labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def sum(self, **labels: str) -> float:
+        series = self._series.get(self._key(labels))
+        return series[1][0] if series else 0.0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+class StageTimings:
+    """
+    Accumulates wall time per named stage, e.g. across the strips of one
+    image. Plain floats, so the totals can be returned from a pool worker
+    and recorded by the parent process.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def _timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(name)
+
+    def add(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def merge(self, other: "StageTimings") -> None:
+        """Adds another set of totals, e.g. from a thread working on the same image."""
+        for name, seconds in other.seconds.items():
+            self.add(name, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(value, 6) for name, value in self.seconds.items()}
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "virtius_http_request_duration_seconds",
+    "HTTP request latency by route and status.",
+    ("method", "route", "status")
+)
+protect_stage_duration = registry.histogram(
+    "virtius_protect_stage_duration_seconds",
+    "Time spent in each stage of a protection request.",
+    ("stage",)
+)
+protect_megapixels = registry.histogram(
+    "virtius_protect_image_megapixels",
+    "Size of images run through the protection pipeline.",
+    buckets=MEGAPIXEL_BUCKETS
+)
+protect_bytes = registry.histogram(
+    "virtius_protect_image_bytes",
+    "File sizes of protected originals and their outputs.",
+    ("kind",),
+    buckets=BYTE_BUCKETS
+)
+protect_bytes_total = registry.counter(
+    "virtius_protect_bytes_total",
+    "Bytes of originals read and outputs written by the protection pipeline.",
+    ("kind",)
+)
+protect_encode_duration = registry.histogram(
+    "virtius_protect_encode_duration_seconds",
+    "Time spent encoding protected outputs by encoder profile and format.",
+    ("profile", "format")
+)
+protect_output_bytes = registry.histogram(
+    "virtius_protect_output_bytes",
+    "Size of protected outputs by encoder profile and format.",
+    ("profile", "format"),
+    buckets=BYTE_BUCKETS
+)
+db_query_duration = registry.histogram(
+    "virtius_db_query_duration_seconds",
+    "Prisma query latency by model and operation.",
+    ("model", "method")
+)
+password_queue_wait = registry.histogram(
+    "virtius_password_queue_wait_seconds",
+    "Time password hashing or verification waits for a worker thread.",
+    ("operation",)
+)
+password_duration = registry.histogram(
+    "virtius_password_duration_seconds",
+    "Time spent hashing or verifying a password.",
+    ("operation",)
+)
+password_rejected = registry.counter(
+    "virtius_password_rejected_total",
+    "Password operations rejected because the queue was full."
+)
+user_cache_lookups = registry.counter(
+    "virtius_user_cache_lookups_total",
+    "Authenticated user lookups by whether the cache answered them.",
+    ("result",)
+)
+admission_throttled = registry.counter(
+    "virtius_admission_throttled_total",
+    "Requests and jobs refused with 429 by the limit they hit.",
+    ("reason",)
+)
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    """Records stage totals measured elsewhere, e.g. in a pool worker."""
+    for stage, seconds in timings.items():
+        protect_stage_duration.observe(seconds, stage=stage)
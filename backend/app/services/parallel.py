@@ -0,0 +1,33 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Threads one image may use. Pool workers already run one image per
+# process, so this stays 1 unless a worker is dedicated to large images.
+PROTECTION_THREADS = int(os.getenv("PROTECTION_THREADS", "1"))
+# Threads per image in the large-image pool; 0 means one per CPU
+LARGE_PROTECTION_THREADS = int(os.getenv("LARGE_PROTECTION_THREADS", "0")) or os.cpu_count() or 1
+
+# Rows per unit of parallel work. Fixed rather than derived from the thread
+# count, so partial results are always combined the same way and the output
+# does not depend on how many threads ran. A multiple of every strip
+# alignment the stages rely on (8-row SSIM windows, 64-row measure steps).
+CHUNK_ROWS = 256
+
+def row_chunks(height: int, rows: int = CHUNK_ROWS) -> List[Tuple[int, int]]:
+    """Splits ``height`` rows into consecutive (start, stop) ranges."""
+    return [(y0, min(y0 + rows, height)) for y0 in range(0, height, rows)]
+
+def map_chunks(fn: Callable[[int, int], T], chunks: Iterable[Tuple[int, int]], threads: int = 1) -> List[T]:
+    """
+    Calls ``fn(start, stop)`` for every chunk, on up to ``threads`` threads.
+    NumPy releases the GIL inside its kernels, so chunks of one image really
+    run in parallel. Results come back in chunk order.
+    """
+    chunks = list(chunks)
+    if threads <= 1 or len(chunks) <= 1:
+        return [fn(y0, y1) for y0, y1 in chunks]
+    with ThreadPoolExecutor(max_workers=min(threads, len(chunks)), thread_name_prefix="strips") as pool:
+        return list(pool.map(lambda bounds: fn(*bounds), chunks))
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from typing import Any, Callable, Optional, Tuple
+from app.services.metrics import password_queue_wait, password_duration, password_rejected
+
+# Cost factor for new hashes. Hashes made with any other cost are replaced
+# on the user's next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+class PasswordQueueFull(Exception):
+    """Raised when too many password operations are already waiting."""
+
+def password_context(rounds: int = BCRYPT_ROUNDS) -> CryptContext:
+    # min == max == default: any other cost marks a hash as needing an update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a dedicated thread pool, so a burst of
+    logins never blocks the event loop or takes the threads that
+    asyncio.to_thread() callers share. bcrypt releases the GIL while it
+    works, so the threads run in parallel.
+
+    At most ``max_workers`` operations run at once and at most ``max_queue``
+    more wait; beyond that PasswordQueueFull is raised right away instead of
+    letting latency grow without bound. Queue wait and run time are recorded
+    per operation.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int, max_queue: int = 64):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        """
+        Builds a hasher from BCRYPT_ROUNDS, PASSWORD_WORKERS (default: up to 4,
+        leaving cores for protection work) and PASSWORD_QUEUE_DEPTH.
+        """
+        workers = int(os.getenv("PASSWORD_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+        queue_depth = int(os.getenv("PASSWORD_QUEUE_DEPTH", "64"))
+        return cls(password_context(), workers, queue_depth)
+
+    @property
+    def pending(self) -> int:
+        """Number of operations running or waiting for a thread."""
+        return self._pending
+
+    async def _run(self, operation: str, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                password_rejected.inc()
+                raise PasswordQueueFull(f"Too many password operations in progress ({self._pending})")
+            self._pending += 1
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            password_queue_wait.observe(started - submitted, operation=operation)
+            try:
+                return fn(*args)
+            finally:
+                password_duration.observe(time.perf_counter() - started, operation=operation)
+
+        def release(_future=None) -> None:
+            with self._lock:
+                self._pending -= 1
+
+        try:
+            future = self._pool.submit(timed)
+        except BaseException:
+            release()
+            raise
+        # Counted until the thread is done with it, even when the awaiting
+        # request goes away first (a running hash cannot be cancelled)
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Checks a password against its stored hash.
+        Returns:
+            Tuple[bool, Optional[str]]: (whether it matches, a replacement hash
+            when it matches but was made with outdated settings, else None)
+        """
+        return await self._run("verify", self.context.verify_and_update, password, hashed)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher.from_env()
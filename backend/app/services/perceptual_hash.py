@@ -0,0 +1,97 @@
+import numpy as np
+from PIL import Image
+from typing import Optional
+
+# The image is reduced to a GRID x GRID luma thumbnail; the hash keeps the
+# signs of the lowest BITS x BITS DCT coefficients relative to their median
+GRID = 32
+BITS = 8
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float64)
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+_DCT = _dct_matrix(GRID)[:BITS]
+
+def _bins(size: int) -> np.ndarray:
+    # Every pixel falls in exactly one of GRID equal-width cells
+    return (np.arange(size) * GRID) // size
+
+class PerceptualHasher:
+    """
+    Computes a 64-bit DCT perceptual hash (pHash) of an RGB image fed strip by
+    strip, so the protection pipeline can fingerprint its output without
+    holding or re-decoding the full frame. Re-encoding, recompression and
+    resizing change few bits of the hash, so near-duplicates are found by
+    Hamming distance.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._sums = np.zeros((GRID, GRID), dtype=np.float64)
+        self._row_bins = _bins(height)
+        col_bins = _bins(width)
+        self._col_starts = np.searchsorted(col_bins, np.arange(GRID))
+        self._cell_pixels = np.outer(np.bincount(self._row_bins, minlength=GRID), np.bincount(col_bins, minlength=GRID))
+
+    @property
+    def supported(self) -> bool:
+        """Images smaller than the grid in either dimension cannot be hashed."""
+        return self.width >= GRID and self.height >= GRID
+
+    def add(self, strip: np.ndarray, row_offset: int = 0) -> None:
+        """
+        Accumulates a horizontal strip of the image.
+        Args:
+            strip (np.ndarray): uint8 rows (rows, width, 3) of the image.
+            row_offset (int): Index of the strip's first row in the full image.
+        """
+        if not self.supported or strip.shape[0] == 0:
+            return
+        # Sum columns per cell first so no full-size float copy is ever made;
+        # luma is linear, so weighting the sums equals summing the weights
+        columns = np.add.reduceat(strip, self._col_starts, axis=1, dtype=np.uint64) @ _LUMA
+        np.add.at(self._sums, self._row_bins[row_offset:row_offset + strip.shape[0]], columns)
+
+    def partial(self) -> "PerceptualHasher":
+        """An empty hasher for the same image, to feed a band of rows and merge()."""
+        return PerceptualHasher(self.width, self.height)
+
+    def merge(self, other: "PerceptualHasher") -> None:
+        """Adds the strips another hasher of the same image was fed."""
+        self._sums += other._sums
+
+    def digest(self) -> Optional[int]:
+        """
+        Returns:
+            Optional[int]: The 64-bit hash, or None for images that are too small.
+        """
+        if not self.supported:
+            return None
+        thumbnail = self._sums / self._cell_pixels
+        coefficients = (_DCT @ thumbnail @ _DCT.T).ravel()
+        bits = coefficients > np.median(coefficients)
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hash_array(data: np.ndarray) -> Optional[int]:
+    """Perceptual hash of a decoded uint8 RGB array (height, width, 3)."""
+    hasher = PerceptualHasher(data.shape[1], data.shape[0])
+    hasher.add(data)
+    return hasher.digest()
+
+def hash_image(img: Image.Image) -> Optional[int]:
+    """
+    Perceptual hash of an opened image. JPEGs are decoded at a reduced scale
+    since only a GRID x GRID thumbnail is needed.
+    """
+    img.draft('RGB', (GRID * 8, GRID * 8))
+    return hash_array(np.asarray(img.convert('RGB')))
+
+def to_hex(code: Optional[int]) -> Optional[str]:
+    return None if code is None else f"{code:016x}"
+
+def from_hex(value: Optional[str]) -> Optional[int]:
+    return None if not value else int(value, 16)
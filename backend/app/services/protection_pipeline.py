@@ -0,0 +1,348 @@
+import os
+import tempfile
+import numpy as np
+from PIL import Image
+from typing import Any, Dict, Optional, Tuple
+from app.services.crypto_engine import CryptoEngine
+from app.services.binary_engine import BinaryEngine, new_seed
+from app.services.cloaking_engine import CloakingEngine
+from app.services.quality_metrics import MetricsAccumulator, QualityMetrics, proxy_step
+from app.services.perceptual_hash import PerceptualHasher, to_hex
+from app.services.metrics import StageTimings
+from app.services.encoder import encode_image, format_for_path, DEFAULT_ENCODER_PROFILE
+from app.services.parallel import map_chunks, row_chunks, PROTECTION_THREADS
+
+# Bump whenever a change alters protected output, so stored results made by
+# older code are not reused
+PIPELINE_VERSION = "2"
+
+# Per-job memory ceiling; images whose untiled footprint would exceed it are
+# processed in strips. 0 disables the ceiling.
+MAX_JOB_MEMORY = int(os.getenv("PROTECTION_MAX_JOB_MEMORY_MB", "0")) * 1024 * 1024 or None
+
+# Rough per-pixel footprints used to plan a job
+_DECODE_BYTES_PER_PIXEL = 4      # decoded source held by Pillow
+_FRAME_BYTES_PER_PIXEL = 3       # RGB working array
+_UNTILED_BYTES_PER_PIXEL = 14    # decode + RGB copy + array + cached pattern
+_STRIP_BYTES_PER_PIXEL = 22      # int16 copy, float32 pattern rows, noise bits
+# Rows transformed per step while measuring, bounding the before/after copies
+_MEASURE_ROWS = 64
+
+class ImageTooLarge(Exception):
+    """Raised when an image cannot be processed within the job memory ceiling."""
+
+class ProtectionPipeline:
+    """
+    Runs the binary and cloaking stages on a single decoded copy of an image.
+
+    The source is decoded once into a NumPy array, every stage transforms that
+    array in place, and the result is encoded exactly once to the destination.
+    No intermediate files are written.
+
+    Large images can be processed in horizontal strips (``tile_rows``, or
+    planned automatically from ``memory_limit``). Strip mode converts the
+    source to RGB strip by strip instead of copying the whole frame, keeps every
+    transform temporary strip-sized and, when even the RGB frame would not fit
+    the ceiling, keeps the frame in a memory-mapped temporary file. The output
+    is bit-identical to the untiled path for the same seed.
+
+    Quality metrics are measured on the fly from each strip before and after
+    its transforms and are available as ``metrics`` after run();
+    ``fast_metrics`` measures a downsampled proxy instead. The perceptual hash
+    of the output is likewise built from the protected strips and is available
+    as ``perceptual_hash``. Time spent per stage (decode, binary, cloaking,
+    scoring, fingerprint, encode) is summed over the strips in ``timings``.
+    The output is written with the named encoder ``profile`` (see encoder.py)
+    in the format of the destination's extension.
+
+    With ``threads`` > 1 the rows are split into fixed bands that are
+    transformed on a thread pool. The noise for every pixel comes from the
+    seeded, jumpable stream in noise_bits(), and the bands' metrics and
+    fingerprints are combined in band order, so the output and all results
+    are the same for any thread count.
+    """
+
+    def __init__(
+        self,
+        level: str = 'high',
+        seed: Optional[int] = None,
+        tile_rows: Optional[int] = None,
+        memory_limit: Optional[int] = MAX_JOB_MEMORY,
+        measure: bool = True,
+        fast_metrics: bool = False,
+        fingerprint: bool = True,
+        threads: int = PROTECTION_THREADS,
+        profile: str = DEFAULT_ENCODER_PROFILE
+    ):
+        self.level = level
+        self.seed = seed if seed is not None else new_seed()
+        self.tile_rows = tile_rows
+        self.memory_limit = memory_limit
+        self.measure = measure
+        self.fast_metrics = fast_metrics
+        self.fingerprint = fingerprint
+        self.threads = max(1, threads)
+        self.profile = profile
+        self.metrics: Optional[QualityMetrics] = None
+        self.perceptual_hash: Optional[int] = None
+        self.pixels = 0
+        self.timings = StageTimings()
+
+    def plan(self, width: int, height: int) -> Tuple[Optional[int], bool]:
+        """
+        Chooses how to process an image of the given size.
+        Args:
+            width (int): Image width.
+            height (int): Image height.
+        Returns:
+            Tuple[Optional[int], bool]: (rows per strip or None for untiled,
+            whether to keep the frame in a memory-mapped file)
+        Raises:
+            ImageTooLarge: If decoding alone would exceed the memory ceiling.
+        """
+        pixels = width * height
+        if not self.memory_limit:
+            return self.tile_rows, False
+        if pixels * _DECODE_BYTES_PER_PIXEL > self.memory_limit:
+            raise ImageTooLarge(
+                f"{width}x{height} image needs more than the {self.memory_limit} byte job memory limit"
+            )
+        if self.tile_rows is None and pixels * _UNTILED_BYTES_PER_PIXEL <= self.memory_limit:
+            return None, False
+
+        spill = pixels * (_DECODE_BYTES_PER_PIXEL + _FRAME_BYTES_PER_PIXEL) > self.memory_limit
+        resident = pixels * (_DECODE_BYTES_PER_PIXEL if spill else _DECODE_BYTES_PER_PIXEL + _FRAME_BYTES_PER_PIXEL)
+        # Every thread holds one strip's temporaries at a time
+        budget_rows = (self.memory_limit - resident) // (width * _STRIP_BYTES_PER_PIXEL * self.threads)
+        strip_rows = self.tile_rows or max(8, budget_rows // 8 * 8)
+        return strip_rows, spill
+
+    @staticmethod
+    def load(image_path: str) -> Tuple[np.ndarray, Dict]:
+        """
+        Decodes an image into a contiguous RGB array.
+        Args:
+            image_path (str): Path to the source image.
+        Returns:
+            Tuple[np.ndarray, Dict]: (uint8 RGB array, source metadata)
+        """
+        with Image.open(image_path) as img:
+            info = dict(img.info)
+            data = np.ascontiguousarray(np.array(img.convert('RGB')))
+        return data, info
+
+    @staticmethod
+    def load_strips(image_path: str, strip_rows: int, spill: bool = False) -> Tuple[np.ndarray, Dict]:
+        """
+        Decodes an image into an RGB array one strip at a time, so no full-frame
+        RGB copy is made besides the array itself.
+        Args:
+            image_path (str): Path to the source image.
+            strip_rows (int): Rows converted per step.
+            spill (bool): Back the array with a memory-mapped temporary file.
+        Returns:
+            Tuple[np.ndarray, Dict]: (uint8 RGB array, source metadata)
+        """
+        with Image.open(image_path) as img:
+            info = dict(img.info)
+            width, height = img.size
+            if spill:
+                # The temporary file is already unlinked; it disappears with the mapping
+                frame = np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode='w+', shape=(height, width, 3))
+            else:
+                frame = np.empty((height, width, 3), dtype=np.uint8)
+            for y0 in range(0, height, strip_rows):
+                y1 = min(y0 + strip_rows, height)
+                frame[y0:y1] = np.asarray(img.crop((0, y0, width, y1)).convert('RGB'))
+        return frame, info
+
+    @staticmethod
+    def save(
+        data: np.ndarray,
+        destination_path: str,
+        info: Dict,
+        profile: str = DEFAULT_ENCODER_PROFILE,
+        source_format: Optional[str] = None
+    ) -> str:
+        """
+        Encodes the array to the destination, preserving the source's EXIF,
+        ICC profile and DPI.
+        Args:
+            data (np.ndarray): uint8 RGB array.
+            destination_path (str): Output path; the format follows its extension.
+            info (Dict): Source metadata returned by load().
+            profile (str): Encoder profile.
+            source_format (Optional[str]): Pillow format of the source.
+        Returns:
+            str: The destination path.
+        """
+        return encode_image(Image.fromarray(data), destination_path, info, profile, source_format)
+
+    def transform(
+        self,
+        data: np.ndarray,
+        strip_rows: Optional[int] = None,
+        accumulator: Optional[MetricsAccumulator] = None,
+        hasher: Optional[PerceptualHasher] = None
+    ) -> np.ndarray:
+        """
+        Runs all protection stages in place.
+        Args:
+            data (np.ndarray): uint8 RGB array.
+            strip_rows (Optional[int]): Process this many rows at a time; None
+                processes the whole frame at once.
+            accumulator (Optional[MetricsAccumulator]): Fed every strip before
+                and after its transforms.
+            hasher (Optional[PerceptualHasher]): Fed every protected strip.
+        Returns:
+            np.ndarray: The same array, protected.
+        """
+        height = data.shape[0]
+        step = strip_rows or height
+        if accumulator is not None:
+            # Stages are row-local, so narrower steps give the same output
+            step = min(step, _MEASURE_ROWS)
+
+        def transform_band(start: int, stop: int):
+            # Per-band partial results, so threads never share mutable state
+            timings = StageTimings(self.timings.enabled)
+            band_accumulator = accumulator.partial() if accumulator is not None else None
+            band_hasher = hasher.partial() if hasher is not None else None
+            for y0 in range(start, stop, step):
+                strip = data[y0:min(y0 + step, stop)]
+                before = None
+                if band_accumulator is not None:
+                    with timings.stage("scoring"):
+                        before = band_accumulator.sample(strip, y0)
+                # A. Binary Manipulation
+                with timings.stage("binary"):
+                    BinaryEngine.zero_out_strip(strip, y0, self.seed)
+                # B. AI Cloaking, layered on top of the binary protection
+                with timings.stage("cloaking"):
+                    CloakingEngine.apply_cloaking_strip(strip, y0, height, self.level)
+                if band_accumulator is not None:
+                    with timings.stage("scoring"):
+                        band_accumulator.add(before, band_accumulator.sample(strip, y0))
+                if band_hasher is not None:
+                    with timings.stage("fingerprint"):
+                        band_hasher.add(strip, y0)
+            return timings, band_accumulator, band_hasher
+
+        # Stage times are summed over threads, so they can exceed wall time
+        for timings, band_accumulator, band_hasher in map_chunks(transform_band, row_chunks(height), self.threads):
+            self.timings.merge(timings)
+            if accumulator is not None:
+                accumulator.merge(band_accumulator)
+            if hasher is not None:
+                hasher.merge(band_hasher)
+        return data
+
+    def run(self, source_path: str, destination_path: str) -> str:
+        """
+        Decodes the source, protects it and writes the final output.
+        Args:
+            source_path (str): Path to the original image.
+            destination_path (str): Path of the protected output.
+        Returns:
+            str: The destination path.
+        """
+        try:
+            with Image.open(source_path) as img:
+                # Header only; nothing is decoded yet
+                source_format = img.format
+                strip_rows, spill = self.plan(*img.size)
+            with self.timings.stage("decode"):
+                if strip_rows is None:
+                    data, info = self.load(source_path)
+                else:
+                    data, info = self.load_strips(source_path, strip_rows, spill)
+            height, width = data.shape[:2]
+            self.pixels = width * height
+            accumulator = None
+            if self.measure:
+                accumulator = MetricsAccumulator(proxy_step(width, height) if self.fast_metrics else 1)
+            hasher = PerceptualHasher(width, height) if self.fingerprint else None
+            self.transform(data, strip_rows, accumulator, hasher)
+            if accumulator is not None:
+                self.metrics = accumulator.result()
+            if hasher is not None:
+                self.perceptual_hash = hasher.digest()
+            with self.timings.stage("encode"):
+                return self.save(data, destination_path, info, self.profile, source_format)
+        except ImageTooLarge:
+            raise
+        except Exception as e:
+            raise Exception(f"Protection pipeline failed: {str(e)}")
+
+def protect_file(
+    original_path: str,
+    destination_path: str,
+    private_key_pem: Optional[str] = None,
+    level: str = 'high',
+    original_hash: Optional[str] = None,
+    fast_metrics: bool = False,
+    tile_rows: Optional[int] = None,
+    threads: int = PROTECTION_THREADS,
+    profile: str = DEFAULT_ENCODER_PROFILE
+) -> Dict[str, Any]:
+    """
+    Runs every CPU-bound step of a protection request: signing, the protection
+    pipeline, hashing and scoring. Module-level so it can run in a process pool.
+    Args:
+        original_path (str): Path to the uploaded original.
+        destination_path (str): Path of the protected output.
+        private_key_pem (Optional[str]): PEM encoded signing key. Callers
+            holding a parsed key (see KeyStore) pass None and sign the
+            returned original_hash themselves; signature is None then.
+        level (str): Cloaking level.
+        original_hash (Optional[str]): SHA256 of the original if the caller
+            already computed it while ingesting; the file is not re-read then.
+        fast_metrics (bool): Score on a downsampled proxy.
+        tile_rows (Optional[int]): Process the image in strips of this many rows.
+        threads (int): Threads transforming the image.
+        profile (str): Encoder profile of the output; its format follows
+            ``destination_path``'s extension.
+    Returns:
+        Dict[str, Any]: original_hash, protected_hash, signature, level,
+        manipulation_score, protection_score, the full quality metrics, the
+        hex perceptual hash of the output (None for tiny images), the noise
+        ``seed`` that reproduces the output, ``encoding`` (profile, format,
+        output bytes and encode seconds), plus
+        ``pixels`` and the per-stage ``timings`` in seconds for the caller's
+        metrics.
+    """
+    pipeline = ProtectionPipeline(level=level, tile_rows=tile_rows, fast_metrics=fast_metrics, threads=threads, profile=profile)
+    timings = pipeline.timings
+
+    # A. Cryptographic Signing
+    if original_hash is None:
+        with timings.stage("hash"):
+            original_hash = CryptoEngine.create_hash(original_path)
+    signature = None
+    if private_key_pem:
+        with timings.stage("sign"):
+            signature = CryptoEngine.sign_digest(original_hash, private_key_pem)
+
+    # B. Binary Manipulation + C. AI Cloaking, scored while they run
+    pipeline.run(original_path, destination_path)
+    with timings.stage("hash"):
+        protected_hash = CryptoEngine.create_hash(destination_path)
+    return {
+        "original_hash": original_hash,
+        "protected_hash": protected_hash,
+        "signature": signature,
+        "level": level,
+        "manipulation_score": pipeline.metrics.manipulation_score,
+        "protection_score": pipeline.metrics.protection_score,
+        "quality": pipeline.metrics.as_dict(),
+        "perceptual_hash": to_hex(pipeline.perceptual_hash),
+        "seed": pipeline.seed,
+        "encoding": {
+            "profile": profile,
+            "format": format_for_path(destination_path),
+            "bytes": os.path.getsize(destination_path),
+            "seconds": round(pipeline.timings.seconds.get("encode", 0.0), 6)
+        },
+        "pixels": pipeline.pixels,
+        "timings": timings.as_dict()
+    }
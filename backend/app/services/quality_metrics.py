@@ -0,0 +1,151 @@
+import math
+import numpy as np
+from typing import Any, Dict, NamedTuple, Optional
+
+# SSIM is evaluated on non-overlapping windows of this size over luma
+SSIM_WINDOW = 8
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Pixel budget of the downsampled proxy used for fast estimates
+FAST_PROXY_PIXELS = 1_000_000
+
+class QualityMetrics(NamedTuple):
+    mse: float
+    mean_abs_diff: float
+    psnr: float
+    ssim: float
+    proxy_step: int
+
+    @property
+    def manipulation_score(self) -> float:
+        """Manipulation score (0-100%): a small MSE means subtle, invisible changes."""
+        return float(min(100.0, self.mse * 10))
+
+    @property
+    def protection_score(self) -> float:
+        """Protection score (0-100%): full marks once the average change reaches 5 levels."""
+        return float(min(100.0, (self.mean_abs_diff / 5.0) * 100.0))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "mse": self.mse,
+            "mean_abs_diff": self.mean_abs_diff,
+            # JSON has no infinity; identical images have no finite PSNR
+            "psnr": None if math.isinf(self.psnr) else self.psnr,
+            "ssim": self.ssim,
+            "proxy_step": self.proxy_step
+        }
+
+def proxy_step(width: int, height: int, max_pixels: int = FAST_PROXY_PIXELS) -> int:
+    """Sampling step that brings an image down to roughly ``max_pixels``."""
+    return max(1, math.ceil(math.sqrt(width * height / max_pixels)))
+
+class MetricsAccumulator:
+    """
+    Computes MSE, mean absolute difference, PSNR and SSIM in one pass over
+    pairs of (before, after) strips, so a pipeline can score its output while
+    it transforms it instead of decoding both images again afterwards.
+
+    With ``step`` > 1 only every step-th row and column is sampled, giving a
+    fast estimate on a downsampled proxy. Strips must be fed top to bottom.
+    """
+
+    def __init__(self, step: int = 1):
+        self.step = step
+        self._count = 0
+        self._sse = 0.0
+        self._sad = 0.0
+        self._ssim_sum = 0.0
+        self._ssim_windows = 0
+        self._carry: Optional[tuple] = None
+
+    def sample(self, strip: np.ndarray, row_offset: int = 0) -> np.ndarray:
+        """
+        Copies the part of a strip that contributes to the metrics.
+        Args:
+            strip (np.ndarray): uint8 rows (rows, width, 3) of the image.
+            row_offset (int): Index of the strip's first row in the full image.
+        Returns:
+            np.ndarray: The sampled pixels (a copy).
+        """
+        if self.step == 1:
+            return strip.copy()
+        start = (-row_offset) % self.step
+        return np.array(strip[start::self.step, ::self.step])
+
+    def add(self, before: np.ndarray, after: np.ndarray) -> None:
+        """Accumulates a pair of samples taken with sample()."""
+        # Widen before subtracting: uint8 differences would wrap around
+        diff = before.astype(np.int16) - after.astype(np.int16)
+        self._sse += float(np.einsum('i,i->', diff.ravel(), diff.ravel(), dtype=np.float64))
+        self._sad += float(np.abs(diff).sum(dtype=np.float64))
+        self._count += diff.size
+        self._add_ssim(before @ _LUMA, after @ _LUMA)
+
+    def _add_ssim(self, y1: np.ndarray, y2: np.ndarray) -> None:
+        if self._carry is not None:
+            y1 = np.concatenate([self._carry[0], y1])
+            y2 = np.concatenate([self._carry[1], y2])
+        rows = y1.shape[0] // SSIM_WINDOW * SSIM_WINDOW
+        self._carry = (y1[rows:], y2[rows:])
+        cols = y1.shape[1] // SSIM_WINDOW * SSIM_WINDOW
+        if rows == 0 or cols == 0:
+            return
+
+        shape = (rows // SSIM_WINDOW, SSIM_WINDOW, cols // SSIM_WINDOW, SSIM_WINDOW)
+        a = y1[:rows, :cols].reshape(shape)
+        b = y2[:rows, :cols].reshape(shape)
+        mu_a = a.mean(axis=(1, 3))
+        mu_b = b.mean(axis=(1, 3))
+        var_a = (a * a).mean(axis=(1, 3)) - mu_a * mu_a
+        var_b = (b * b).mean(axis=(1, 3)) - mu_b * mu_b
+        cov = (a * b).mean(axis=(1, 3)) - mu_a * mu_b
+        ssim = ((2 * mu_a * mu_b + _C1) * (2 * cov + _C2)) / ((mu_a ** 2 + mu_b ** 2 + _C1) * (var_a + var_b + _C2))
+        self._ssim_sum += float(ssim.sum(dtype=np.float64))
+        self._ssim_windows += ssim.size
+
+    def partial(self) -> "MetricsAccumulator":
+        """An empty accumulator for one band of rows, to merge() back later."""
+        return MetricsAccumulator(self.step)
+
+    def merge(self, other: "MetricsAccumulator") -> None:
+        """
+        Adds the totals of an accumulator fed a separate band of rows. SSIM
+        windows that would straddle the two bands are not counted, which
+        only happens on the downsampled proxy.
+        """
+        self._count += other._count
+        self._sse += other._sse
+        self._sad += other._sad
+        self._ssim_sum += other._ssim_sum
+        self._ssim_windows += other._ssim_windows
+
+    def result(self) -> QualityMetrics:
+        if self._count == 0:
+            return QualityMetrics(0.0, 0.0, float("inf"), 1.0, self.step)
+        mse = self._sse / self._count
+        psnr = float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+        ssim = self._ssim_sum / self._ssim_windows if self._ssim_windows else 1.0
+        return QualityMetrics(mse, self._sad / self._count, psnr, ssim, self.step)
+
+def compute_metrics(original: np.ndarray, protected: np.ndarray, fast: bool = False) -> QualityMetrics:
+    """
+    Compares two decoded RGB images of the same shape.
+    Args:
+        original (np.ndarray): uint8 array (height, width, 3).
+        protected (np.ndarray): uint8 array (height, width, 3).
+        fast (bool): Estimate on a downsampled proxy instead of every pixel.
+    Returns:
+        QualityMetrics: MSE, mean absolute difference, PSNR and SSIM.
+    """
+    if original.shape != protected.shape:
+        raise ValueError(f"Shape mismatch: {original.shape} vs {protected.shape}")
+    height, width = original.shape[:2]
+    accumulator = MetricsAccumulator(proxy_step(width, height) if fast else 1)
+    if accumulator.step == 1:
+        accumulator.add(original, protected)
+    else:
+        accumulator.add(accumulator.sample(original), accumulator.sample(protected))
+    return accumulator.result()
@@ -0,0 +1,83 @@
+import logging
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.services.metrics import request_duration, METRICS_ENABLED
+
+# Trace id of the request being handled; "-" outside of requests
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+
+TRACE_HEADER = "x-request-id"
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+
+_VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+def new_trace_id(incoming: Optional[str] = None) -> str:
+    """Reuses a well-formed incoming X-Request-ID, otherwise makes a new id."""
+    if incoming and _VALID_TRACE_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+class TraceIdFilter(logging.Filter):
+    """Adds ``trace_id`` to every record, for use in log formats."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id.get()
+        return True
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Logs to stderr with the current trace id on every line."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(TraceIdFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+class TraceMiddleware:
+    """
+    Gives every HTTP request a trace id (from X-Request-ID when the client
+    sent one), echoes it in the response headers and records the request's
+    latency by route. Background tasks started while handling the request
+    inherit the id, since they copy the current context.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+                break
+        current = new_trace_id(incoming)
+        token = trace_id.set(current)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_trace_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", current.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            trace_id.reset(token)
+            if METRICS_ENABLED:
+                # The router stores the matched endpoint in the scope; its name
+                # keeps the label set bounded, unlike raw paths
+                endpoint = scope.get("endpoint")
+                route = getattr(endpoint, "__name__", None) or "unmatched"
+                request_duration.observe(time.perf_counter() - start, method=scope["method"], route=route, status=str(status))
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.services.metrics import user_cache_lookups
+
+class UserCache:
+    """
+    Keeps recently resolved users in memory, keyed by their token subject, so
+    authenticated requests do not each cost a database round trip.
+
+    Entries expire ``ttl`` seconds after they were loaded and the least
+    recently used ones are evicted beyond ``max_entries``. Unknown subjects
+    are not cached, so a user who registers is found right away. Code that
+    updates a user calls invalidate(); other server processes keep their copy
+    for at most ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Bumped on invalidation (per key) and clear() (epoch), so a load that
+        # started before either cannot store the record it read
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "UserCache":
+        """Builds a cache from USER_CACHE_SIZE and USER_CACHE_TTL (seconds, 0 disables caching)."""
+        return cls(
+            max_entries=int(os.getenv("USER_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("USER_CACHE_TTL", "60"))
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    async def get(self, key: str, load: Callable[[str], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """
+        Returns the cached user for ``key``, loading it on a miss.
+        Args:
+            key (str): Token subject.
+            load (Callable): Coroutine function fetching the user, or None if
+                there is no such user.
+        Returns:
+            Optional[Any]: The user, or None if it does not exist.
+        """
+        user = self._lookup(key)
+        if user is not None:
+            user_cache_lookups.inc(result="hit")
+            return user
+        user_cache_lookups.inc(result="miss")
+
+        generation = (self._epoch, self._generations.get(key, 0))
+        user = await load(key)
+        if user is None or self.ttl <= 0:
+            return user
+        with self._lock:
+            if (self._epoch, self._generations.get(key, 0)) == generation:
+                self._entries[key] = (self.clock() + self.ttl, user)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, key: str) -> None:
+        """Drops ``key``'s entry, e.g. after the user's record changed."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+user_cache = UserCache.from_env()
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+from typing import Awaitable, Callable, Dict, Optional
+
+VARIANT_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+MAX_VARIANT_DIM = int(os.getenv("MAX_VARIANT_DIM", "4096"))
+
+def variant_format(fmt: Optional[str], source_path: str) -> str:
+    """Pillow format name for a ``fmt`` query value; None keeps the source's format."""
+    if fmt:
+        return VARIANT_FORMATS[fmt.lower()]
+    ext = os.path.splitext(source_path)[1].lower().lstrip(".")
+    return VARIANT_FORMATS.get(ext, "JPEG")
+
+def variant_name(digest: str, width: Optional[int], height: Optional[int], fmt: str) -> str:
+    return f"{digest}_{width or 0}x{height or 0}{_EXTENSIONS[fmt]}"
+
+def generate_variant(source_path: str, destination_path: str, width: Optional[int], height: Optional[int], fmt: str) -> str:
+    """
+    Writes a downscaled copy of an image that fits within width x height,
+    keeping its aspect ratio and never upscaling. JPEGs are decoded at a
+    reduced scale with draft() and large reductions use reduce() before the
+    final resample, so big sources never have to be decoded in full.
+    Args:
+        source_path (str): Image to derive from.
+        destination_path (str): Path of the variant.
+        width (Optional[int]): Maximum width; None leaves it unbounded.
+        height (Optional[int]): Maximum height; None leaves it unbounded.
+        fmt (str): Pillow format name to encode with.
+    Returns:
+        str: The destination path.
+    """
+    with Image.open(source_path) as img:
+        box = (width or img.width, height or img.height)
+        mode = "RGB" if fmt == "JPEG" else img.mode
+        img.draft(mode, box)
+        # Whole-number shrink first: a cheap box filter over integer blocks
+        # that still leaves at least the target size for the final resample
+        factor = max(img.width // box[0], img.height // box[1])
+        out = img.reduce(factor) if factor >= 2 else img.copy()
+        out.thumbnail(box, Image.Resampling.LANCZOS)
+        if fmt == "JPEG" and out.mode != "RGB":
+            out = out.convert("RGB")
+        options = {"quality": 85} if fmt in ("JPEG", "WEBP") else {"optimize": True}
+        out.save(destination_path, format=fmt, **options)
+    return destination_path
+
+class VariantCache:
+    """
+    Disk cache of generated variants, evicting least recently used files once
+    their total size exceeds ``max_bytes``. Concurrent requests for a variant
+    that is not cached yet share one generation (single flight).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        # Oldest access first, so eviction order survives restarts
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+        self._evict()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def lookup(self, name: str) -> Optional[str]:
+        path = self.path(name)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            if not os.path.exists(path):
+                # Evicted by another process sharing the directory
+                self._total -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+        return path
+
+    def _add(self, name: str, size: int) -> None:
+        with self._lock:
+            self._total -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._total += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, name: str, produce: Callable[[str], Awaitable[None]]) -> str:
+        """
+        Returns the cached variant ``name``, producing it first if needed.
+        Args:
+            name (str): Cache file name, unique per source and parameters.
+            produce (Callable[[str], Awaitable[None]]): Writes the variant to
+                the given temporary path.
+        Returns:
+            str: Path of the cached variant.
+        """
+        path = self.lookup(name)
+        if path is not None:
+            return path
+
+        inflight = self._inflight.get(name)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=os.path.splitext(name)[1])
+            os.close(fd)
+            try:
+                await produce(temp_path)
+                os.replace(temp_path, self.path(name))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self._add(name, os.path.getsize(self.path(name)))
+            future.set_result(self.path(name))
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception retrieved when nobody else was waiting
+                future.exception()
+            raise
+        finally:
+            del self._inflight[name]
+        return self.path(name)
+
+variant_cache = VariantCache(
+    os.getenv("VARIANT_CACHE_DIR", os.path.join("data", "variants")),
+    int(os.getenv("VARIANT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    A bounded LRU cache whose entries also expire ``ttl`` seconds after they
+    were stored. Not thread-safe; meant to be used from the event loop.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class VerificationBuffer:
+    """
+    Write-behind buffer for Verification rows.
+
+    record() only appends to memory; a background task writes everything
+    buffered with one create_many every ``flush_interval`` seconds, or sooner
+    once ``flush_batch`` rows are waiting. On a crash at most the rows recorded
+    during the last ``flush_interval`` seconds are lost (plus any rows whose
+    flush was still failing). If the database stays unavailable the buffer keeps
+    at most ``max_pending`` rows and drops the oldest beyond that.
+    """
+
+    def __init__(self, flush_interval: float = 2.0, flush_batch: int = 500, max_pending: int = 50000):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._writer: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def record(self, content_id: str, content_hash: str) -> None:
+        self._pending.append({
+            "contentId": content_id,
+            "contentHash": content_hash,
+            # Stamped now, not at flush time
+            "verifiedAt": datetime.now(timezone.utc)
+        })
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+        if len(self._pending) >= self.flush_batch:
+            self._wakeup.set()
+
+    def start(self, writer: Callable[[List[Dict[str, Any]]], Awaitable[Any]]) -> None:
+        """
+        Starts the background flusher.
+        Args:
+            writer (Callable): Coroutine function that inserts a list of rows.
+        """
+        self._writer = writer
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Writes all buffered rows now.
+        Returns:
+            int: Number of rows written.
+        """
+        if not self._pending or self._writer is None:
+            return 0
+        batch, self._pending = self._pending, []
+        try:
+            await self._writer(batch)
+        except Exception:
+            logger.exception("Failed to write %d verification records", len(batch))
+            # Put them back in front of anything recorded meanwhile
+            self._pending = batch + self._pending
+            return 0
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+# hash -> verification response fields for known contents. Each app process
+# holds its own copy; other processes pick up changes within VERIFY_CACHE_TTL.
+verify_cache = TTLCache(
+    maxsize=int(os.getenv("VERIFY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("VERIFY_CACHE_TTL", "300"))
+)
+
+verification_log = VerificationBuffer(
+    flush_interval=float(os.getenv("VERIFICATION_FLUSH_INTERVAL", "2")),
+    flush_batch=int(os.getenv("VERIFICATION_FLUSH_BATCH", "500")),
+    max_pending=int(os.getenv("VERIFICATION_MAX_PENDING", "50000"))
+)
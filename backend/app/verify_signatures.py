@@ -0,0 +1,153 @@
+"""
+Audits content signatures and reports throughput.
+
+    python -m app.verify_signatures [protected/]     # hash every file, match it to
+                                                     # its Content row, verify it
+    python -m app.verify_signatures --digests-only   # verify every Content row from
+                                                     # its stored digest, no file I/O
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+from app import db
+from app.services.crypto_engine import CryptoEngine
+
+PAGE_SIZE = 1000
+
+def _files(directory: str) -> Iterator[str]:
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            yield os.path.join(root, name)
+
+def _chunks(items: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class Report:
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.started = time.perf_counter()
+        self.counts = {
+            "checked": 0, "valid": 0, "invalid": 0, "unregistered": 0, "errors": 0,
+            "duplicate_files": 0, "duplicate_rows": 0
+        }
+        self.bytes_hashed = 0
+
+    def note(self, kind: str, source: str, detail: str = "") -> None:
+        self.counts[kind] += 1
+        if self.verbose:
+            print(f"{kind}: {source} {detail}".rstrip(), file=sys.stderr)
+
+    def add(self, result) -> None:
+        self.counts["checked"] += 1
+        if result.valid:
+            self.counts["valid"] += 1
+        elif result.error:
+            self.note("errors", result.source, result.error)
+        else:
+            self.note("invalid", result.source)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            **self.counts,
+            "seconds": round(elapsed, 3),
+            "signatures_per_second": round(self.counts["checked"] / elapsed, 1) if elapsed else None,
+            "mb_hashed_per_second": round(self.bytes_hashed / elapsed / 1e6, 1) if elapsed else None
+        }
+
+async def audit_directory(directory: str, report: Report, workers: int = None) -> None:
+    """
+    Hashes every file under ``directory`` in parallel, looks the digests up as
+    protectedHash and verifies the signature of every matching Content row
+    over its original digest. Files with the same content as an earlier one
+    are counted as duplicate_files, and rows beyond the first for a digest
+    as duplicate_rows; every row is still verified, once.
+    """
+    # Digest to the first file seen with it, across pages
+    seen: Dict[str, str] = {}
+    for paths in _chunks(_files(directory), PAGE_SIZE):
+        hashed: Dict[str, str] = {}
+        for path, digest in CryptoEngine.hash_many(paths, workers):
+            if digest is None:
+                report.note("errors", path, "unreadable")
+                continue
+            report.bytes_hashed += os.path.getsize(path)
+            if digest in seen:
+                report.note("duplicate_files", path, f"same content as {seen[digest]}")
+                continue
+            seen[digest] = hashed[digest] = path
+
+        contents = await db.prisma.content.find_many(
+            where={"protectedHash": {"in": list(hashed)}},
+            include={"user": True}
+        )
+        registered: Dict[str, List[Any]] = {}
+        for content in contents:
+            registered.setdefault(content.protectedHash, []).append(content)
+        for digest, matches in registered.items():
+            for content in matches[1:]:
+                report.note("duplicate_rows", content.id, f"same protectedHash as {matches[0].id}")
+        for digest, path in hashed.items():
+            if digest not in registered:
+                report.note("unregistered", path)
+
+        items = (
+            (content.originalHash, content.signatureData, content.user.publicKey or "")
+            for content in contents
+        )
+        for result in CryptoEngine.verify_many(items, digests=True):
+            report.add(result)
+
+async def audit_digests(report: Report) -> None:
+    """Verifies every Content row against its stored original digest, paging by id."""
+    last_id = ""
+    while True:
+        rows = await db.prisma.query_raw(
+            'SELECT c."id", c."originalHash", c."signatureData", u."publicKey" '
+            'FROM "Content" c JOIN "User" u ON u."id" = c."userId" '
+            'WHERE c."id" > $1 ORDER BY c."id" LIMIT $2',
+            last_id,
+            PAGE_SIZE
+        )
+        if not rows:
+            break
+        items = ((row["originalHash"], row["signatureData"], row["publicKey"] or "") for row in rows)
+        for result in CryptoEngine.verify_many(items, digests=True):
+            report.add(result)
+        last_id = rows[-1]["id"]
+
+async def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Verify content signatures in bulk.")
+    parser.add_argument("directory", nargs="?", default="protected", help="Directory of protected files")
+    parser.add_argument("--digests-only", action="store_true", help="Verify stored digests without reading files")
+    parser.add_argument("--workers", type=int, default=None, help="Hashing threads (default: CPU count)")
+    parser.add_argument("--verbose", action="store_true", help="List every failing item on stderr")
+    args = parser.parse_args(argv)
+
+    report = Report(args.verbose)
+    await db.connect()
+    try:
+        if args.digests_only:
+            await audit_digests(report)
+        else:
+            await audit_directory(args.directory, report, args.workers)
+    finally:
+        await db.disconnect()
+    summary = report.summary()
+    print(json.dumps(summary, indent=2))
+    return summary
+
+if __name__ == "__main__":
+    summary = asyncio.run(main())
+    sys.exit(0 if summary["invalid"] == 0 and summary["errors"] == 0 else 1)
@@ -0,0 +1,469 @@
+"""
+Benchmarks the protection stages on synthetic images.
+
+    python benchmarks/bench_pipeline.py                             # every size, format and stage
+    python benchmarks/bench_pipeline.py --sizes 1 12 --formats jpeg --stages binary cloaking
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --threshold 0.15
+
+Each case (stage x size x format) runs in a fresh process, so the peak RSS
+it reports is its own and not left over from an earlier, bigger case.
+Results are printed as JSON (or written to --output). With --baseline, a
+case whose best wall time or peak RSS grew by more than the threshold is a
+regression and the exit status is 1.
+
+The encode_<profile> stages time only the final encode of an already
+protected image with each encoder profile, in the source's format or, for
+encode_<profile>_webp, transcoded to WebP, and report output_bytes.
+
+The protect_endpoint stage posts to /protect/image in-process and needs a
+generated Prisma client and a reachable DATABASE_URL; it is reported as
+skipped otherwise. Its uploads go to throwaway stores under --work-dir.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import secrets
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+# Run from anywhere: the app package lives next to this directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import PIL
+from PIL import Image
+from app.services.binary_engine import BinaryEngine
+from app.services.cloaking_engine import CloakingEngine
+from app.services.crypto_engine import CryptoEngine
+from app.services.encoder import ENCODER_PROFILES, EXTENSIONS
+from app.services.protection_pipeline import ProtectionPipeline, protect_file
+
+SIZES = (1, 12, 24, 50)
+FORMATS = {"jpeg": ("JPEG", ".jpg"), "png": ("PNG", ".png"), "webp": ("WEBP", ".webp")}
+ENCODE_STAGES = tuple(f"encode_{profile}" for profile in ENCODER_PROFILES) + tuple(f"encode_{profile}_webp" for profile in ENCODER_PROFILES)
+STAGES = ("binary", "cloaking", "hash", "sign", "pipeline", "protect_endpoint") + ENCODE_STAGES
+# Compared against the baseline; lower is better for both
+COMPARED_METRICS = ("wall_seconds_min", "peak_rss_mb")
+RESULTS_VERSION = 1
+
+BENCHMARK_EMAIL = "benchmark@virtius.invalid"
+
+def synthetic_size(megapixels: float) -> Tuple[int, int]:
+    """4:3 dimensions with roughly ``megapixels`` million pixels."""
+    width = max(1, round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    return width, max(1, round(width * 3 / 4))
+
+def synthetic_image(path: str, megapixels: float, fmt: str, seed: int = 0) -> str:
+    """
+    Writes a deterministic test image: smooth gradients with fine noise on
+    top, so encoders see something closer to a photo than flat colour or
+    pure noise would give them.
+    Args:
+        path (str): Destination file.
+        megapixels (float): Approximate size in millions of pixels.
+        fmt (str): Key of FORMATS.
+        seed (int): Noise seed.
+    Returns:
+        str: The path written.
+    """
+    width, height = synthetic_size(megapixels)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    data = np.empty((height, width, 3), dtype=np.uint8)
+    for c, (fx, fy) in enumerate(((0.7, 0.3), (0.2, 0.8), (0.5, 0.5))):
+        channel = x * fx + y * fy
+        channel += rng.integers(0, 24, (height, width), dtype=np.uint8)
+        np.clip(channel, 0, 255, out=channel)
+        data[:, :, c] = channel
+        del channel
+    pil_format = FORMATS[fmt][0]
+    options = {"quality": 90} if pil_format in ("JPEG", "WEBP") else {}
+    Image.fromarray(data).save(path, format=pil_format, **options)
+    return path
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+# Each stage factory prepares whatever the stage needs and returns
+# (run, close): run() is timed, close() is not. run() may return a dict of
+# extra fields to report with the case, e.g. output sizes.
+StageFactory = Callable[[str, str], Tuple[Callable[[], None], Callable[[], None]]]
+
+def _binary_stage(source: str, work_dir: str):
+    def run():
+        _remove(BinaryEngine.zero_out_manipulation(source))
+    return run, lambda: None
+
+def _cloaking_stage(source: str, work_dir: str):
+    def run():
+        _remove(CloakingEngine.apply_fawkes_protection(source, level='high'))
+    return run, lambda: None
+
+def _hash_stage(source: str, work_dir: str):
+    return (lambda: CryptoEngine.create_hash(source)), lambda: None
+
+def _sign_stage(source: str, work_dir: str):
+    private_key, _ = CryptoEngine.generate_key_pair()
+    return (lambda: CryptoEngine.sign_content(source, private_key)), lambda: None
+
+def _pipeline_stage(source: str, work_dir: str):
+    private_key, _ = CryptoEngine.generate_key_pair()
+    destination = os.path.join(work_dir, "protected" + os.path.splitext(source)[1])
+
+    def run():
+        result = protect_file(source, destination, private_key)
+        _remove(destination)
+        return {"output_bytes": result["encoding"]["bytes"]}
+    return run, lambda: None
+
+def _encode_stage(profile: str, transcode: bool) -> StageFactory:
+    def factory(source: str, work_dir: str):
+        # Decoded and protected once, outside the timed runs
+        pipeline = ProtectionPipeline(seed=0, measure=False, fingerprint=False)
+        data, info = pipeline.load(source)
+        pipeline.transform(data)
+        with Image.open(source) as img:
+            source_format = img.format
+        extension = EXTENSIONS["WEBP"] if transcode else os.path.splitext(source)[1]
+        destination = os.path.join(work_dir, "encoded" + extension)
+
+        def run():
+            ProtectionPipeline.save(data, destination, info, profile, source_format)
+            size = os.path.getsize(destination)
+            _remove(destination)
+            return {"output_bytes": size}
+        return run, lambda: None
+    return factory
+
+def _protect_endpoint_stage(source: str, work_dir: str):
+    # Throwaway stores, so a benchmark never touches real uploads. Set before
+    # the app modules are imported, since they read these at import time.
+    state_dir = os.path.join(work_dir, "state")
+    os.environ.update({
+        "UPLOAD_DIR": os.path.join(state_dir, "uploads"),
+        "PROTECTED_DIR": os.path.join(state_dir, "protected"),
+        "UPLOAD_STORE_DB": os.path.join(state_dir, "uploads.sqlite3"),
+        "PROTECTED_STORE_DB": os.path.join(state_dir, "protected.sqlite3"),
+        "JOB_QUEUE_PATH": os.path.join(state_dir, "jobs.sqlite3"),
+        "KEYSTORE_DIR": os.path.join(state_dir, "keys")
+    })
+    # Tokens and keys are made and checked in this process only
+    os.environ.setdefault("JWT_SECRET_KEY", secrets.token_hex(32))
+    os.environ.setdefault("KEYSTORE_SECRET", secrets.token_hex(32))
+    # Large cases may legitimately take longer than a request would be allowed
+    os.environ.setdefault("PROTECTION_JOB_TIMEOUT", "0")
+    os.environ.setdefault("LARGE_PROTECTION_JOB_TIMEOUT", "0")
+    from fastapi import FastAPI
+    from httpx import AsyncClient, ASGITransport
+    from app import db
+    from app.api import protect
+    from app.api.auth import create_access_token
+    from app.services.blob_store import result_index
+    from app.services.executor import protection_executor, large_protection_executor
+    from app.services.image_probe import probe_image, plan_protection
+    from app.services.encoder import OutputSettings
+    from app.services.admission import admission, DEFAULT_PLANS
+
+    app = FastAPI()
+    app.include_router(protect.router, prefix="/protect")
+    loop = asyncio.new_event_loop()
+    original_hash = CryptoEngine.create_hash(source)
+    level = plan_protection(probe_image(source)).level
+    with Image.open(source) as img:
+        mime_type = Image.MIME.get(img.format, "application/octet-stream")
+    content_ids: List[str] = []
+
+    # Repeats must measure the endpoint, not the plan's rate limits
+    admission.plans["benchmark"] = DEFAULT_PLANS["enterprise"]._replace(
+        requests_per_second=math.inf, request_burst=math.inf, megapixels_per_second=math.inf, megapixel_burst=math.inf
+    )
+
+    async def setup():
+        await db.connect()
+        await db.prisma.user.upsert(
+            where={"email": BENCHMARK_EMAIL},
+            data={"create": {"email": BENCHMARK_EMAIL, "password": "!", "plan": "benchmark"}, "update": {"plan": "benchmark"}}
+        )
+        protection_executor.start()
+        large_protection_executor.start()
+
+    async def post():
+        # A stored result would short-circuit the pipeline on every repeat
+        result_index.discard(original_hash, protect.result_version(OutputSettings()), level)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+            with open(source, "rb") as f:
+                response = await client.post(
+                    "/protect/image",
+                    files={"file": (os.path.basename(source), f, mime_type)},
+                    headers={"Authorization": f"Bearer {create_access_token({'sub': BENCHMARK_EMAIL})}"},
+                    timeout=None
+                )
+        if response.status_code != 200:
+            raise RuntimeError(f"/protect/image returned {response.status_code}: {response.text}")
+        content_ids.append(response.json()["content_id"])
+
+    async def teardown():
+        try:
+            if content_ids:
+                await db.prisma.content.delete_many(where={"id": {"in": content_ids}})
+        finally:
+            await db.disconnect()
+
+    loop.run_until_complete(setup())
+
+    def close():
+        try:
+            loop.run_until_complete(teardown())
+        finally:
+            loop.close()
+            protection_executor.shutdown()
+            large_protection_executor.shutdown()
+            shutil.rmtree(state_dir, ignore_errors=True)
+    return (lambda: loop.run_until_complete(post())), close
+
+STAGE_FACTORIES: Dict[str, StageFactory] = {
+    "binary": _binary_stage,
+    "cloaking": _cloaking_stage,
+    "hash": _hash_stage,
+    "sign": _sign_stage,
+    "pipeline": _pipeline_stage,
+    "protect_endpoint": _protect_endpoint_stage,
+    **{f"encode_{profile}": _encode_stage(profile, False) for profile in ENCODER_PROFILES},
+    **{f"encode_{profile}_webp": _encode_stage(profile, True) for profile in ENCODER_PROFILES}
+}
+
+def case_key(case: Dict[str, Any]) -> str:
+    return f"{case['stage']}/{case['megapixels']}mp/{case['format']}"
+
+def run_case(stage: str, source: str, work_dir: str, repeats: int = 3, trace_allocations: bool = True) -> Dict[str, Any]:
+    """
+    Measures one stage on one image in the current process.
+    Args:
+        stage (str): Key of STAGE_FACTORIES.
+        source (str): Input image.
+        work_dir (str): Scratch directory for outputs.
+        repeats (int): Timed runs; min, median and max are reported.
+        trace_allocations (bool): Do one more run under tracemalloc. It is
+            kept out of the timed runs since tracing slows Python down.
+    Returns:
+        Dict[str, Any]: status plus, when it is "ok", wall_seconds_min,
+        wall_seconds_median, wall_seconds_max, peak_rss_mb, rss_before_mb,
+        alloc_peak_mb, alloc_retained_mb and whatever extra fields the
+        stage reports. Allocations cover Python objects
+        and numpy buffers; memory Pillow allocates in C is only in the RSS.
+    """
+    try:
+        run, close = STAGE_FACTORIES[stage](source, work_dir)
+    except Exception as e:
+        return {"status": "skipped", "detail": f"{type(e).__name__}: {e}"}
+
+    result: Dict[str, Any] = {"status": "ok"}
+    try:
+        gc.collect()
+        result["rss_before_mb"] = round(_max_rss_mb(), 1)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            extra = run()
+            timings.append(time.perf_counter() - start)
+            if isinstance(extra, dict):
+                result.update(extra)
+            gc.collect()
+        result["wall_seconds_min"] = round(min(timings), 4)
+        result["wall_seconds_median"] = round(statistics.median(timings), 4)
+        result["wall_seconds_max"] = round(max(timings), 4)
+
+        if trace_allocations:
+            tracemalloc.start()
+            try:
+                run()
+                current, peak = tracemalloc.get_traced_memory()
+                result["alloc_peak_mb"] = round(peak / (1024 * 1024), 1)
+                result["alloc_retained_mb"] = round(current / (1024 * 1024), 1)
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return {"status": "error", "detail": f"{type(e).__name__}: {e}"}
+    finally:
+        close()
+    # Pool workers (protect_endpoint) only count once they have been reaped
+    for child in multiprocessing.active_children():
+        child.join(timeout=30)
+    result["peak_rss_mb"] = round(max(_max_rss_mb(), _max_rss_mb(resource.RUSAGE_CHILDREN)), 1)
+    return result
+
+def _case_process(conn, stage: str, source: str, work_dir: str, repeats: int, trace_allocations: bool) -> None:
+    try:
+        conn.send(run_case(stage, source, work_dir, repeats, trace_allocations))
+    finally:
+        conn.close()
+
+def run_isolated(stage: str, source: str, work_dir: str, repeats: int, trace_allocations: bool) -> Dict[str, Any]:
+    """Runs run_case() in a fresh spawned process."""
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_process, args=(sender, stage, source, work_dir, repeats, trace_allocations))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"status": "error", "detail": "benchmark process died"}
+    process.join()
+    if process.exitcode not in (0, None) and result.get("status") == "ok":
+        result = {"status": "error", "detail": f"benchmark process exited with {process.exitcode}"}
+    return result
+
+def run_benchmarks(
+    sizes: List[float],
+    formats: List[str],
+    stages: List[str],
+    work_dir: str,
+    repeats: int = 3,
+    trace_allocations: bool = True,
+    isolated: bool = True,
+    log: Callable[[str], None] = lambda message: None
+) -> Dict[str, Any]:
+    """
+    Generates (or reuses) the synthetic images and measures every case.
+    Returns:
+        Dict[str, Any]: version, created, environment and the list of cases.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    cases = []
+    for megapixels in sizes:
+        for fmt in formats:
+            source = os.path.join(work_dir, f"synthetic_{megapixels}mp{FORMATS[fmt][1]}")
+            if not os.path.exists(source):
+                log(f"generating {os.path.basename(source)}")
+                synthetic_image(source, megapixels, fmt)
+            width, height = synthetic_size(megapixels)
+            for stage in stages:
+                case = {
+                    "stage": stage,
+                    "megapixels": megapixels,
+                    "format": fmt,
+                    "width": width,
+                    "height": height,
+                    "file_bytes": os.path.getsize(source),
+                    "repeats": repeats
+                }
+                log(f"running {case_key(case)}")
+                with tempfile.TemporaryDirectory(dir=work_dir) as scratch:
+                    if isolated:
+                        case.update(run_isolated(stage, source, scratch, repeats, trace_allocations))
+                    else:
+                        case.update(run_case(stage, source, scratch, repeats, trace_allocations))
+                cases.append(case)
+
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__
+        },
+        "cases": cases
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compares each measured case with the same case in ``baseline``.
+    Args:
+        results (Dict[str, Any]): Output of run_benchmarks().
+        baseline (Dict[str, Any]): An earlier output of run_benchmarks().
+        threshold (float): Allowed relative growth, e.g. 0.1 for 10%.
+    Returns:
+        List[Dict[str, Any]]: One entry per case and metric found in both,
+        with the baseline and current values, their ratio and ``regressed``.
+    """
+    previous = {case_key(case): case for case in baseline.get("cases", []) if case.get("status") == "ok"}
+    comparisons = []
+    for case in results["cases"]:
+        before = previous.get(case_key(case))
+        if case.get("status") != "ok" or before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not before.get(metric) or metric not in case:
+                continue
+            ratio = case[metric] / before[metric]
+            comparisons.append({
+                "case": case_key(case),
+                "metric": metric,
+                "baseline": before[metric],
+                "current": case[metric],
+                "ratio": round(ratio, 3),
+                "regressed": ratio > 1 + threshold
+            })
+    return comparisons
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the protection pipeline on synthetic images.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=list(SIZES), help="Image sizes in megapixels")
+    parser.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=list(FORMATS), help="Image formats")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to measure")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--no-allocations", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "virtius-benchmark"), help="Where synthetic images are generated and kept")
+    parser.add_argument("--output", help="Write the results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative slowdown or growth (default 0.15)")
+    parser.add_argument("--save-baseline", help="Also write the results here, for later --baseline runs")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.sizes,
+        args.formats,
+        args.stages,
+        args.work_dir,
+        repeats=args.repeats,
+        trace_allocations=not args.no_allocations,
+        log=lambda message: print(message, file=sys.stderr)
+    )
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparisons = compare(results, json.load(f), args.threshold)
+        results["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "results": comparisons}
+        for item in comparisons:
+            if item["regressed"]:
+                status = 1
+                print(f"REGRESSION {item['case']} {item['metric']}: {item['baseline']} -> {item['current']} (x{item['ratio']})", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(output + "\n")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
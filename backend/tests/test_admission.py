@@ -0,0 +1,152 @@
+import pytest
+import sys
+import os
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.admission import (
+    AdmissionController, FairScheduler, PlanLimits, Tenant, Throttled, TokenBucket, load_plans, DEFAULT_PLANS
+)
+from app.services.executor import ExecutorSaturated
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+PLAN = PlanLimits(
+    requests_per_second=1, request_burst=2, megapixels_per_second=2, megapixel_burst=10,
+    max_concurrent=1, max_queued=4, weight=1
+)
+
+def test_token_bucket_refills_and_caps_large_amounts():
+    bucket = TokenBucket(rate=2, capacity=4, now=0)
+    assert bucket.take(3, now=0) == 0
+    assert bucket.take(3, now=0) == pytest.approx(1.0)
+    assert bucket.take(3, now=1) == 0
+    # More than the bucket holds waits for a full bucket instead of never passing
+    assert bucket.take(100, now=1) == pytest.approx(2.0)
+    assert bucket.take(100, now=3) == 0
+
+def test_controller_throttles_requests_and_megapixels():
+    clock = Clock()
+    controller = AdmissionController({"free": PLAN}, clock=clock)
+    alice, bob = Tenant("alice", "free"), Tenant("bob", "free")
+
+    controller.admit_request(alice)
+    controller.admit_request(alice)
+    with pytest.raises(Throttled) as throttled:
+        controller.admit_request(alice)
+    assert throttled.value.reason == "requests"
+    assert throttled.value.retry_after_header == "1"
+    # Users have separate buckets
+    controller.admit_request(bob)
+
+    controller.admit_pixels(alice, 8_000_000)
+    with pytest.raises(Throttled, match="megapixels"):
+        controller.admit_pixels(alice, 4_000_000)
+    clock.now = 1
+    controller.admit_pixels(alice, 4_000_000)
+    controller.admit_request(alice)
+
+    snapshot = controller.snapshot()
+    assert snapshot["alice"]["megapixel_tokens"] == 0
+    # Unknown plans get the default plan's limits
+    assert controller.limits("gold") == PLAN
+
+def test_controller_forgets_idle_users():
+    clock = Clock()
+    controller = AdmissionController({"free": PLAN}, clock=clock, max_tracked=2)
+    for user in ("a", "b"):
+        controller.admit_request(Tenant(user, "free"))
+    clock.now = 10
+    controller.admit_request(Tenant("c", "free"))
+    assert set(controller.snapshot()) == {"c"}
+
+def test_load_plans_applies_overrides():
+    plans = load_plans('{"free": {"megapixels_per_second": 5}, "internal": {"max_concurrent": 8}}')
+    assert plans["free"] == DEFAULT_PLANS["free"]._replace(megapixels_per_second=5)
+    assert plans["internal"] == plans["free"]._replace(max_concurrent=8)
+    assert plans["pro"] == DEFAULT_PLANS["pro"]
+    with pytest.raises(ValueError, match="speed"):
+        load_plans('{"free": {"speed": 1}}')
+
+def test_scheduler_serves_newcomer_ahead_of_a_bulk_backlog():
+    bulk_plan = PLAN._replace(max_concurrent=2, max_queued=50)
+    scheduler = FairScheduler(slots=2, max_waiting=100)
+    order = []
+
+    async def job(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        bulk = [
+            asyncio.create_task(scheduler.run(Tenant("bulk", "pro"), bulk_plan, 4.0, lambda i=i: job(f"bulk{i}")))
+            for i in range(20)
+        ]
+        await asyncio.sleep(0.015)
+        small = asyncio.create_task(scheduler.run(Tenant("small", "free"), PLAN, 1.0, lambda: job("small")))
+        await asyncio.gather(*bulk, small)
+
+    asyncio.run(scenario())
+    # It waits for the running jobs, not for the bulk user's backlog
+    assert order.index("small") <= 4
+    assert scheduler.running == scheduler.waiting == 0
+    assert scheduler.snapshot()["users"] == {}
+
+def test_scheduler_shares_by_weight_and_caps_concurrency():
+    scheduler = FairScheduler(slots=1, max_waiting=100)
+    order = []
+    light, heavy = PLAN._replace(max_queued=10), PLAN._replace(max_queued=10, weight=3)
+
+    async def job(name):
+        order.append(name)
+        await asyncio.sleep(0)
+
+    async def scenario():
+        # Hold the slot while both users queue up
+        gate = asyncio.Event()
+        holder = asyncio.create_task(scheduler.run(Tenant("x", "free"), PLAN, 1.0, gate.wait))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(scheduler.run(Tenant(user, "free"), plan, 1.0, lambda user=user: job(user)))
+            for _ in range(8) for user, plan in (("light", light), ("heavy", heavy))
+        ]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+
+    asyncio.run(scenario())
+    # Three times the weight gets about three turns to one while both wait
+    assert order[:8].count("heavy") == 6
+
+def test_scheduler_limits_queues():
+    scheduler = FairScheduler(slots=1, max_waiting=3)
+    plan = PLAN._replace(max_queued=2)
+
+    async def scenario():
+        gate = asyncio.Event()
+        tasks = [asyncio.create_task(scheduler.run(Tenant("a", "free"), plan, 1.0, gate.wait)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert (scheduler.running, scheduler.waiting) == (1, 2)
+        with pytest.raises(Throttled, match="queue"):
+            await scheduler.run(Tenant("a", "free"), plan, 1.0, gate.wait)
+        tasks.append(asyncio.create_task(scheduler.run(Tenant("b", "free"), plan, 1.0, gate.wait)))
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturated):
+            await scheduler.run(Tenant("c", "free"), plan, 1.0, gate.wait)
+
+        # A cancelled waiter gives up its place
+        tasks[1].cancel()
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 2
+        gate.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert scheduler.running == scheduler.waiting == 0
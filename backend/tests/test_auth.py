@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+from app.api.auth import create_access_token, decode_access_token, get_current_user
+from app.services.user_cache import user_cache
+
+class FakeUsers:
+    def __init__(self, users):
+        self.users = users
+        self.queries = 0
+
+    async def find_unique(self, where):
+        self.queries += 1
+        return self.users.get(where["email"])
+
+def _bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+def test_decode_returns_subject():
+    assert decode_access_token(create_access_token({"sub": "a@x"})) == "a@x"
+
+@pytest.mark.parametrize("token", [
+    create_access_token({"sub": "a@x"}, timedelta(seconds=-1)),
+    create_access_token({"sub": "a@x"})[:-2] + "xx",
+    create_access_token({"name": "no subject"}),
+    "not-a-jwt"
+])
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(HTTPException) as error:
+        decode_access_token(token)
+    assert error.value.status_code == 401
+    assert error.value.headers["WWW-Authenticate"] == "Bearer"
+
+def test_current_user_is_cached_per_subject():
+    users = FakeUsers({"a@x": SimpleNamespace(id="a", email="a@x")})
+    db = SimpleNamespace(user=users)
+    token = create_access_token({"sub": "a@x"})
+
+    for _ in range(3):
+        assert asyncio.run(get_current_user(_bearer(token), db)).id == "a"
+    assert users.queries == 1
+
+    user_cache.invalidate("a@x")
+    asyncio.run(get_current_user(_bearer(token), db))
+    assert users.queries == 2
+
+def test_missing_token_or_user_is_unauthorized():
+    db = SimpleNamespace(user=FakeUsers({}))
+    for credentials in (None, _bearer(create_access_token({"sub": "gone@x"}))):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(get_current_user(credentials, db))
+        assert error.value.status_code == 401
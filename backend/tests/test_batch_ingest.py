@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+import io
+import tarfile
+import zipfile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.batch_ingest import save_batch_inputs, is_archive, BatchTooLarge
+
+def test_plain_files_are_saved(tmp_path):
+    saved = save_batch_inputs([("a.png", io.BytesIO(b"one")), ("b.jpg", io.BytesIO(b"two"))], str(tmp_path))
+    assert [item["filename"] for item in saved] == ["a.png", "b.jpg"]
+    with open(saved[1]["path"], "rb") as f:
+        assert f.read() == b"two"
+    assert saved[0]["file_ext"] == ".png"
+
+def test_archives_are_expanded(tmp_path):
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zf:
+        zf.writestr("shoot/one.png", b"1")
+        zf.writestr("notes.txt", b"skip me")
+    zip_buffer.seek(0)
+
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w:gz") as tf:
+        info = tarfile.TarInfo("../two.jpg")
+        info.size = 1
+        tf.addfile(info, io.BytesIO(b"2"))
+    tar_buffer.seek(0)
+
+    assert is_archive("shoot.tar.gz")
+    saved = save_batch_inputs([("shoot.zip", zip_buffer), ("more.tar.gz", tar_buffer)], str(tmp_path))
+    assert [item["filename"] for item in saved] == ["one.png", "two.jpg"]
+    # Member paths never escape the upload directory
+    assert all(os.path.dirname(item["path"]) == str(tmp_path) for item in saved)
+
+def test_batch_limit(tmp_path):
+    files = [(f"{i}.png", io.BytesIO(b"x")) for i in range(3)]
+    with pytest.raises(BatchTooLarge):
+        save_batch_inputs(files, str(tmp_path), max_files=2)
+    # Partially written files are cleaned up
+    assert os.listdir(tmp_path) == []
+
+def test_oversized_images_are_rejected_while_streaming(tmp_path):
+    with pytest.raises(BatchTooLarge):
+        save_batch_inputs([("a.png", io.BytesIO(b"ok")), ("b.png", io.BytesIO(b"x" * 10))], str(tmp_path), max_file_bytes=8)
+    assert os.listdir(tmp_path) == []
+
+
+def test_total_batch_bytes_are_limited(tmp_path):
+    files = [(f"{i}.png", io.BytesIO(b"x" * 4)) for i in range(3)]
+    with pytest.raises(BatchTooLarge):
+        save_batch_inputs(files, str(tmp_path), max_file_bytes=8, max_total_bytes=10)
+    assert os.listdir(tmp_path) == []
+
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w") as tf:
+        for i in range(3):
+            info = tarfile.TarInfo(f"{i}.jpg")
+            info.size = 4
+            tf.addfile(info, io.BytesIO(b"y" * 4))
+    tar_buffer.seek(0)
+    with pytest.raises(BatchTooLarge):
+        save_batch_inputs([("shoot.tar", tar_buffer)], str(tmp_path), max_file_bytes=8, max_total_bytes=10)
+    assert os.listdir(tmp_path) == []
+
+    saved = save_batch_inputs([("a.png", io.BytesIO(b"x" * 4))], str(tmp_path), max_file_bytes=8, max_total_bytes=10)
+    assert saved[0]["size"] == 4
@@ -0,0 +1,53 @@
+import pytest
+import sys
+import os
+from PIL import Image
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import synthetic_image, synthetic_size, run_benchmarks, compare
+
+def test_synthetic_images_have_requested_size(tmp_path):
+    assert synthetic_size(12) == (4000, 3000)
+    for fmt, expected in (("jpeg", "JPEG"), ("png", "PNG"), ("webp", "WEBP")):
+        path = synthetic_image(str(tmp_path / f"image.{fmt}"), 0.05, fmt)
+        with Image.open(path) as img:
+            assert img.format == expected
+            assert img.size == synthetic_size(0.05)
+
+def test_encode_stages_report_output_bytes(tmp_path):
+    results = run_benchmarks([0.05], ["png"], ["encode_fast", "encode_smallest_webp"], str(tmp_path), repeats=1, trace_allocations=False, isolated=False)
+
+    for case in results["cases"]:
+        assert case["status"] == "ok", case.get("detail")
+        assert case["output_bytes"] > 0
+    assert os.listdir(str(tmp_path)) == ["synthetic_0.05mp.png"]
+
+def test_run_benchmarks_reports_every_case(tmp_path):
+    results = run_benchmarks([0.05], ["png"], ["binary", "hash", "pipeline"], str(tmp_path), repeats=2, isolated=False)
+
+    assert [case["stage"] for case in results["cases"]] == ["binary", "hash", "pipeline"]
+    for case in results["cases"]:
+        assert case["status"] == "ok", case.get("detail")
+        assert 0 < case["wall_seconds_min"] <= case["wall_seconds_median"] <= case["wall_seconds_max"]
+        assert case["peak_rss_mb"] > 0
+        assert "alloc_peak_mb" in case
+    # Stage outputs are cleaned up; only the cached input remains
+    assert os.listdir(str(tmp_path)) == ["synthetic_0.05mp.png"]
+
+def test_compare_flags_regressions():
+    def results(wall, rss):
+        return {"cases": [{"stage": "binary", "megapixels": 1, "format": "png", "status": "ok", "wall_seconds_min": wall, "peak_rss_mb": rss}]}
+
+    comparisons = compare(results(1.2, 100), results(1.0, 100), threshold=0.1)
+    by_metric = {item["metric"]: item for item in comparisons}
+    assert by_metric["wall_seconds_min"]["regressed"] is True
+    assert by_metric["wall_seconds_min"]["ratio"] == 1.2
+    assert by_metric["peak_rss_mb"]["regressed"] is False
+    assert all(item["case"] == "binary/1mp/png" for item in comparisons)
+
+    # Cases missing from the baseline or not measured are not compared
+    skipped = {"cases": [{"stage": "binary", "megapixels": 1, "format": "png", "status": "skipped"}]}
+    assert compare(skipped, results(1.0, 100), threshold=0.1) == []
+    assert compare(results(1.0, 100), {"cases": []}, threshold=0.1) == []
@@ -0,0 +1,141 @@
+import pytest
+import sys
+import os
+import hashlib
+import errno
+import asyncio
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.blob_store import BlobStore, ResultIndex, normalize_ext, store_call
+
+def _write(store, content, ext=".png"):
+    path = store.temp_path(ext)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path, hashlib.sha256(content).hexdigest()
+
+def _store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"), str(tmp_path / "blobs.sqlite3"))
+
+def test_blobs_are_sharded_by_digest(tmp_path):
+    store = _store(tmp_path)
+    temp, digest = _write(store, b"image bytes")
+
+    path = store.adopt(temp, digest, ".PNG")
+    assert store.relpath_of(path) == f"{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert not os.path.exists(temp)
+    with open(path, "rb") as f:
+        assert f.read() == b"image bytes"
+
+def test_duplicates_are_stored_once(tmp_path):
+    store = _store(tmp_path)
+    first = store.adopt(*_write(store, b"same"), ".jpg")
+    temp, digest = _write(store, b"same", ".jpeg")
+
+    # The first extension wins; the duplicate temp file is discarded
+    assert store.adopt(temp, digest, ".jpeg") == first
+    assert store.refs(digest) == 2
+    assert os.listdir(store.tmp_dir) == []
+
+def test_release_deletes_last_reference(tmp_path):
+    store = _store(tmp_path)
+    temp, digest = _write(store, b"data")
+    path = store.adopt(temp, digest)
+    assert store.acquire(digest) is True
+
+    store.release(digest)
+    assert os.path.exists(path)
+    store.release(digest)
+    assert not os.path.exists(path)
+    assert store.refs(digest) == 0
+    assert store.acquire(digest) is False
+
+def test_sweep_removes_only_stale_temp_files(tmp_path):
+    store = _store(tmp_path)
+    stale = store.temp_path()
+    os.utime(stale, (0, 0))
+    fresh = store.temp_path()
+
+    assert store.sweep_tmp(max_age=60) == 1
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+def test_temp_files_are_outside_the_store_root(tmp_path):
+    store = _store(tmp_path)
+    temp = store.temp_path(".png")
+    assert not os.path.abspath(temp).startswith(os.path.abspath(store.root) + os.sep)
+
+    # Leftovers of the old root/tmp location are swept too
+    os.makedirs(os.path.join(store.root, "tmp"))
+    legacy = os.path.join(store.root, "tmp", "old.png")
+    open(legacy, "wb").close()
+    os.utime(legacy, (0, 0))
+    assert store.sweep_tmp(max_age=60) == 1
+    assert not os.path.exists(legacy)
+
+def test_adopt_copies_across_filesystems(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    temp, digest = _write(store, b"moved")
+    real_replace = os.replace
+
+    def replace(source, destination):
+        if source == temp:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        real_replace(source, destination)
+    monkeypatch.setattr(os, "replace", replace)
+
+    path = store.adopt(temp, digest, ".png")
+    with open(path, "rb") as f:
+        assert f.read() == b"moved"
+    assert not os.path.exists(temp)
+    assert not os.path.exists(path + ".part")
+
+def test_store_calls_finish_and_undo_for_cancelled_callers(tmp_path):
+    store = _store(tmp_path)
+    temp, digest = _write(store, b"adopted late")
+    started, proceed, undone = threading.Event(), threading.Event(), threading.Event()
+
+    def slow_adopt(*args):
+        started.set()
+        # Another process holding the database lock
+        proceed.wait(5)
+        return store.adopt(*args)
+
+    def undo(path):
+        store.release(digest)
+        undone.set()
+
+    async def scenario():
+        call = asyncio.create_task(store_call(slow_adopt, temp, digest, ".png", undo=undo))
+        await asyncio.to_thread(started.wait, 5)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        proceed.set()
+        await asyncio.to_thread(undone.wait, 5)
+
+    asyncio.run(scenario())
+    # The adopt ran to the end and its reference was given back
+    assert not os.path.exists(temp)
+    assert store.refs(digest) == 0
+    assert store.find(digest) is None
+    assert asyncio.run(store_call(store.refs, digest)) == 0
+
+def test_rejects_non_digests(tmp_path):
+    with pytest.raises(ValueError):
+        _store(tmp_path).relpath("../../etc/passwd")
+    assert normalize_ext(".png/../x") == ""
+
+def test_result_index_is_keyed_by_pipeline_version(tmp_path):
+    index = ResultIndex(str(tmp_path / "results.sqlite3"))
+    index.put("abc", "1", "high", {"protected_hash": "def"})
+
+    assert index.get("abc", "1", "high") == {"protected_hash": "def"}
+    assert index.get("abc", "2", "high") is None
+    assert index.get("abc", "1", "low") is None
+
+    index.discard("abc", "1", "high")
+    assert index.get("abc", "1", "high") is None
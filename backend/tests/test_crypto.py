@@ -26,15 +26,67 @@ def test_hashing():
     
     os.remove("test_hash.txt")
 
-def test_signing_and_verification():
+def test_signing_and_verification(tmp_path):
     private_key, public_key = CryptoEngine.generate_key_pair()
-    content_hash = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855" # Empty file hash
+    signed = str(tmp_path / "signed.txt")
+    other = str(tmp_path / "other.txt")
+    with open(signed, "wb") as f:
+        f.write(b"signed content")
+    with open(other, "wb") as f:
+        f.write(b"other content")
     
-    signature = CryptoEngine.sign_content(content_hash, private_key)
+    signature = CryptoEngine.sign_content(signed, private_key)
     assert signature is not None
     
-    is_valid = CryptoEngine.verify_signature(content_hash, signature, public_key)
+    is_valid = CryptoEngine.verify_signature(signed, signature, public_key)
     assert is_valid is True
     
-    is_invalid = CryptoEngine.verify_signature("wrong_hash", signature, public_key)
+    is_invalid = CryptoEngine.verify_signature(other, signature, public_key)
     assert is_invalid is False
+
+def test_sign_digest_matches_sign_content():
+    private_key, public_key = CryptoEngine.generate_key_pair()
+    with open("test_digest.txt", "wb") as f:
+        f.write(b"digest content")
+
+    signature = CryptoEngine.sign_digest(CryptoEngine.create_hash("test_digest.txt"), private_key)
+    # Ed25519 signatures are deterministic
+    assert signature == CryptoEngine.sign_content("test_digest.txt", private_key)
+    assert CryptoEngine.verify_signature("test_digest.txt", signature, public_key) is True
+
+    os.remove("test_digest.txt")
+
+def test_verify_many_files_and_digests(tmp_path):
+    private_key, public_key = CryptoEngine.generate_key_pair()
+    items = []
+    for i in range(20):
+        path = str(tmp_path / f"file{i}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(1000 + i))
+        items.append((path, CryptoEngine.sign_content(path, private_key), public_key))
+    # Tamper with one file after signing
+    with open(items[5][0], "ab") as f:
+        f.write(b"x")
+
+    results = list(CryptoEngine.verify_many(items, workers=4))
+    assert [r.source for r in results] == [item[0] for item in items]
+    assert [r.valid for r in results] == [i != 5 for i in range(20)]
+
+    digests = [(r.digest, item[1], public_key) for r, item in zip(results, items)]
+    assert [r.valid for r in CryptoEngine.verify_many(digests, digests=True)] == [i != 5 for i in range(20)]
+
+def test_verify_many_reports_errors(tmp_path):
+    private_key, public_key = CryptoEngine.generate_key_pair()
+    digest = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    items = [
+        (str(tmp_path / "missing.bin"), "", public_key),
+        (digest, CryptoEngine.sign_digest(digest, private_key), "not a key"),
+    ]
+    missing, malformed = CryptoEngine.verify_many(items[:1]), CryptoEngine.verify_many(items[1:], digests=True)
+    missing, malformed = next(missing), next(malformed)
+    assert missing.valid is False and missing.error
+    assert malformed.valid is False and "Malformed" in malformed.error
+
+def test_public_keys_are_cached_by_fingerprint():
+    _, public_key = CryptoEngine.generate_key_pair()
+    assert CryptoEngine.load_public_key(public_key) is CryptoEngine.load_public_key(public_key + "\n")
@@ -0,0 +1,21 @@
+import pytest
+import sys
+import os
+from urllib.parse import parse_qs, urlsplit
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import pooled_url, get_db, prisma
+
+def test_pooled_url_adds_pool_parameters():
+    url = pooled_url("postgresql://u:p@host/db?sslmode=require", "20", "5")
+    query = parse_qs(urlsplit(url).query)
+    assert query == {"sslmode": ["require"], "connection_limit": ["20"], "pool_timeout": ["5"]}
+
+def test_pooled_url_keeps_explicit_parameters():
+    url = pooled_url("postgresql://u:p@host/db?connection_limit=3", "20", None)
+    assert parse_qs(urlsplit(url).query) == {"connection_limit": ["3"]}
+
+def test_routers_share_one_client():
+    assert get_db() is prisma
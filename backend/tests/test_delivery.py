@@ -0,0 +1,156 @@
+import pytest
+import sys
+import os
+import hashlib
+import asyncio
+import numpy as np
+from PIL import Image
+from fastapi import FastAPI, Request
+from httpx import AsyncClient, ASGITransport
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import delivery
+from app.api.delivery import FileRangeResponse, serve_store_path, serve_variant, parse_range, etag_matches, IMMUTABLE_CACHE_CONTROL
+from app.services.blob_store import BlobStore
+from app.services.variants import VariantCache
+
+CONTENT = bytes(range(256)) * 40
+
+class Client:
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, url, headers=None):
+        async def send():
+            async with AsyncClient(transport=ASGITransport(app=self.app), base_url="http://test") as client:
+                return await client.request(method, url, headers=headers)
+        return asyncio.run(send())
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+    def head(self, url, headers=None):
+        return self.request("HEAD", url, headers)
+
+@pytest.fixture
+def client(tmp_path):
+    store = BlobStore(str(tmp_path / "protected"), str(tmp_path / "blobs.sqlite3"))
+    temp = store.temp_path(".png")
+    with open(temp, "wb") as f:
+        f.write(CONTENT)
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    url = "/files/" + store.relpath_of(store.adopt(temp, digest, ".png"))
+    with open(os.path.join(store.root, "legacy_protected.png"), "wb") as f:
+        f.write(b"legacy")
+
+    app = FastAPI()
+
+    @app.api_route("/files/{blob_path:path}", methods=["GET", "HEAD"])
+    async def files(blob_path: str, request: Request):
+        return serve_store_path(request, store, blob_path)
+
+    return Client(app), url, digest
+
+def test_full_response_has_strong_etag(client):
+    client, url, digest = client
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{digest}"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["accept-ranges"] == "bytes"
+
+def test_if_none_match_returns_304(client):
+    client, url, digest = client
+    response = client.get(url, headers={"If-None-Match": f'"other", W/"{digest}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_range_requests(client):
+    client, url, digest = client
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+    assert client.get(url, headers={"Range": "bytes=-10"}).content == CONTENT[-10:]
+    assert client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+    # A stale If-Range validator means the whole file is sent
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+
+def test_head_sends_no_body(client):
+    client, url, _ = client
+    response = client.head(url)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.content == b""
+
+def test_legacy_names_and_bad_paths(client):
+    client, url, _ = client
+    legacy = client.get("/files/legacy_protected.png")
+    assert legacy.content == b"legacy"
+    assert legacy.headers["etag"].startswith('W/"')
+    assert "immutable" not in legacy.headers["cache-control"]
+
+    assert client.get("/files/../blobs.sqlite3").status_code == 404
+    assert client.get("/files/tmp/whatever.png").status_code == 404
+    assert client.get(url.replace(".png", ".jpg")).status_code == 404
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-0", 100) == (0, 1)
+    assert parse_range("bytes=90-", 100) == (90, 10)
+    assert parse_range("bytes=90-500", 100) == (90, 10)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+def test_etag_matches():
+    assert etag_matches("*", '"a"')
+    assert etag_matches('W/"a"', '"a"')
+    assert not etag_matches('"b"', '"a"')
+
+def test_ranges_are_streamed_in_chunks(tmp_path):
+    path = str(tmp_path / "file.bin")
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    response = FileRangeResponse(path, 10, 20, 206, {})
+    response.chunk_size = 8
+    asyncio.run(response({"type": "http"}, None, send))
+    bodies = messages[1:]
+    assert [len(message["body"]) for message in bodies] == [8, 8, 4]
+    assert b"".join(message["body"] for message in bodies) == CONTENT[10:30]
+    assert [message["more_body"] for message in bodies] == [True, True, False]
+
+def test_variant_etags_differ_by_format(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "protected"), str(tmp_path / "blobs.sqlite3"))
+    temp = store.temp_path(".png")
+    Image.fromarray(np.zeros((40, 60, 3), dtype=np.uint8)).save(temp)
+    with open(temp, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    blob_path = store.relpath_of(store.adopt(temp, digest, ".png"))
+    monkeypatch.setattr(delivery, "protected_store", store)
+    monkeypatch.setattr(delivery, "variant_cache", VariantCache(str(tmp_path / "variants"), 1 << 20))
+
+    app = FastAPI()
+
+    @app.get("/variants/{blob_path:path}")
+    async def variants(blob_path: str, request: Request, fmt: str):
+        return await serve_variant(request, blob_path, 30, None, fmt)
+
+    client = Client(app)
+    webp = client.get(f"/variants/{blob_path}?fmt=webp")
+    png = client.get(f"/variants/{blob_path}?fmt=png")
+    assert webp.headers["content-type"] == "image/webp"
+    assert webp.headers["etag"] != png.headers["etag"]
+    # A cached PNG does not validate the WebP
+    assert client.get(f"/variants/{blob_path}?fmt=webp", headers={"If-None-Match": png.headers["etag"]}).status_code == 200
+    assert client.get(f"/variants/{blob_path}?fmt=png", headers={"If-None-Match": png.headers["etag"]}).status_code == 304
@@ -0,0 +1,100 @@
+import pytest
+import sys
+import os
+import numpy as np
+from PIL import Image, ImageCms
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.encoder import OutputSettings, encoder_options, metadata_options, encode_image, format_for_path, source_extension, ENCODER_PROFILES
+from app.services.protection_pipeline import protect_file
+
+def _noise(size=(96, 64)):
+    data = np.random.RandomState(0).randint(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    return Image.fromarray(data)
+
+def test_profiles_cover_each_format():
+    for profile in ENCODER_PROFILES:
+        assert "compress_level" in encoder_options("PNG", profile)
+        assert "quality" not in encoder_options("PNG", profile)
+        assert encoder_options("JPEG", profile)["subsampling"] == "4:2:0"
+        assert "lossless" not in encoder_options("WEBP", profile)
+        assert encoder_options("WEBP", profile, lossless=True)["lossless"] is True
+    assert encoder_options("JPEG", "smallest")["progressive"] is True
+    assert encoder_options("BMP", "fast") == {}
+    with pytest.raises(ValueError):
+        encoder_options("PNG", "tiny")
+
+def test_output_settings_parse():
+    assert OutputSettings.parse("FAST", "WebP") == ("fast", "webp")
+    assert OutputSettings.parse("smallest", "original").transcode is None
+    assert OutputSettings.parse("fast", "webp").extension(".png") == ".webp"
+    assert OutputSettings.parse("fast", "original").extension(".png") == ".png"
+    assert OutputSettings("fast", "webp").key != OutputSettings("fast", None).key
+    with pytest.raises(ValueError):
+        OutputSettings.parse("tiny")
+    with pytest.raises(ValueError):
+        OutputSettings.parse("fast", "gif")
+
+def test_metadata_is_kept_explicitly():
+    info = {"exif": b"Exif\x00\x00data", "icc_profile": b"icc", "dpi": (300, 300), "transparency": 0, "progressive": 1, "jfif": 257}
+    assert metadata_options(info, "JPEG") == {"exif": b"Exif\x00\x00data", "icc_profile": b"icc", "dpi": (300, 300)}
+    assert metadata_options(info, "WEBP") == {"exif": b"Exif\x00\x00data", "icc_profile": b"icc"}
+    assert metadata_options({}, "PNG") == {}
+
+@pytest.mark.parametrize("extension", [".jpg", ".png", ".webp"])
+def test_encode_preserves_exif_and_icc(tmp_path, extension):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    source = str(tmp_path / "source.jpg")
+    _noise().save(source, exif=exif.tobytes(), icc_profile=icc)
+
+    with Image.open(source) as img:
+        info = dict(img.info)
+        destination = encode_image(img.convert("RGB"), str(tmp_path / f"out{extension}"), info, "fast", img.format)
+
+    with Image.open(destination) as out:
+        assert out.format == format_for_path(destination)
+        assert out.getexif().get(0x0112) == 6
+        assert out.info.get("icc_profile") == icc
+
+def test_webp_from_lossless_source_is_exact(tmp_path):
+    image = _noise()
+    for profile in ENCODER_PROFILES:
+        destination = encode_image(image, str(tmp_path / f"{profile}.webp"), {}, profile, source_format="PNG")
+        assert np.array_equal(np.array(Image.open(destination)), np.array(image))
+
+def test_protect_file_reports_encoding(tmp_path):
+    source = str(tmp_path / "source.png")
+    _noise().save(source)
+
+    sizes = {}
+    for profile in ENCODER_PROFILES:
+        destination = str(tmp_path / f"{profile}.png")
+        result = protect_file(source, destination, None, 'high', profile=profile)
+        assert result["encoding"]["profile"] == profile
+        assert result["encoding"]["format"] == "PNG"
+        assert result["encoding"]["bytes"] == os.path.getsize(destination)
+        assert result["encoding"]["seconds"] >= 0
+        sizes[profile] = result["encoding"]["bytes"]
+    assert sizes["smallest"] <= sizes["fast"]
+
+    result = protect_file(source, str(tmp_path / "out.webp"), None, 'high', profile="fast")
+    assert result["encoding"]["format"] == "WEBP"
+
+def test_source_extension_falls_back_to_the_probed_format(tmp_path):
+    assert source_extension("photo.JPEG", "JPEG") == ".jpeg"
+    assert source_extension("photo", "JPEG") == ".jpg"
+    assert source_extension("photo.upload", "PNG") == ".png"
+    assert source_extension("", "WEBP") == ".webp"
+    with pytest.raises(ValueError):
+        source_extension("photo", "NOT-A-FORMAT")
+
+    # An upload saved without an extension still encodes in its own format
+    source = str(tmp_path / "upload")
+    _noise().save(source, format="PNG")
+    destination = str(tmp_path / ("out" + source_extension(source, "PNG")))
+    result = protect_file(source, destination, None, 'high', profile="fast")
+    assert result["encoding"]["format"] == "PNG"
@@ -0,0 +1,48 @@
+import pytest
+import sys
+import os
+import time
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.executor import ProtectionExecutor, ExecutorSaturated, JobTimeout
+
+def _square(x):
+    return x * x
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def test_run_returns_result():
+    executor = ProtectionExecutor(max_workers=1, max_queue=1, job_timeout=30)
+    try:
+        assert asyncio.run(executor.run(_square, 7)) == 49
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+def test_rejects_when_queue_full():
+    executor = ProtectionExecutor(max_workers=1, max_queue=0, job_timeout=30)
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run(_sleep, 0.5))
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(_square, 2)
+        return await first
+
+    try:
+        assert asyncio.run(scenario()) == 0.5
+    finally:
+        executor.shutdown()
+
+def test_job_timeout():
+    executor = ProtectionExecutor(max_workers=1, max_queue=1, job_timeout=0.2)
+    try:
+        with pytest.raises(JobTimeout):
+            asyncio.run(executor.run(_sleep, 2))
+    finally:
+        executor.shutdown()
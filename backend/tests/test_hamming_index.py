@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+import threading
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.hamming_index import HammingIndex, IndexSync, popcount
+
+def _flip(code, bits):
+    for bit in bits:
+        code ^= 1 << bit
+    return code
+
+def _random_codes(count, seed=0):
+    return [int(c) for c in np.random.RandomState(seed).randint(0, 2 ** 64, count, dtype=np.uint64)]
+
+def test_popcount():
+    values = np.array([0, 1, 3, 2 ** 64 - 1], dtype=np.uint64)
+    assert popcount(values).tolist() == [0, 1, 2, 64]
+
+def test_finds_codes_within_radius():
+    codes = _random_codes(5000)
+    index = HammingIndex()
+    index.add_many((f"c{i}", code) for i, code in enumerate(codes))
+
+    target = codes[123]
+    near = _flip(target, [0, 17, 33, 50, 63, 5, 21, 40, 60])  # 9 bits, spread over every chunk
+    matches = index.search(near, max_distance=10)
+    assert matches[0] == ("c123", 9)
+    assert index.search(near, max_distance=8) == []
+
+def test_matches_brute_force():
+    codes = _random_codes(3000, seed=1)
+    # Plant near duplicates so there is something to find
+    codes += [_flip(codes[i], range(i % 7)) for i in range(0, 300, 3)]
+    index = HammingIndex(merge_threshold=500)
+    for i, code in enumerate(codes):
+        index.add(f"c{i}", code)
+    assert len(index) == len(codes)
+
+    array = np.array(codes, dtype=np.uint64)
+    for query in codes[:50]:
+        distances = popcount(array ^ np.uint64(query))
+        expected = sorted((int(d), f"c{i}") for i, d in enumerate(distances) if d <= 12)
+        found = sorted((d, content_id) for content_id, d in index.search(query, max_distance=12, limit=None))
+        assert found == expected
+
+def test_pending_codes_are_searchable():
+    index = HammingIndex(merge_threshold=100)
+    index.add_many(("old", code) for code in _random_codes(10))
+    index.add("new", 0xFFFF)
+    assert index.search(0xFFFE, max_distance=2) == [("new", 1)]
+
+def test_limit_and_clear():
+    index = HammingIndex()
+    index.add_many((f"c{i}", _flip(0, range(i))) for i in range(5))
+    assert [content_id for content_id, _ in index.search(0, limit=3)] == ["c0", "c1", "c2"]
+
+    index.clear()
+    assert len(index) == 0
+    assert index.search(0) == []
+
+def test_sync_skips_contents_it_already_indexed():
+    index = HammingIndex()
+    sync = IndexSync(index, overlap=60)
+    assert sync.since is None
+
+    assert sync.add_rows([("a", 1, 1000.0), ("b", 2, 1010.0)]) == 2
+    assert sync.since == 1010.0 - 60
+    # The next refresh looks back over the overlap window and sees both again
+    assert sync.add_rows([("a", 1, 1000.0), ("b", 2, 1010.0), ("c", 3, 1005.0)]) == 1
+    assert len(index) == 3
+
+    # Content this process created is not added twice when the refresh brings it
+    sync.add_local("d", 4)
+    assert sync.add_rows([("d", 4, 1020.0)]) == 0
+    assert [content_id for content_id, _ in index.search(4, max_distance=0)] == ["d"]
+
+    sync.reset()
+    assert len(index) == 0 and sync.since is None
+
+def test_searches_run_while_another_thread_merges():
+    codes = _random_codes(20000, seed=2)
+    index = HammingIndex(merge_threshold=10 ** 9)
+    index.add_many((f"c{i}", code) for i, code in enumerate(codes[:10000]))
+    index.add_many(((f"c{i}", code) for i, code in enumerate(codes) if i >= 10000), merge=False)
+
+    merging = threading.Thread(target=index.merge)
+    merging.start()
+    # Pending or merged, every code stays findable
+    for i in range(0, 20000, 500):
+        assert index.search(codes[i], max_distance=0)[0] == (f"c{i}", 0)
+    merging.join()
+    assert index.search(codes[15000], max_distance=0) == [("c15000", 0)]
+    assert len(index) == 20000
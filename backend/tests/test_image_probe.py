@@ -0,0 +1,96 @@
+import pytest
+import sys
+import os
+import struct
+import zlib
+import numpy as np
+from PIL import Image, ImageFile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.image_probe import probe_image, plan_protection, ImageProbe, UnsupportedImage, LARGE_IMAGE_TILE_ROWS
+from app.services.protection_pipeline import ImageTooLarge
+
+def _image(path, size=(64, 48), fmt=None, **params):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(data).save(path, format=fmt, **params)
+    return path
+
+def _png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+def test_probe_reads_header_without_decoding(tmp_path, monkeypatch):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = _image(str(tmp_path / "photo.jpg"), (80, 60), exif=exif.tobytes())
+
+    def fail(self):
+        raise AssertionError("probe decoded pixels")
+    monkeypatch.setattr(ImageFile.ImageFile, "load", fail)
+
+    probe = probe_image(path)
+    assert probe == ImageProbe("JPEG", 80, 60, "RGB", 1, 6)
+    assert probe.pixels == 4800
+
+def test_probe_rejects_non_images_and_unsupported_formats(tmp_path):
+    text = tmp_path / "notes.jpg"
+    text.write_text("not an image")
+    with pytest.raises(UnsupportedImage):
+        probe_image(str(text))
+
+    gif = _image(str(tmp_path / "image.gif"))
+    with pytest.raises(UnsupportedImage, match="format GIF"):
+        probe_image(gif)
+    assert probe_image(gif, formats=frozenset({"GIF"})).format == "GIF"
+
+def test_probe_rejects_animations(tmp_path):
+    frames = [Image.new("RGB", (16, 16), color) for color in ("red", "blue")]
+    path = str(tmp_path / "animated.webp")
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    with pytest.raises(UnsupportedImage, match="multi-page"):
+        probe_image(path)
+
+def test_probe_rejects_truncated_files(tmp_path):
+    for name in ("photo.jpg", "image.png"):
+        path = _image(str(tmp_path / name), (256, 256))
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        with pytest.raises(UnsupportedImage, match="(?i)truncated"):
+            probe_image(path)
+
+def test_probe_enforces_size_limits(tmp_path):
+    path = _image(str(tmp_path / "image.png"), (100, 50))
+    assert probe_image(path, max_pixels=5000).pixels == 5000
+    with pytest.raises(ImageTooLarge):
+        probe_image(path, max_pixels=4999)
+    with pytest.raises(ImageTooLarge):
+        probe_image(path, max_dimension=99)
+
+def test_probe_rejects_decompression_bomb(tmp_path):
+    # A few hundred bytes claiming 100000 x 100000 pixels
+    header = struct.pack(">IIBBBBB", 100000, 100000, 8, 2, 0, 0, 0)
+    data = (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"\x00" * 64))
+        + _png_chunk(b"IEND", b"")
+    )
+    path = tmp_path / "bomb.png"
+    path.write_bytes(data)
+    with pytest.raises(ImageTooLarge):
+        probe_image(str(path))
+
+def test_plan_picks_level_and_pool_from_dimensions():
+    small = plan_protection(ImageProbe("PNG", 300, 200, "RGB", 1, 1), large_pixels=4_000_000)
+    assert small == ("low", None, False)
+
+    medium = plan_protection(ImageProbe("PNG", 800, 800, "RGB", 1, 1), large_pixels=4_000_000)
+    assert medium.level == "mid"
+    assert not medium.large
+
+    large = plan_protection(ImageProbe("JPEG", 4000, 3000, "RGB", 1, 1), large_pixels=4_000_000)
+    assert large == ("high", LARGE_IMAGE_TILE_ROWS, True)
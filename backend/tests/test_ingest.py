@@ -0,0 +1,29 @@
+import pytest
+import sys
+import os
+import io
+import hashlib
+import asyncio
+from fastapi import UploadFile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ingest import ingest_upload, UploadTooLarge
+
+def test_ingest_hashes_while_writing(tmp_path):
+    content = os.urandom(300 * 1024)
+    destination = str(tmp_path / "upload.bin")
+
+    ingested = asyncio.run(ingest_upload(UploadFile(io.BytesIO(content), filename="a.png"), destination, len(content), chunk_size=64 * 1024))
+
+    assert ingested.sha256 == hashlib.sha256(content).hexdigest()
+    assert ingested.size == len(content)
+    with open(destination, "rb") as f:
+        assert f.read() == content
+
+def test_ingest_enforces_size_limit(tmp_path):
+    destination = str(tmp_path / "upload.bin")
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(ingest_upload(UploadFile(io.BytesIO(b"x" * 1000), filename="a.png"), destination, 999, chunk_size=100))
+    assert not os.path.exists(destination)
@@ -0,0 +1,189 @@
+import pytest
+import sys
+import os
+import asyncio
+import socket
+import urllib.request
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.job_queue import (
+    JobQueue, JobWorker, RequeueJob, JobClaimLost, InvalidCallbackURL, validate_callback_url, send_callback,
+    JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+)
+
+def test_enqueue_claim_complete(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    first = queue.enqueue({"n": 1})
+    second = queue.enqueue({"n": 2}, callback_url="http://example.invalid/hook")
+
+    job = queue.claim()
+    assert job["id"] == first
+    assert job["status"] == JOB_RUNNING
+    assert job["payload"] == {"n": 1}
+
+    queue.complete(first, {"content_id": "abc"})
+    done = queue.get(first)
+    assert done["status"] == JOB_SUCCEEDED
+    assert done["result"] == {"content_id": "abc"}
+    assert done["progress"] == 1
+
+    assert queue.claim()["id"] == second
+    assert queue.claim() is None
+
+def test_recover_requeues_running_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    job_id = JobQueue(path).enqueue({})
+    JobQueue(path).claim()
+
+    # A restarted process sees the same file
+    queue = JobQueue(path)
+    assert queue.recover() == 1
+    assert queue.get(job_id)["status"] == JOB_QUEUED
+
+def test_recovered_jobs_cannot_be_finished_by_their_first_owner(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.enqueue({})
+    first = queue.claim()
+    assert queue.update_progress(job_id, "protecting", 0.2, first["claim"])
+
+    assert queue.recover() == 1
+    second = queue.claim()
+    assert second["claim"] != first["claim"]
+    assert not queue.update_progress(job_id, "saving", 0.9, first["claim"])
+    assert not queue.complete(job_id, {"content_id": "first"}, first["claim"])
+    assert not queue.requeue(job_id, first["claim"])
+    assert queue.get(job_id)["status"] == JOB_RUNNING
+
+    assert queue.complete(job_id, {"content_id": "second"}, second["claim"])
+    assert queue.get(job_id)["result"] == {"content_id": "second"}
+    assert queue.get(job_id)["attempts"] == 2
+
+def test_worker_heartbeats_long_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.enqueue({})
+    outcomes = []
+
+    async def handler(job):
+        # Waits far longer than stale_after without reporting progress
+        await asyncio.sleep(0.3)
+        outcomes.append(queue.recover(0.1))
+        return {"ok": True}
+
+    async def scenario():
+        worker = JobWorker(queue, handler, poll_interval=0.01, stale_after=0.1, heartbeat_interval=0.02)
+        worker.start()
+        for _ in range(100):
+            if queue.count(JOB_QUEUED) == 0 and queue.count(JOB_RUNNING) == 0:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(scenario())
+    assert outcomes == [0]
+    assert queue.get(job_id)["status"] == JOB_SUCCEEDED
+    assert queue.get(job_id)["attempts"] == 1
+
+def test_worker_leaves_jobs_it_lost(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.enqueue({})
+
+    async def handler(job):
+        # Another process recovered and claimed the job meanwhile
+        queue.recover()
+        queue.claim()
+        raise JobClaimLost()
+
+    async def scenario():
+        worker = JobWorker(queue, handler, poll_interval=0.01)
+        await worker._process(queue.claim())
+
+    asyncio.run(scenario())
+    job = queue.get(job_id)
+    assert job["status"] == JOB_RUNNING
+    assert job["attempts"] == 2
+
+def test_worker_drains_queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    attempts = []
+
+    async def handler(job):
+        attempts.append(job["id"])
+        if job["payload"].get("fail"):
+            raise ValueError("bad image")
+        if job["payload"].get("busy") and attempts.count(job["id"]) == 1:
+            raise RequeueJob()
+        return {"n": job["payload"]["n"]}
+
+    ok = queue.enqueue({"n": 1})
+    busy = queue.enqueue({"n": 2, "busy": True})
+    bad = queue.enqueue({"n": 3, "fail": True})
+
+    async def scenario():
+        worker = JobWorker(queue, handler, concurrency=2, poll_interval=0.01)
+        worker.start()
+        for _ in range(200):
+            if queue.count(JOB_QUEUED) == 0 and queue.count(JOB_RUNNING) == 0:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(scenario())
+
+    assert queue.get(ok)["result"] == {"n": 1}
+    assert queue.get(busy)["status"] == JOB_SUCCEEDED
+    assert queue.get(busy)["attempts"] == 2
+    assert queue.get(bad)["status"] == JOB_FAILED
+    assert queue.get(bad)["error"] == "bad image"
+
+def test_claim_shares_workers_between_owners(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    bulk = [queue.enqueue({"n": n}, owner="bulk") for n in range(5)]
+    small = queue.enqueue({"n": 0}, owner="small")
+
+    assert queue.claim()["id"] == bulk[0]
+    # The owner with nothing running goes next despite queuing last
+    assert queue.claim()["id"] == small
+    assert queue.claim()["id"] == bulk[1]
+    assert queue.count_by_owner(JOB_RUNNING) == {"bulk": 2, "small": 1}
+    assert queue.count_by_owner(JOB_QUEUED) == {"bulk": 3}
+
+def _resolver(addresses):
+    def resolve(host, port, type=0):
+        if host not in addresses:
+            raise socket.gaierror("unknown host")
+        return [(socket.AF_INET, type, 0, "", (address, port)) for address in addresses[host]]
+    return resolve
+
+def test_callback_urls_must_be_public_http():
+    resolve = _resolver({
+        "hooks.example.com": ["93.184.216.34"],
+        "internal.example.com": ["10.0.0.5"],
+        "mixed.example.com": ["93.184.216.34", "127.0.0.1"],
+        "127.0.0.1": ["127.0.0.1"],
+        "169.254.169.254": ["169.254.169.254"],
+        "::ffff:10.0.0.1": ["::ffff:10.0.0.1"]
+    })
+    assert validate_callback_url("https://hooks.example.com/done", resolve) == "https://hooks.example.com/done"
+    for url in (
+        "file:///etc/passwd",
+        "ftp://hooks.example.com/",
+        "https:///no-host",
+        "http://internal.example.com/",
+        "http://mixed.example.com/",
+        "http://127.0.0.1:8000/admin",
+        "http://169.254.169.254/latest/meta-data/",
+        "http://[::ffff:10.0.0.1]/",
+        "http://unknown.example.com/",
+        "http://hooks.example.com:99999/"
+    ):
+        with pytest.raises(InvalidCallbackURL):
+            validate_callback_url(url, resolve)
+
+def test_send_callback_refuses_internal_urls(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("callback was sent")
+    monkeypatch.setattr(urllib.request.OpenerDirector, "open", fail)
+    job = {"id": "j1", "status": JOB_SUCCEEDED, "stage": "done", "progress": 1, "result": {}, "error": None, "created_at": 0, "updated_at": 0}
+    assert send_callback("http://127.0.0.1:8000/internal", job) is False
@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("KEYSTORE_SECRET", "test-secret")
+
+from app.services.key_store import KeyStore, SigningKeyMissing
+from app.services.crypto_engine import CryptoEngine
+
+DIGEST = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+
+def test_key_is_created_once_and_reused(tmp_path):
+    store = KeyStore(str(tmp_path), "secret")
+    public_key = store.public_key_pem("user-1")
+
+    assert os.path.exists(store.path("user-1"))
+    assert store.public_key_pem("user-1") == public_key
+    assert store.public_key_pem("user-2") != public_key
+
+    # A fresh store (another worker, or after a restart) reads the same key
+    assert KeyStore(str(tmp_path), "secret").public_key_pem("user-1") == public_key
+
+def test_key_is_encrypted_at_rest(tmp_path):
+    store = KeyStore(str(tmp_path), "secret")
+    store.public_key_pem("user-1")
+
+    with open(store.path("user-1"), "rb") as f:
+        assert b"ENCRYPTED PRIVATE KEY" in f.read()
+    with pytest.raises(ValueError):
+        KeyStore(str(tmp_path), "wrong").public_key_pem("user-1")
+
+def test_signatures_verify_against_public_key(tmp_path):
+    store = KeyStore(str(tmp_path), "secret")
+    signature = store.sign_digest("user-1", DIGEST)
+
+    public_key = store.public_key_pem("user-1")
+    assert CryptoEngine.verify_digest(DIGEST, signature, public_key) is True
+    assert CryptoEngine.verify_digest("0" * 64, signature, public_key) is False
+
+def test_cache_is_bounded(tmp_path):
+    store = KeyStore(str(tmp_path), "secret", cache_size=2)
+    first = store.private_key("a")
+    store.private_key("b")
+    assert store.private_key("a") is first
+
+    store.private_key("c")  # evicts "b"
+    assert set(store._keys) == {"a", "c"}
+
+def test_concurrent_creation_agrees_on_one_key(tmp_path):
+    stores = [KeyStore(str(tmp_path), "secret") for _ in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        keys = set(pool.map(lambda store: store.public_key_pem("user-1"), stores))
+    assert len(keys) == 1
+    assert os.listdir(tmp_path) == ["user-1.pem"]
+
+def test_registered_key_is_never_replaced(tmp_path):
+    public_key = KeyStore(str(tmp_path / "host-a"), "secret").public_key_pem("user-1")
+
+    # A host that does not share the directory must not mint a second key
+    other = KeyStore(str(tmp_path / "host-b"), "secret")
+    with pytest.raises(SigningKeyMissing):
+        other.public_key_pem("user-1", public_key)
+    assert not os.path.exists(other.path("user-1"))
+    assert other.public_key_pem("user-2", None)
+
+def test_rejects_unsafe_user_ids(tmp_path):
+    with pytest.raises(ValueError):
+        KeyStore(str(tmp_path), "secret").path("../etc/passwd")
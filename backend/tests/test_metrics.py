@@ -0,0 +1,113 @@
+import pytest
+import sys
+import os
+import asyncio
+import logging
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import metrics
+from app.services.metrics import Registry, StageTimings, request_duration
+from app.services.tracing import TraceMiddleware, TraceIdFilter, trace_id, new_trace_id
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    counter = registry.counter("test_bytes_total", "Bytes.", ("kind",))
+    registry.gauge("test_pending", "Pending jobs.", lambda: 3)
+    counter.inc(10, kind="original")
+    counter.inc(5, kind="original")
+    counter.inc(1.5, kind='pro"tected')
+
+    text = registry.render()
+    assert "# TYPE test_bytes_total counter" in text
+    assert 'test_bytes_total{kind="original"} 15' in text
+    assert 'test_bytes_total{kind="pro\\"tected"} 1.5' in text
+    assert "# TYPE test_pending gauge\ntest_pending 3" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage="binary")
+
+    text = registry.render()
+    assert 'test_seconds_bucket{stage="binary",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{stage="binary",le="1"} 3' in text
+    assert 'test_seconds_bucket{stage="binary",le="+Inf"} 4' in text
+    assert 'test_seconds_count{stage="binary"} 4' in text
+    assert histogram.sum(stage="binary") == pytest.approx(2.65)
+
+    with histogram.time(stage="cloaking"):
+        pass
+    assert histogram.count(stage="cloaking") == 1
+
+def test_duplicate_names_are_rejected():
+    registry = Registry()
+    registry.counter("test_total", "Total.")
+    with pytest.raises(ValueError):
+        registry.gauge("test_total", "Again.")
+
+def test_failing_gauge_skips_its_sample():
+    registry = Registry()
+    registry.gauge("test_broken", "Broken.", lambda: 1 / 0)
+    assert "\ntest_broken " not in registry.render()
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    histogram = Registry().histogram("test_seconds", "Latency.")
+    histogram.observe(1.0)
+    with histogram.time():
+        pass
+    assert histogram.count() == 0
+
+    timings = StageTimings(enabled=False)
+    with timings.stage("binary"):
+        pass
+    assert timings.as_dict() == {}
+
+def test_stage_timings_accumulate():
+    timings = StageTimings(enabled=True)
+    for _ in range(3):
+        with timings.stage("binary"):
+            pass
+    timings.add("cloaking", 0.25)
+    timings.add("cloaking", 0.25)
+    result = timings.as_dict()
+    assert set(result) == {"binary", "cloaking"}
+    assert result["cloaking"] == 0.5
+
+def test_new_trace_id():
+    assert new_trace_id("abc-123") == "abc-123"
+    assert len(new_trace_id()) == 32
+    assert new_trace_id("bad id\\nwith newline") != "bad id\\nwith newline"
+
+def test_trace_middleware_sets_id_for_request_and_logs(caplog):
+    app = FastAPI()
+    app.add_middleware(TraceMiddleware)
+    logger = logging.getLogger("test_trace")
+    logger.addFilter(TraceIdFilter())
+
+    @app.get("/traced")
+    async def traced_endpoint():
+        logger.warning("inside request")
+        return {"trace_id": trace_id.get()}
+
+    async def send(headers=None):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/traced", headers=headers)
+
+    before = request_duration.count(method="GET", route="traced_endpoint", status="200")
+    with caplog.at_level(logging.WARNING, logger="test_trace"):
+        response = asyncio.run(send({"x-request-id": "client-id-1"}))
+    assert response.json() == {"trace_id": "client-id-1"}
+    assert response.headers["x-request-id"] == "client-id-1"
+    assert caplog.records[-1].trace_id == "client-id-1"
+
+    generated = asyncio.run(send())
+    assert generated.headers["x-request-id"] == generated.json()["trace_id"]
+    # The context is restored once the request is done
+    assert trace_id.get() == "-"
+    assert request_duration.count(method="GET", route="traced_endpoint", status="200") == before + 2
@@ -0,0 +1,136 @@
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+from passlib.context import CryptContext
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.passwords import PasswordHasher, PasswordQueueFull, password_context
+from app.services.metrics import password_queue_wait
+
+def _context(rounds):
+    # sha256_crypt follows the same rounds policy as bcrypt and is quick to run
+    return CryptContext(
+        schemes=["sha256_crypt"],
+        sha256_crypt__default_rounds=rounds,
+        sha256_crypt__min_rounds=rounds,
+        sha256_crypt__max_rounds=rounds
+    )
+
+class SlowContext:
+    """Stands in for bcrypt: blocks its thread for a while, GIL released."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return "hashed:" + password
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(_context(1000), max_workers=2)
+
+    async def run():
+        hashed = await hasher.hash("secret")
+        return hashed, await hasher.verify("secret", hashed), await hasher.verify("wrong", hashed)
+
+    hashed, valid, invalid = asyncio.run(run())
+    assert hashed.startswith("$5$")
+    assert valid == (True, None)
+    assert invalid == (False, None)
+    hasher.shutdown()
+
+def test_outdated_cost_is_rehashed_on_verify():
+    old = _context(1000).hash("secret")
+    hasher = PasswordHasher(_context(2000), max_workers=1)
+
+    valid, new_hash = asyncio.run(hasher.verify("secret", old))
+    assert valid is True
+    assert new_hash is not None and "rounds=2000" in new_hash
+    # A wrong password never produces a replacement
+    assert asyncio.run(hasher.verify("wrong", old)) == (False, None)
+    hasher.shutdown()
+
+def test_bcrypt_context_flags_other_costs():
+    context = password_context(rounds=10)
+    assert context.to_dict()["bcrypt__min_rounds"] == context.to_dict()["bcrypt__max_rounds"] == 10
+
+def test_concurrency_is_bounded_and_loop_stays_free():
+    slow = SlowContext(0.05)
+    hasher = PasswordHasher(slow, max_workers=2, max_queue=10)
+    waits_before = password_queue_wait.count(operation="hash")
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(hasher.hash(f"pw{i}") for i in range(6)))
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(run())
+    assert results == [f"hashed:pw{i}" for i in range(6)]
+    assert slow.peak == 2
+    # Three rounds of 50 ms ran while the event loop kept ticking
+    assert ticks >= 10
+    assert hasher.pending == 0
+    assert password_queue_wait.count(operation="hash") == waits_before + 6
+    hasher.shutdown()
+
+def test_full_queue_is_rejected():
+    hasher = PasswordHasher(SlowContext(0.1), max_workers=1, max_queue=1)
+
+    async def run():
+        first = asyncio.create_task(hasher.hash("a"))
+        second = asyncio.create_task(hasher.hash("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordQueueFull):
+            await hasher.hash("c")
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == ["hashed:a", "hashed:b"]
+    hasher.shutdown()
+
+def test_cancelled_callers_stay_counted_until_the_thread_finishes():
+    slow = SlowContext(0.1)
+    hasher = PasswordHasher(slow, max_workers=1, max_queue=1)
+
+    async def run():
+        running = asyncio.create_task(hasher.hash("a"))
+        queued = asyncio.create_task(hasher.hash("b"))
+        await asyncio.sleep(0.02)
+        # Clients disconnecting: the queued job is dropped, the running one is not
+        running.cancel()
+        queued.cancel()
+        await asyncio.gather(running, queued, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert hasher.pending == 1
+        # One slot left: the still running hash keeps taking the other
+        third = asyncio.create_task(hasher.hash("c"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordQueueFull):
+            await hasher.hash("d")
+        result = await third
+        assert hasher.pending == 0
+        return result
+
+    assert asyncio.run(run()) == "hashed:c"
+    hasher.shutdown()
@@ -0,0 +1,62 @@
+import pytest
+import sys
+import os
+import io
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.perceptual_hash import PerceptualHasher, hash_array, hash_image, to_hex, from_hex
+from app.services.hamming_index import popcount
+
+def _photo(seed=0, height=240, width=320):
+    # Smooth gradients plus a little texture, like a photo rather than noise
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+    image = np.zeros((height, width, 3))
+    for c in range(3):
+        fx, fy, phase = rng.uniform(0.005, 0.04, 2).tolist() + [rng.uniform(0, 6)]
+        image[..., c] = 127 + 100 * np.sin(x * fx + phase) * np.cos(y * fy)
+    image += rng.normal(0, 4, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def _distance(a, b):
+    return int(popcount(np.array([a ^ b], dtype=np.uint64))[0])
+
+def _reencode(data, size=None, quality=70):
+    img = Image.fromarray(data)
+    if size:
+        img = img.resize(size)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+def test_hash_survives_reencoding_and_resizing():
+    data = _photo()
+    code = hash_array(data)
+
+    assert _distance(code, hash_image(_reencode(data))) <= 4
+    assert _distance(code, hash_image(_reencode(data, size=(160, 120)))) <= 6
+
+def test_different_images_are_far_apart():
+    assert _distance(hash_array(_photo(0)), hash_array(_photo(1))) > 16
+
+@pytest.mark.parametrize("strip_rows", [1, 7, 64])
+def test_strips_match_whole_frame(strip_rows):
+    data = _photo()
+    hasher = PerceptualHasher(data.shape[1], data.shape[0])
+    for y0 in range(0, data.shape[0], strip_rows):
+        hasher.add(data[y0:y0 + strip_rows], y0)
+    assert hasher.digest() == hash_array(data)
+
+def test_tiny_images_have_no_hash():
+    assert hash_array(np.zeros((16, 100, 3), dtype=np.uint8)) is None
+    assert to_hex(None) is None
+
+def test_hex_round_trip():
+    code = hash_array(_photo())
+    assert len(to_hex(code)) == 16
+    assert from_hex(to_hex(code)) == code
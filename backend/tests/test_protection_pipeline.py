@@ -0,0 +1,149 @@
+import pytest
+import sys
+import os
+from PIL import Image
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.binary_engine import BinaryEngine
+from app.services.cloaking_engine import CloakingEngine
+from app.services.crypto_engine import CryptoEngine
+from app.services.protection_pipeline import ProtectionPipeline, ImageTooLarge, protect_file
+from app.services.quality_metrics import compute_metrics
+
+def _make_image(path):
+    data = np.random.RandomState(0).randint(0, 256, (64, 80, 3), dtype=np.uint8)
+    Image.fromarray(data).save(path)
+    return data
+
+def test_pipeline_writes_single_output(tmp_path):
+    source = str(tmp_path / "source.png")
+    destination = str(tmp_path / "out.png")
+    _make_image(source)
+
+    ProtectionPipeline(level='high').run(source, destination)
+
+    # Only the source and the final output exist: no intermediate encodes
+    assert sorted(os.listdir(tmp_path)) == ["out.png", "source.png"]
+    with Image.open(destination) as img:
+        assert img.size == (80, 64)
+
+def test_pipeline_matches_chained_engines(tmp_path):
+    source = str(tmp_path / "source.png")
+    destination = str(tmp_path / "out.png")
+    original = _make_image(source)
+
+    ProtectionPipeline(level='mid', seed=42).run(source, destination)
+
+    expected = original.copy()
+    BinaryEngine.zero_out_array(expected, seed=42)
+    CloakingEngine.apply_cloaking_array(expected, 'mid')
+
+    assert np.array_equal(np.array(Image.open(destination)), expected)
+
+def test_protect_file_reports_hashes_and_scores(tmp_path):
+    source = str(tmp_path / "source.png")
+    destination = str(tmp_path / "out.png")
+    _make_image(source)
+    private_key, public_key = CryptoEngine.generate_key_pair()
+
+    result = protect_file(source, destination, private_key, 'high')
+
+    assert result["original_hash"] == CryptoEngine.create_hash(source)
+    assert result["protected_hash"] == CryptoEngine.create_hash(destination)
+    assert CryptoEngine.verify_signature(source, result["signature"], public_key)
+    assert 0 <= result["manipulation_score"] <= 100
+    assert 0 <= result["protection_score"] <= 100
+    assert result["quality"]["proxy_step"] == 1
+    assert result["pixels"] == 80 * 64
+    assert set(result["timings"]) == {"hash", "sign", "decode", "binary", "cloaking", "scoring", "fingerprint", "encode"}
+    assert all(seconds >= 0 for seconds in result["timings"].values())
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 16, 63])
+def test_tiled_output_is_bit_identical(tmp_path, tile_rows):
+    source = str(tmp_path / "source.png")
+    _make_image(source)
+
+    ProtectionPipeline(level='high', seed=7).run(source, str(tmp_path / "whole.png"))
+    ProtectionPipeline(level='high', seed=7, tile_rows=tile_rows).run(source, str(tmp_path / "tiled.png"))
+
+    whole = np.array(Image.open(str(tmp_path / "whole.png")))
+    tiled = np.array(Image.open(str(tmp_path / "tiled.png")))
+    assert np.array_equal(whole, tiled)
+
+def test_memory_limit_plans_strips_and_spills():
+    width, height = 6000, 4000
+    assert ProtectionPipeline(memory_limit=None).plan(width, height) == (None, False)
+    assert ProtectionPipeline(memory_limit=1024 ** 3).plan(width, height) == (None, False)
+
+    # Decode + RGB frame fit, so strips only bound the temporaries
+    strip_rows, spill = ProtectionPipeline(memory_limit=300 * 1024 ** 2).plan(width, height)
+    assert strip_rows is not None and spill is False
+
+    strip_rows, spill = ProtectionPipeline(memory_limit=120 * 1024 ** 2).plan(width, height)
+    assert strip_rows is not None and strip_rows % 8 == 0
+    assert spill is True
+
+    with pytest.raises(ImageTooLarge):
+        ProtectionPipeline(memory_limit=50 * 1024 ** 2).plan(width, height)
+
+def test_memory_mapped_strips_match(tmp_path):
+    source = str(tmp_path / "source.png")
+    original = _make_image(source)
+
+    frame, _ = ProtectionPipeline.load_strips(source, 10, spill=True)
+    assert isinstance(frame, np.memmap)
+    assert np.array_equal(frame, original)
+
+def test_pipeline_metrics_match_decoded_images(tmp_path):
+    source = str(tmp_path / "source.png")
+    destination = str(tmp_path / "out.png")
+    original = _make_image(source)
+
+    pipeline = ProtectionPipeline(level='high', tile_rows=7)
+    pipeline.run(source, destination)
+
+    expected = compute_metrics(original, np.array(Image.open(destination)))
+    assert pipeline.metrics.mse == pytest.approx(expected.mse)
+    assert pipeline.metrics.mean_abs_diff == pytest.approx(expected.mean_abs_diff)
+    assert pipeline.metrics.ssim == pytest.approx(expected.ssim)
+
+def test_protect_file_leaves_signing_to_caller(tmp_path):
+    source = str(tmp_path / "source.png")
+    _make_image(source)
+
+    result = protect_file(source, str(tmp_path / "out.png"), None, 'high')
+    assert result["signature"] is None
+    assert result["original_hash"] == CryptoEngine.create_hash(source)
+
+@pytest.mark.parametrize("fast_metrics", [False, True])
+def test_output_is_independent_of_thread_count(tmp_path, fast_metrics):
+    source = str(tmp_path / "source.png")
+    # Several bands of rows, with a partial last one
+    data = np.random.RandomState(3).randint(0, 256, (700, 90, 3), dtype=np.uint8)
+    Image.fromarray(data).save(source)
+
+    results = []
+    for threads in (1, 3):
+        destination = str(tmp_path / f"out{threads}.png")
+        pipeline = ProtectionPipeline(level='high', seed=7, threads=threads, fast_metrics=fast_metrics)
+        pipeline.run(source, destination)
+        results.append((np.array(Image.open(destination)), pipeline.metrics, pipeline.perceptual_hash))
+
+    assert np.array_equal(results[0][0], results[1][0])
+    assert results[0][1] == results[1][1]
+    assert results[0][2] == results[1][2]
+
+def test_protect_file_records_seed(tmp_path):
+    source = str(tmp_path / "source.png")
+    original = _make_image(source)
+
+    result = protect_file(source, str(tmp_path / "out.png"), None, 'high')
+
+    # The recorded seed reproduces the output exactly
+    expected = original.copy()
+    BinaryEngine.zero_out_array(expected, seed=result["seed"])
+    CloakingEngine.apply_cloaking_array(expected, 'high')
+    assert np.array_equal(np.array(Image.open(str(tmp_path / "out.png"))), expected)
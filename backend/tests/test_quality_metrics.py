@@ -0,0 +1,73 @@
+import pytest
+import sys
+import os
+import math
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.quality_metrics import MetricsAccumulator, compute_metrics, proxy_step
+
+def _pair(height=64, width=80):
+    rng = np.random.RandomState(0)
+    original = rng.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    noise = rng.randint(-6, 7, original.shape)
+    protected = np.clip(original.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return original, protected
+
+def test_difference_does_not_wrap_around():
+    black = np.zeros((8, 8, 3), dtype=np.uint8)
+    white = np.full((8, 8, 3), 255, dtype=np.uint8)
+
+    metrics = compute_metrics(black, white)
+    assert metrics.mse == 255 ** 2
+    assert metrics.mean_abs_diff == 255
+    assert metrics.manipulation_score == 100
+    assert metrics.protection_score == 100
+
+def test_identical_images():
+    original, _ = _pair()
+    metrics = compute_metrics(original, original)
+    assert metrics.mse == 0
+    assert math.isinf(metrics.psnr)
+    assert metrics.ssim == pytest.approx(1.0)
+    assert metrics.as_dict()["psnr"] is None
+
+def test_matches_reference_formulas():
+    original, protected = _pair()
+    diff = original.astype(np.float64) - protected.astype(np.float64)
+
+    metrics = compute_metrics(original, protected)
+    assert metrics.mse == pytest.approx(np.mean(diff ** 2))
+    assert metrics.mean_abs_diff == pytest.approx(np.mean(np.abs(diff)))
+    assert metrics.psnr == pytest.approx(10 * math.log10(255 ** 2 / np.mean(diff ** 2)))
+    assert 0 < metrics.ssim < 1
+
+@pytest.mark.parametrize("strip_rows", [1, 5, 8, 13])
+def test_strips_match_whole_frame(strip_rows):
+    original, protected = _pair()
+    whole = compute_metrics(original, protected)
+
+    accumulator = MetricsAccumulator()
+    for y0 in range(0, original.shape[0], strip_rows):
+        accumulator.add(accumulator.sample(original[y0:y0 + strip_rows], y0), accumulator.sample(protected[y0:y0 + strip_rows], y0))
+    strips = accumulator.result()
+
+    assert strips.mse == pytest.approx(whole.mse)
+    assert strips.mean_abs_diff == pytest.approx(whole.mean_abs_diff)
+    assert strips.ssim == pytest.approx(whole.ssim)
+
+def test_fast_proxy_is_downsampled():
+    assert proxy_step(800, 600) == 1
+    assert proxy_step(6000, 4000) == 5
+
+    original, protected = _pair(2000, 1500)
+    exact = compute_metrics(original, protected)
+    fast = compute_metrics(original, protected, fast=True)
+    assert fast.proxy_step == 2
+    assert fast.mse == pytest.approx(exact.mse, rel=0.05)
+
+def test_shape_mismatch():
+    with pytest.raises(ValueError):
+        compute_metrics(np.zeros((4, 4, 3), dtype=np.uint8), np.zeros((4, 5, 3), dtype=np.uint8))
@@ -0,0 +1,82 @@
+import pytest
+import sys
+import os
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.user_cache import UserCache
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Loader:
+    """Counts loads; ``users`` maps subjects to records."""
+
+    def __init__(self, users):
+        self.users = users
+        self.calls = []
+
+    async def __call__(self, key):
+        self.calls.append(key)
+        return self.users.get(key)
+
+def test_hits_skip_the_loader_until_ttl_expires():
+    clock = Clock()
+    cache = UserCache(ttl=60, clock=clock)
+    load = Loader({"a@x": {"id": "a"}})
+
+    assert asyncio.run(cache.get("a@x", load)) == {"id": "a"}
+    assert asyncio.run(cache.get("a@x", load)) == {"id": "a"}
+    assert load.calls == ["a@x"]
+
+    clock.now = 61
+    asyncio.run(cache.get("a@x", load))
+    assert load.calls == ["a@x", "a@x"]
+
+def test_unknown_users_are_not_cached():
+    cache = UserCache()
+    load = Loader({})
+    assert asyncio.run(cache.get("new@x", load)) is None
+    load.users["new@x"] = {"id": "new"}
+    assert asyncio.run(cache.get("new@x", load)) == {"id": "new"}
+
+def test_least_recently_used_is_evicted():
+    cache = UserCache(max_entries=2)
+    load = Loader({key: {"id": key} for key in "abc"})
+    for key in ("a", "b", "a", "c"):
+        asyncio.run(cache.get(key, load))
+    assert len(cache) == 2
+    asyncio.run(cache.get("a", load))
+    asyncio.run(cache.get("b", load))
+    assert load.calls == ["a", "b", "c", "b"]
+
+def test_invalidate_reloads_and_discards_racing_loads():
+    cache = UserCache()
+    load = Loader({"a@x": {"key": "old"}})
+    asyncio.run(cache.get("a@x", load))
+
+    load.users["a@x"] = {"key": "new"}
+    cache.invalidate("a@x")
+    assert asyncio.run(cache.get("a@x", load)) == {"key": "new"}
+
+    async def racing(key):
+        # The record changes while it is being read
+        cache.invalidate(key)
+        return {"key": "stale"}
+    cache.invalidate("a@x")
+    assert asyncio.run(cache.get("a@x", racing)) == {"key": "stale"}
+    assert asyncio.run(cache.get("a@x", load)) == {"key": "new"}
+
+def test_zero_ttl_disables_caching():
+    cache = UserCache(ttl=0)
+    load = Loader({"a@x": {"id": "a"}})
+    asyncio.run(cache.get("a@x", load))
+    asyncio.run(cache.get("a@x", load))
+    assert load.calls == ["a@x", "a@x"]
+    assert len(cache) == 0
@@ -0,0 +1,114 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+import hashlib
+from types import SimpleNamespace
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+from app.api import users
+from app.api.users import encode_cursor, decode_cursor, parse_fields, fetch_content_page, _export_contents
+from app.api.auth import get_optional_user
+from app.db import get_db
+from app.services.blob_store import BlobStore
+
+class FakeContentDB:
+    """Answers fetch_content_page's keyset queries from an in-memory list."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def query_raw(self, query, user_id, *args):
+        self.queries.append(query)
+        rows = sorted((row for row in self.rows if row["userId"] == user_id), key=lambda row: (row["createdAt"], row["id"]), reverse=True)
+        if len(args) == 3:
+            created_at, content_id, limit = args
+            rows = [row for row in rows if (row["createdAt"], row["id"]) < (created_at, content_id)]
+        else:
+            (limit,) = args
+        columns = [part.strip().strip('"') for part in query.split("SELECT ")[1].split(" FROM")[0].split(",")]
+        return [{column: row[column] for column in columns} for row in rows[:limit]]
+
+def _rows(count):
+    # Pairs of rows share a timestamp so ties are broken by id
+    return [
+        {"id": f"c{i:03d}", "userId": "u1", "createdAt": f"2024-01-01T00:00:{i // 2:02d}+00:00", "aiAnalysis": {"big": i}, "signatureData": "sig"}
+        for i in range(count)
+    ]
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2024-01-01T00:00:00+00:00", "abc")) == ("2024-01-01T00:00:00+00:00", "abc")
+    with pytest.raises(HTTPException):
+        decode_cursor("not-a-cursor")
+
+def test_fields_leave_out_large_columns_by_default():
+    assert "aiAnalysis" not in parse_fields(None)
+    assert "signatureData" not in parse_fields(None)
+    assert parse_fields("aiAnalysis") == ["aiAnalysis", "createdAt", "id"]
+    with pytest.raises(HTTPException):
+        parse_fields("password")
+
+def test_keyset_pages_cover_every_row_once():
+    db = FakeContentDB(_rows(25))
+    seen, after = [], None
+    while True:
+        page = asyncio.run(fetch_content_page(db, "u1", ["id", "createdAt"], 7, after))
+        seen += [row["id"] for row in page]
+        if len(page) < 7:
+            break
+        after = (page[-1]["createdAt"], page[-1]["id"])
+    assert seen == [f"c{i:03d}" for i in reversed(range(25))]
+    assert all("aiAnalysis" not in query for query in db.queries)
+
+def test_export_streams_ndjson():
+    async def collect():
+        return [line async for line in _export_contents(FakeContentDB(_rows(5)), "u1", ["id", "createdAt"], None)]
+    lines = asyncio.run(collect())
+    assert [json.loads(line)["id"] for line in lines] == ["c004", "c003", "c002", "c001", "c000"]
+
+class FakeContentTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def find_unique(self, where):
+        return self.rows.get(where["id"])
+
+def test_originals_are_private_to_their_owner(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "uploads"), str(tmp_path / "uploads.sqlite3"))
+    monkeypatch.setattr(users, "upload_store", store)
+    temp = store.temp_path(".png")
+    with open(temp, "wb") as f:
+        f.write(b"original")
+    digest = hashlib.sha256(b"original").hexdigest()
+    store.adopt(temp, digest, ".png")
+
+    db = SimpleNamespace(content=FakeContentTable({"c1": SimpleNamespace(userId="u1", originalHash=digest)}))
+    app = FastAPI()
+    app.include_router(users.router, prefix="/user")
+    app.dependency_overrides[get_db] = lambda: db
+
+    async def fetch(user_id, content_id, url=None):
+        app.dependency_overrides[get_optional_user] = lambda: SimpleNamespace(id=user_id) if user_id else None
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(url or f"/user/originals/{content_id}")
+
+    response = asyncio.run(fetch("u1", "c1"))
+    assert response.status_code == 200
+    assert response.content == b"original"
+    assert response.headers["cache-control"] == "private, no-store"
+    assert asyncio.run(fetch("u2", "c1")).status_code == 404
+    assert asyncio.run(fetch("u1", "missing")).status_code == 404
+    assert asyncio.run(fetch(None, "c1")).status_code == 401
+
+    # Signed links work without a token until they expire
+    assert asyncio.run(fetch(None, "c1", users.original_url("c1"))).content == b"original"
+    assert asyncio.run(fetch(None, "c1", users.original_url("c1", now=0))).status_code == 403
+    forged = users.original_url("c1").replace("/c1?", "/c2?")
+    assert asyncio.run(fetch(None, "c2", forged)).status_code == 403
@@ -0,0 +1,103 @@
+import pytest
+import sys
+import os
+import asyncio
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.variants import VariantCache, generate_variant, variant_format, variant_name
+
+def _image(path, size=(400, 300), fmt=None):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(data).save(path, format=fmt)
+    return path
+
+def test_variant_fits_box_and_keeps_aspect(tmp_path):
+    source = _image(str(tmp_path / "source.png"))
+    dest = generate_variant(source, str(tmp_path / "out.png"), 100, 100, "PNG")
+    with Image.open(dest) as img:
+        assert img.size == (100, 75)
+
+    generate_variant(source, str(tmp_path / "wide.png"), 200, None, "PNG")
+    with Image.open(str(tmp_path / "wide.png")) as img:
+        assert img.size == (200, 150)
+
+def test_variant_never_upscales(tmp_path):
+    source = _image(str(tmp_path / "source.png"))
+    dest = generate_variant(source, str(tmp_path / "out.png"), 1000, 1000, "PNG")
+    with Image.open(dest) as img:
+        assert img.size == (400, 300)
+
+def test_large_jpeg_is_drafted_and_transcoded(tmp_path):
+    source = _image(str(tmp_path / "source.jpg"), (1600, 1200), "JPEG")
+    dest = generate_variant(source, str(tmp_path / "out.webp"), 150, 150, "WEBP")
+    with Image.open(dest) as img:
+        assert img.format == "WEBP"
+        assert img.width == 150
+        assert img.height in (112, 113)
+
+def test_variant_format_and_name():
+    assert variant_format(None, "ab/cd/abcd.png") == "PNG"
+    assert variant_format("JPG", "ab/cd/abcd.png") == "JPEG"
+    assert variant_name("abcd", 64, None, "WEBP") == "abcd_64x0.webp"
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = VariantCache(str(tmp_path / "variants"), max_bytes=250)
+
+    def writer(size):
+        async def produce(path):
+            with open(path, "wb") as f:
+                f.write(b"x" * size)
+        return produce
+
+    async def run():
+        await cache.get("a.png", writer(100))
+        await cache.get("b.png", writer(100))
+        assert cache.lookup("a.png") is not None
+        await cache.get("c.png", writer(100))
+
+    asyncio.run(run())
+    # "a" was used after "b", so "b" is the one evicted
+    assert cache.lookup("b.png") is None
+    assert cache.lookup("a.png") is not None
+    assert cache.lookup("c.png") is not None
+    assert cache.total_bytes == 200
+    assert sorted(os.listdir(cache.directory)) == ["a.png", "c.png"]
+
+    # Entries and their sizes survive a restart
+    reloaded = VariantCache(cache.directory, max_bytes=250)
+    assert reloaded.total_bytes == 200
+
+def test_concurrent_requests_generate_once(tmp_path):
+    cache = VariantCache(str(tmp_path / "variants"), max_bytes=1 << 20)
+    calls = []
+
+    async def produce(path):
+        calls.append(path)
+        await asyncio.sleep(0.05)
+        with open(path, "wb") as f:
+            f.write(b"variant")
+
+    async def run():
+        return await asyncio.gather(*(cache.get("v.png", produce) for _ in range(8)))
+
+    paths = asyncio.run(run())
+    assert len(calls) == 1
+    assert len(set(paths)) == 1
+    with open(paths[0], "rb") as f:
+        assert f.read() == b"variant"
+
+def test_failed_generation_is_not_cached(tmp_path):
+    cache = VariantCache(str(tmp_path / "variants"), max_bytes=1 << 20)
+
+    async def fail(path):
+        raise OSError("cannot decode")
+
+    with pytest.raises(OSError):
+        asyncio.run(cache.get("v.png", fail))
+    assert cache.lookup("v.png") is None
+    assert os.listdir(cache.directory) == []
@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+import time
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.verify_cache import TTLCache, VerificationBuffer
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.invalidate("a", "missing")
+    assert cache.get("a") is None
+
+def test_cache_entries_expire():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_buffer_flushes_in_batches():
+    written = []
+
+    async def writer(rows):
+        written.append(rows)
+
+    async def scenario():
+        buffer = VerificationBuffer(flush_interval=60, flush_batch=3)
+        buffer.start(writer)
+        for i in range(3):
+            buffer.record("content", f"hash{i}")
+        # Reaching flush_batch wakes the flusher before the interval elapses
+        for _ in range(100):
+            if written:
+                break
+            await asyncio.sleep(0.01)
+        buffer.record("content", "late")
+        await buffer.stop()
+
+    asyncio.run(scenario())
+    assert [len(batch) for batch in written] == [3, 1]
+    assert written[0][0]["contentHash"] == "hash0"
+    assert "verifiedAt" in written[0][0]
+
+def test_buffer_keeps_rows_when_write_fails():
+    async def failing_writer(rows):
+        raise RuntimeError("db down")
+
+    async def scenario():
+        buffer = VerificationBuffer(flush_interval=60, flush_batch=100, max_pending=2)
+        buffer._writer = failing_writer
+        for i in range(3):
+            buffer.record("content", f"hash{i}")
+        assert await buffer.flush() == 0
+        return buffer
+
+    buffer = asyncio.run(scenario())
+    assert buffer.pending == 2
+    assert buffer.dropped == 1
@@ -0,0 +1,54 @@
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import verify_signatures
+from app.verify_signatures import Report, audit_directory
+from app.services.crypto_engine import CryptoEngine
+
+class FakeContentTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def find_many(self, where, include):
+        digests = where["protectedHash"]["in"]
+        return [row for row in self.rows if row.protectedHash in digests]
+
+def test_duplicates_are_reported_not_collapsed(tmp_path, monkeypatch):
+    private_key, public_key = CryptoEngine.generate_key_pair()
+    user = SimpleNamespace(publicKey=public_key)
+    for name, data in (("a.png", b"shared"), ("b.png", b"shared"), ("c.png", b"alone"), ("d.png", b"stray")):
+        (tmp_path / name).write_bytes(data)
+    shared = CryptoEngine.create_hash(str(tmp_path / "a.png"))
+    alone = CryptoEngine.create_hash(str(tmp_path / "c.png"))
+
+    def row(content_id, protected_hash, original_hash, signature=None):
+        return SimpleNamespace(
+            id=content_id, protectedHash=protected_hash, originalHash=original_hash, user=user,
+            signatureData=signature or CryptoEngine.sign_digest(original_hash, private_key)
+        )
+
+    rows = [
+        row("1", shared, "0" * 64),
+        # Same protected file registered twice, the second with a bad signature
+        row("2", shared, "1" * 64, CryptoEngine.sign_digest("2" * 64, private_key)),
+        row("3", alone, "3" * 64)
+    ]
+    monkeypatch.setattr(verify_signatures.db, "prisma", SimpleNamespace(content=FakeContentTable(rows)))
+    # One file per page, so duplicates are also found across pages
+    monkeypatch.setattr(verify_signatures, "PAGE_SIZE", 1)
+
+    report = Report()
+    asyncio.run(audit_directory(str(tmp_path), report, workers=1))
+    assert report.counts["checked"] == 3
+    assert report.counts["valid"] == 2
+    assert report.counts["invalid"] == 1
+    assert report.counts["duplicate_files"] == 1
+    assert report.counts["duplicate_rows"] == 1
+    assert report.counts["unregistered"] == 1
+    assert report.bytes_hashed == len(b"shared") * 2 + len(b"alone") + len(b"stray")
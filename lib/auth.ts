@@ -2,7 +2,30 @@ import { NextAuthOptions } from "next-auth";
 import CredentialsProvider from "next-auth/providers/credentials";
 import { PrismaAdapter } from "@next-auth/prisma-adapter";
 import { prisma } from "@/lib/db";
-import bcrypt from "bcryptjs";
+
+// The FastAPI backend; it accepts only its own bearer tokens
+const API_URL = process.env.API_URL ?? "http://localhost:8000";
+
+// Checks the password with the backend and returns its access token, or
+// null if the credentials are wrong
+async function backendLogin(email: string, password: string) {
+    const response = await fetch(`${API_URL}/auth/login`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ email, password }),
+    });
+    if (response.status === 401) {
+        return null;
+    }
+    if (!response.ok) {
+        throw new Error("Sign-in is unavailable, please try again");
+    }
+    const data = await response.json();
+    return {
+        accessToken: data.access_token as string,
+        accessTokenExpires: Date.now() + (data.expires_in as number) * 1000,
+    };
+}
 
 export const authOptions: NextAuthOptions = {
     adapter: PrismaAdapter(prisma),
@@ -28,12 +51,10 @@ export const authOptions: NextAuthOptions = {
                     throw new Error("Invalid credentials");
                 }
 
-                const isCorrectPassword = await bcrypt.compare(
-                    credentials.password,
-                    user.password
-                );
-
-                if (!isCorrectPassword) {
+                // The backend verifies the password (and upgrades its hash)
+                // and issues the token the upload page sends to it
+                const backend = await backendLogin(credentials.email, credentials.password);
+                if (!backend) {
                     throw new Error("Invalid credentials");
                 }
 
@@ -42,6 +63,8 @@ export const authOptions: NextAuthOptions = {
                     email: user.email,
                     name: user.name,
                     image: user.image,
+                    accessToken: backend.accessToken,
+                    accessTokenExpires: backend.accessTokenExpires,
                 };
             },
         }),
@@ -53,6 +76,8 @@ export const authOptions: NextAuthOptions = {
         async jwt({ token, user }) {
             if (user) {
                 token.id = user.id;
+                token.accessToken = user.accessToken;
+                token.accessTokenExpires = user.accessTokenExpires;
             }
             return token;
         },
@@ -60,6 +85,11 @@ export const authOptions: NextAuthOptions = {
             if (session.user) {
                 session.user.id = token.id as string;
             }
+            session.accessToken = token.accessToken;
+            // There is no refresh token; signing in again gets a new one
+            if (!token.accessToken || Date.now() >= token.accessTokenExpires) {
+                session.error = "AccessTokenExpired";
+            }
             return session;
         },
     },
@@ -9,6 +9,9 @@ declare module "next-auth" {
             name?: string | null;
             image?: string | null;
         };
+        // Bearer token for the backend API
+        accessToken?: string;
+        error?: "AccessTokenExpired";
     }
 
     interface User {
@@ -16,11 +19,16 @@ declare module "next-auth" {
         email: string;
         name?: string | null;
         image?: string | null;
+        accessToken: string;
+        accessTokenExpires: number;
     }
 }
 
 declare module "next-auth/jwt" {
     interface JWT {
         id: string;
+        accessToken: string;
+        // Milliseconds since the epoch
+        accessTokenExpires: number;
     }
 }